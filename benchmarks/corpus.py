@@ -0,0 +1,105 @@
+""" Deterministic generator of synthetic FHIR Questionnaires for the benchmarks """
+
+import random
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List
+
+from pydantic_fhir_extensions.extensions.item_control import SDC_ITEM_CONTROL_SYSTEM, TIRO_ITEM_CONTROL_SYSTEM
+from pydantic_fhir_extensions.extensions.toggle_exclusive import ANSWER_OPTION_TOGGLE_EXPRESSION
+
+ITEM_CONTROLS = ["text", "radio", "checkbox", "dropdown", "text-area"]
+OPTION_SYSTEM = "urn:CodeSystem:benchmark-options"
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    """ Shape of a synthetic questionnaire """
+    items: int = 200
+    depth: int = 3
+    extensions_per_item: int = 10
+    known_ratio: float = 0.5
+    options_per_item: int = 4
+    seed: int = 0
+
+    def describe(self) -> str:
+        return ",".join(f"{key}={value}" for key, value in asdict(self).items())
+
+
+def item_control_extension(code: str) -> Dict[str, Any]:
+    display = code.replace("-", " ").title()
+    return {
+        "url": SDC_ITEM_CONTROL_SYSTEM,
+        "valueCodeableConcept": {
+            "text": display,
+            "coding": [{"system": TIRO_ITEM_CONTROL_SYSTEM, "code": code, "display": display}],
+        },
+    }
+
+
+def option_coding(index: int) -> Dict[str, Any]:
+    return {"system": OPTION_SYSTEM, "code": f"option-{index}", "display": f"Option {index}"}
+
+
+def toggle_extension(index: int) -> Dict[str, Any]:
+    return {
+        "url": ANSWER_OPTION_TOGGLE_EXPRESSION,
+        "extension": [
+            {"url": "option", "valueCoding": option_coding(index)},
+            {"url": "expression", "valueExpression": {"language": "text/fhirpath", "expression": f"count(../answer) > {index}"}},
+        ],
+    }
+
+
+def unknown_extension(rng: random.Random, index: int) -> Dict[str, Any]:
+    url = f"http://vendor.example.org/fhir/StructureDefinition/ext-{index}"
+    match rng.randrange(4):
+        case 0:
+            return {"url": url, "valueString": f"value {rng.randrange(1000)}"}
+        case 1:
+            return {"url": url, "valueCoding": {"system": "urn:vendor", "code": f"c{rng.randrange(50)}"}}
+        case 2:
+            return {"url": url, "valueDecimal": rng.randrange(100000) / 100}
+        case _:
+            return {"url": url, "extension": [{"url": "part", "valueInteger": rng.randrange(10)}, {"url": "flag", "valueBoolean": True}]}
+
+
+def make_item(rng: random.Random, spec: CorpusSpec, link_id: str) -> Dict[str, Any]:
+    """ A coding question with an item control, toggles for its options and unknown vendor extensions """
+    known = max(1, round(spec.extensions_per_item * spec.known_ratio))
+    toggles = min(known - 1, spec.options_per_item)
+    extension = [item_control_extension(rng.choice(ITEM_CONTROLS))]
+    extension += [toggle_extension(index) for index in range(toggles)]
+    extension += [unknown_extension(rng, index) for index in range(spec.extensions_per_item - len(extension))]
+    rng.shuffle(extension)
+    return {
+        "linkId": link_id,
+        "text": f"Question {link_id}",
+        "type": "coding",
+        "extension": extension,
+        "answerOption": [{"valueCoding": option_coding(index)} for index in range(spec.options_per_item)],
+    }
+
+
+def make_questionnaire(spec: CorpusSpec) -> Dict[str, Any]:
+    """ Spread `spec.items` items round-robin over `spec.depth` levels, each under a random item of the level above """
+    rng = random.Random(spec.seed)
+    levels: List[List[Dict[str, Any]]] = [[] for _ in range(spec.depth)]
+    for index in range(spec.items):
+        level = index % spec.depth
+        item = make_item(rng, spec, f"item-{index}")
+        if level:
+            parents = levels[level - 1]
+            parents[rng.randrange(len(parents))].setdefault("item", []).append(item)
+        levels[level].append(item)
+    return {"resourceType": "Questionnaire", "status": "active", "item": levels[0]}
+
+
+def iter_items(questionnaire: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """ All items of a generated questionnaire, flattened """
+    items: List[Dict[str, Any]] = []
+    stack = list(reversed(questionnaire["item"]))
+    while stack:
+        item = stack.pop()
+        items.append({key: value for key, value in item.items() if key != "item"})
+        stack.extend(reversed(item.get("item", [])))
+    return items
@@ -0,0 +1,177 @@
+
+""" Benchmark validation and FHIR serialization on a synthetic corpus
+
+    python -m benchmarks.run                          # run and print
+    python -m benchmarks.run --save baseline.json     # store the results as a baseline
+    python -m benchmarks.run --compare baseline.json  # fail when an operation got slower than the threshold
+"""
+
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Type
+
+import pydantic
+
+from benchmarks.corpus import CorpusSpec, iter_items, make_questionnaire
+from pydantic_fhir_extensions.cache import ValidationCache
+from pydantic_fhir_extensions.element import BaseElement
+from pydantic_fhir_extensions.extensions import ExtAnswerOptionsToggleExpression, ExtItemControl
+from pydantic_fhir_extensions.extensions.item_control import SDC_ITEM_CONTROL_SYSTEM
+from pydantic_fhir_extensions.extensions.toggle_exclusive import ANSWER_OPTION_TOGGLE_EXPRESSION
+from pydantic_fhir_extensions.questionnaire import Questionnaire, QuestionnaireItem
+
+SPECS = {
+    "small": CorpusSpec(items=200, depth=3, extensions_per_item=10, known_ratio=0.5),
+    "large": CorpusSpec(items=2000, depth=8, extensions_per_item=30, known_ratio=0.2),
+}
+
+
+@dataclass
+class Result:
+    corpus: str
+    model: str
+    operation: str
+    objects: int
+    seconds: float
+    peak_bytes: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.corpus}/{self.model}/{self.operation}"
+
+    @property
+    def throughput(self) -> float:
+        return self.objects / self.seconds if self.seconds else float("inf")
+
+
+def build_cases(spec: CorpusSpec) -> Dict[Type[BaseElement], List[Dict[str, Any]]]:
+    questionnaire = make_questionnaire(spec)
+    items = iter_items(questionnaire)
+    extensions = [extension for item in items for extension in item["extension"]]
+    return {
+        Questionnaire: [questionnaire],
+        QuestionnaireItem: items,
+        ExtItemControl: [extension for extension in extensions if extension["url"] == SDC_ITEM_CONTROL_SYSTEM],
+        ExtAnswerOptionsToggleExpression: [extension for extension in extensions if extension["url"] == ANSWER_OPTION_TOGGLE_EXPRESSION],
+    }
+
+
+def build_operations(model: Type[BaseElement], data: List[Dict[str, Any]]) -> Dict[str, Callable[[], Any]]:
+    raw = [json.dumps(document) for document in data]
+    validated = [model.model_validate(document) for document in data]
+    cache = ValidationCache(max_entries=len(data))
+    return {
+        "model_validate": lambda: [model.model_validate(document) for document in data],
+        "model_validate_json": lambda: [model.model_validate_json(document) for document in raw],
+        "model_validate_passthrough": lambda: [model.model_validate(document, context={"passthrough": True}) for document in data],
+        # after the first repeat this measures cache hits
+        "model_validate_cached": lambda: [cache.validate(model, document) for document in data],
+        "model_construct_trusted": lambda: [model.model_construct_trusted(document) for document in data],
+        "model_dump_fhir": lambda: [element.model_dump_fhir() for element in validated],
+        "model_dump_fhir_json": lambda: [element.model_dump_fhir_json() for element in validated],
+        # after the first repeat this measures a re-dump of unchanged elements
+        "model_dump_fhir_incremental": lambda: [element.model_dump_fhir_json(incremental=True) for element in validated],
+        "round_trip": lambda: [model.model_validate_json(document).model_dump_fhir_json() for document in raw],
+    }
+
+
+def measure(operation: Callable[[], Any], repeat: int) -> tuple[float, int]:
+    """ Best wall time over `repeat` runs, and the peak of traced allocations in a separate run """
+    gc.collect()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run(corpora: List[str], repeat: int, operations: List[str] | None = None) -> List[Result]:
+    results: List[Result] = []
+    for corpus in corpora:
+        for model, data in build_cases(SPECS[corpus]).items():
+            for name, operation in build_operations(model, data).items():
+                if operations and name not in operations:
+                    continue
+                seconds, peak = measure(operation, repeat)
+                results.append(Result(corpus, model.__name__, name, len(data), seconds, peak))
+    return results
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results: List[Result], path: str):
+    baseline = {
+        "meta": {
+            "commit": current_commit(),
+            "python": platform.python_version(),
+            "pydantic": pydantic.VERSION,
+            "corpora": {name: asdict(spec) for name, spec in SPECS.items()},
+        },
+        "results": {result.key: asdict(result) for result in results},
+    }
+    with open(path, "w") as fp:
+        json.dump(baseline, fp, indent=2)
+
+
+def compare(results: List[Result], path: str, threshold: float) -> bool:
+    """ Print the change against a baseline, return False when an operation is slower than the threshold """
+    with open(path) as fp:
+        baseline = json.load(fp)["results"]
+    ok = True
+    for result in results:
+        previous = baseline.get(result.key)
+        if previous is None:
+            continue
+        ratio = result.seconds / previous["seconds"]
+        regression = ratio > 1 + threshold
+        ok &= not regression
+        print(f"{result.key:<70} {ratio:6.2f}x time {result.peak_bytes / max(previous['peak_bytes'], 1):6.2f}x memory{'  REGRESSION' if regression else ''}")
+    return ok
+
+
+def report(results: List[Result]):
+    print(f"{'benchmark':<70} {'objects':>8} {'seconds':>9} {'objects/s':>11} {'peak KiB':>10}")
+    for result in results:
+        print(f"{result.key:<70} {result.objects:>8} {result.seconds:>9.4f} {result.throughput:>11.0f} {result.peak_bytes / 1024:>10.0f}")
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", action="append", choices=sorted(SPECS), help="corpora to run (default: all)")
+    parser.add_argument("--operation", action="append", help="only run these operations")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a stored baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown before failing a comparison")
+    args = parser.parse_args(argv)
+
+    results = run(args.corpus or sorted(SPECS), args.repeat, args.operation)
+    report(results)
+    if args.save:
+        save(results, args.save)
+    if args.compare:
+        return 0 if compare(results, args.compare, args.threshold) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,16 @@
 
+import builtins
+import copy
 from decimal import Decimal
-from typing import Any, List, Literal, Sequence
+from typing import Any, ClassVar, Dict, List, Literal, Sequence, Tuple, Union
 from typing_extensions import Annotated
+from weakref import ref
 
-from pydantic import BaseModel, Field, StringConstraints, model_validator
+from pydantic import BaseModel, ConfigDict, Discriminator, Field, GetCoreSchemaHandler, Tag, PrivateAttr, SerializationInfo, SerializerFunctionWrapHandler, StringConstraints, TypeAdapter, ValidationInfo, ValidatorFunctionWrapHandler, model_serializer, model_validator
 from pydantic.json_schema import SkipJsonSchema
+from pydantic_core import core_schema
+
+from pydantic_fhir_extensions.util import is_interning, is_serialization_to_fhir
 
 
 id = Annotated[str, StringConstraints(pattern=r"[A-Za-z0-9\-\.]{1,64}")]
@@ -16,13 +22,144 @@ date = Annotated[str, StringConstraints(pattern=DATE_PATTERN)]
 DATETIME_PATTERN = r"([0-9]([0-9]([0-9][1-9]|[1-9]0)|[1-9]00)|[1-9]000)(-(0[1-9]|1[0-2])(-(0[1-9]|[1-2][0-9]|3[0-1])(T([01][0-9]|2[0-3]):[0-5][0-9]:([0-5][0-9]|60)(\.[0-9]{1,9})?)?)?(Z|(\+|-)((0[0-9]|1[0-3]):[0-5][0-9]|14:00)?)?)?"
 dateTime = Annotated[str, StringConstraints(pattern=DATETIME_PATTERN)]
 
-class Quantity(BaseModel):
+# core schemas are built on first validation or serialization instead of at import, see `build_schemas`
+DEFERRED_CONFIG = ConfigDict(defer_build=True)
+
+def build_schema(model:type[BaseModel]):
+    """ Build the core schema of a deferred model now """
+    if not model.__pydantic_complete__:
+        model.model_rebuild()
+
+def build_schemas(*models:type[BaseModel]):
+    """ Build the deferred schemas up front, e.g. while warming up a worker before it takes traffic """
+    for model in models:
+        build_schema(model)
+
+
+class FrozenList(List[Any]):
+    """ List field of a frozen model: modifying it raises a TypeError. Its copies are plain lists again. """
+
+    def _read_only(self, *args:Any, **kwargs:Any):
+        raise TypeError("The list of a frozen model cannot be modified, use `model_copy(deep=True)` for a mutable copy")
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+    def __copy__(self) -> List[Any]:
+        return list(self)
+
+    def __deepcopy__(self, memo:Dict[int, Any]) -> List[Any]:
+        return [copy.deepcopy(item, memo) for item in self]
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+# exact types of the freezable models: much cheaper than isinstance on a pydantic model class when freezing
+FREEZABLE_TYPES: set[type] = set()
+
+class FreezableModel(BaseModel):
+    """ Model that can be made read-only in place with `freeze`, to share a single instance safely """
+    model_config = DEFERRED_CONFIG
+    # not copied nor pickled, like any slot: copies are mutable again, and are not rendered by any element yet
+    __slots__ = ("__fhir_frozen__", "__fhir_owners__")
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs:Any):
+        super().__pydantic_init_subclass__(**kwargs)
+        FREEZABLE_TYPES.add(cls)
+
+    def __setattr__(self, name:str, value:Any):
+        if name not in self.model_fields:
+            super().__setattr__(name, value)
+            return
+        if is_frozen(self):
+            raise TypeError(f"{type(self).__name__} is frozen, use `model_copy(deep=True)` for a mutable copy")
+        super().__setattr__(name, value)
+        notify_owners(self)
+
+    def __delattr__(self, name:str):
+        if name not in self.model_fields:
+            super().__delattr__(name)
+            return
+        if is_frozen(self):
+            raise TypeError(f"{type(self).__name__} is frozen, use `model_copy(deep=True)` for a mutable copy")
+        super().__delattr__(name)
+        notify_owners(self)
+
+    def __setstate__(self, state:Dict[Any, Any]):
+        # an unpickled instance can be the first of its class in this process, e.g. in the parent of a process pool:
+        # pydantic-core serializes it as a value of another model with the serializer of its class
+        build_schema(type(self))
+        super().__setstate__(state)
+
+    def freeze(self):
+        """ Make this model and the models and lists it holds read-only """
+        values = self.__dict__
+        for field_name, value in values.items():
+            values[field_name] = freeze_value(value)
+        _FROZEN_SLOT.__set__(self, True)
+
+_FROZEN_SLOT = FreezableModel.__dict__["__fhir_frozen__"]
+_OWNERS_SLOT = FreezableModel.__dict__["__fhir_owners__"]
+
+def is_frozen(model:FreezableModel) -> bool:
+    # read through the slot: a missing attribute would go through the slow `BaseModel.__getattr__`
+    try:
+        return _FROZEN_SLOT.__get__(model)
+    except AttributeError:
+        return False
+
+def get_owners(model:FreezableModel) -> List[Any]:
+    """ The elements whose incremental dump renders this model, when it is not an element itself """
+    try:
+        owners = _OWNERS_SLOT.__get__(model)
+    except AttributeError:
+        return []
+    # copied first: the weak reference callbacks remove the collected owners
+    return [owner for owner in (reference() for reference in list(owners.values())) if owner is not None]
+
+def add_owner(model:FreezableModel, owner:Any) -> bool:
+    """ Record that `owner` renders this model; False for the immutable models, e.g. interned codings, which are
+    shared too widely to track and never change. Owners are weakly referenced by id, elements being unhashable:
+    a shared model does not keep the elements that rendered it alive. """
+    if type(model).model_config.get("frozen"):
+        return False
+    try:
+        owners = _OWNERS_SLOT.__get__(model)
+    except AttributeError:
+        owners = {}
+        _OWNERS_SLOT.__set__(model, owners)
+    # `id` is the FHIR type in this module
+    key = builtins.id(owner)
+    if key not in owners:
+        owners[key] = ref(owner, lambda _, key=key: owners.pop(key, None))
+    return True
+
+def notify_owners(model:FreezableModel):
+    """ Render the owners of a model again on their next incremental dump, after one of its fields changed """
+    for owner in get_owners(model):
+        owner.mark_dirty()
+
+def freeze_value(value:Any) -> Any:
+    value_type = type(value)
+    if value_type in FREEZABLE_TYPES:
+        value.freeze()
+    elif value_type is list:
+        return FrozenList(map(freeze_value, value))
+    elif value_type is tuple:
+        for item in value:
+            freeze_value(item)
+    return value
+
+class Quantity(FreezableModel):
+    model_config = DEFERRED_CONFIG
     value: Decimal
     unit: str
     code: str
     system: str
 
-class Coding(BaseModel):
+class Coding(FreezableModel):
+    model_config = DEFERRED_CONFIG
     code:str
     system:str | None = None
     display:str | None = None
@@ -39,17 +176,40 @@ class Coding(BaseModel):
             return self.system == other.system and self.code == other.code and self.version == other.version
         return False
 
-class CodeableConcept(BaseModel):
+    @model_validator(mode="wrap")
+    @classmethod
+    def intern_coding(cls, data:Any, handler:ValidatorFunctionWrapHandler, info:ValidationInfo):
+        if cls is not Coding or not is_interning(info):
+            return handler(data)
+        if isinstance(data, dict):
+            key = raw_coding_key(data)
+            # an identical input was validated before: skip validation
+            interned = None if key is None else _INTERNED_CODINGS.get(key)
+            if interned is not None:
+                return interned
+        return intern_coding(handler(data))
+
+class CodeableConcept(FreezableModel):
+    model_config = DEFERRED_CONFIG
     text: str
     coding: Sequence[Coding] = Field(default_factory=list)
 
-class Expression(BaseModel):
+    @model_validator(mode="wrap")
+    @classmethod
+    def intern_codeable_concept(cls, data:Any, handler:ValidatorFunctionWrapHandler, info:ValidationInfo):
+        if cls is not CodeableConcept or not is_interning(info):
+            return handler(data)
+        return intern_codeable_concept(handler(data))
+
+class Expression(FreezableModel):
+    model_config = DEFERRED_CONFIG
     description: str | None = None
     expression: str
     name: id | None = None
     language: Literal["text/fhirpath"] = "text/fhirpath"
 
-class BaseExtension(BaseModel):
+class BaseExtension(FreezableModel):
+    model_config = DEFERRED_CONFIG
     extension: SkipJsonSchema[List["BaseExtension"]] = Field(default_factory=list)
     url:str
     valueString: str | None = None
@@ -72,3 +232,227 @@ class BaseExtension(BaseModel):
         if has_value and has_extension:
             raise ValueError("Either value or extension can be present, not both")
         return self
+
+    @model_serializer(mode="wrap")
+    def serialize_extension(self, handler:SerializerFunctionWrapHandler, info:SerializationInfo):
+        data = handler(self)
+        if is_serialization_to_fhir(info) and not data.get("extension"):
+            data.pop("extension", None)
+        return data
+
+VALUE_KEYS = ("valueString", "valueCoding", "valueCodeableConcept", "valueDecimal", "valueInteger", "valueBoolean", "valueExpression")
+_VALUE_KEYS = frozenset(VALUE_KEYS)
+
+class RawExtension(Dict[str, Any]):
+    """ An extension kept as its raw FHIR JSON by validating with `context={"passthrough": True}`: only the url
+    is checked, and it is written back verbatim. Call `validate` to get the validated extension. """
+
+    @classmethod
+    def from_data(cls, data:Any) -> "RawExtension":
+        if not isinstance(data, dict) or not isinstance(data.get("url"), str):
+            raise ValueError("An extension must be an object with a string url")
+        return cls(data)
+
+    @property
+    def url(self) -> str:
+        return self["url"]
+
+    def validate(self, context:Dict[str, Any] | None = None) -> "Extension":
+        return get_extension_adapter().validate_python(dict(self), context=context)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type:Any, handler:GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        # kept as is: serialized like any dict
+        return core_schema.is_instance_schema(cls)
+
+def get_extension_tag(data:Any) -> str:
+    """ The value[x] key of an extension, `extension` for nested extensions, or `invalid` when both or several are present """
+    tag = None
+    if type(data) is RawExtension:
+        return "raw"
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in _VALUE_KEYS and value is not None:
+                if tag is not None:
+                    return "invalid"
+                tag = key
+        has_extension = bool(data.get("extension"))
+    else:
+        tag = getattr(data, "value_key", None)
+        if tag is None:
+            for key in VALUE_KEYS:
+                if getattr(data, key, None) is not None:
+                    if tag is not None:
+                        return "invalid"
+                    tag = key
+        has_extension = bool(getattr(data, "extension", None))
+    if tag is None:
+        return "extension"
+    return "invalid" if has_extension else tag
+
+class ValueExtension(FreezableModel):
+    """ Compact generic extension: the url and the single value[x] of `value_key` """
+    model_config = ConfigDict(from_attributes=True, defer_build=True)
+    value_key: ClassVar[str]
+    url: str
+
+    @property
+    def value(self) -> Any:
+        return getattr(self, self.value_key)
+
+class StringExtension(ValueExtension):
+    value_key: ClassVar[str] = "valueString"
+    valueString: str
+
+class CodingExtension(ValueExtension):
+    value_key: ClassVar[str] = "valueCoding"
+    valueCoding: Coding
+
+class CodeableConceptExtension(ValueExtension):
+    value_key: ClassVar[str] = "valueCodeableConcept"
+    valueCodeableConcept: CodeableConcept
+
+class DecimalExtension(ValueExtension):
+    value_key: ClassVar[str] = "valueDecimal"
+    valueDecimal: Decimal
+
+class IntegerExtension(ValueExtension):
+    value_key: ClassVar[str] = "valueInteger"
+    valueInteger: int
+
+class BooleanExtension(ValueExtension):
+    value_key: ClassVar[str] = "valueBoolean"
+    valueBoolean: bool
+
+class ExpressionExtension(ValueExtension):
+    value_key: ClassVar[str] = "valueExpression"
+    valueExpression: Expression
+
+class ComplexExtension(FreezableModel):
+    """ Compact generic extension with nested extensions and no value """
+    model_config = ConfigDict(from_attributes=True, defer_build=True)
+    value_key: ClassVar[str] = "extension"
+    url: str
+    extension: SkipJsonSchema[List["Extension"]] = Field(default_factory=list)
+
+    @property
+    def value(self) -> None:
+        return None
+
+    @model_serializer(mode="wrap")
+    def serialize_extension(self, handler:SerializerFunctionWrapHandler, info:SerializationInfo):
+        data = handler(self)
+        if is_serialization_to_fhir(info) and not data.get("extension"):
+            data.pop("extension", None)
+        return data
+
+# the one-value and value-or-extension rules are decided by the tag, before any field is validated
+Extension = Annotated[
+    Union[
+        Annotated[StringExtension, Tag("valueString")],
+        Annotated[CodingExtension, Tag("valueCoding")],
+        Annotated[CodeableConceptExtension, Tag("valueCodeableConcept")],
+        Annotated[DecimalExtension, Tag("valueDecimal")],
+        Annotated[IntegerExtension, Tag("valueInteger")],
+        Annotated[BooleanExtension, Tag("valueBoolean")],
+        Annotated[ExpressionExtension, Tag("valueExpression")],
+        Annotated[ComplexExtension, Tag("extension")],
+        Annotated[RawExtension, Tag("raw")],
+    ],
+    Discriminator(
+        get_extension_tag,
+        custom_error_type="extension_value",
+        custom_error_message="An extension has either a single value[x] or nested extensions",
+    ),
+]
+
+EXTENSION_TYPES = (StringExtension, CodingExtension, CodeableConceptExtension, DecimalExtension, IntegerExtension, BooleanExtension, ExpressionExtension, ComplexExtension)
+_EXTENSION_SCHEMAS_BUILT = False
+
+def extension_schemas_built() -> bool:
+    return _EXTENSION_SCHEMAS_BUILT
+
+def build_extension_schemas():
+    """ Build the schemas of the generic extension types, once: any element holding them may be dumped """
+    global _EXTENSION_SCHEMAS_BUILT
+    build_schemas(*EXTENSION_TYPES)
+    _EXTENSION_SCHEMAS_BUILT = True
+
+_EXTENSION_ADAPTER: TypeAdapter[Extension] | None = None
+
+def get_extension_adapter() -> TypeAdapter[Extension]:
+    """ Validator of a single extension, built on first use """
+    global _EXTENSION_ADAPTER
+    if _EXTENSION_ADAPTER is None:
+        _EXTENSION_ADAPTER = TypeAdapter(Extension)
+    return _EXTENSION_ADAPTER
+
+class FrozenCoding(Coding):
+    """ Immutable, shared Coding handed out by `intern_coding` """
+    model_config = ConfigDict(frozen=True)
+    _hash: int = PrivateAttr(default=0)
+
+    def __hash__(self):
+        return self._hash
+
+class FrozenCodeableConcept(CodeableConcept):
+    """ Immutable, shared CodeableConcept handed out by `intern_codeable_concept` """
+    model_config = ConfigDict(frozen=True)
+    coding: Tuple[FrozenCoding, ...] = ()
+
+CodingKey = Tuple[Any, Any, Any, Any, Any]
+
+# the interned values live for the process, or until `clear_interned`: past this many per table, new values are
+# still frozen but no longer shared
+MAX_INTERNED = 100_000
+_INTERNED_CODINGS: Dict[CodingKey, FrozenCoding] = {}
+_INTERNED_CODEABLE_CONCEPTS: Dict[Tuple[str, Tuple[CodingKey, ...]], FrozenCodeableConcept] = {}
+
+def coding_key(coding:Any) -> CodingKey:
+    if isinstance(coding, dict):
+        return (coding.get("code"), coding.get("system"), coding.get("display"), coding.get("userSelected"), coding.get("version"))
+    return (coding.code, coding.system, coding.display, coding.userSelected, coding.version)
+
+def raw_coding_key(data:Dict[str, Any]) -> CodingKey | None:
+    """ The key of a raw coding, or None when validation could convert or reject its values """
+    key = coding_key(data)
+    code, system, display, user_selected, version = key
+    if type(user_selected) not in (bool, type(None)):
+        return None
+    for value in (code, system, display, version):
+        if value is not None and type(value) is not str:
+            return None
+    return key
+
+def intern_coding(coding:Coding) -> FrozenCoding:
+    """ Return the shared frozen instance for a coding with the same values """
+    key = coding_key(coding)
+    interned = _INTERNED_CODINGS.get(key)
+    if interned is None:
+        # instances only come from `model_construct`, but serializing a Coding subclass needs its own serializer
+        build_schema(FrozenCoding)
+        code, system, display, user_selected, version = key
+        interned = FrozenCoding.model_construct(
+            _fields_set=coding.model_fields_set, code=code, system=system, display=display, userSelected=user_selected, version=version
+        )
+        interned._hash = Coding.__hash__(interned)
+        if len(_INTERNED_CODINGS) < MAX_INTERNED:
+            interned = _INTERNED_CODINGS.setdefault(key, interned)
+    return interned
+
+def intern_codeable_concept(concept:CodeableConcept) -> FrozenCodeableConcept:
+    """ Return the shared frozen instance for a codeable concept with the same text and codings """
+    codings = tuple(intern_coding(coding) for coding in concept.coding)
+    key = (concept.text, tuple(coding_key(coding) for coding in codings))
+    interned = _INTERNED_CODEABLE_CONCEPTS.get(key)
+    if interned is None:
+        build_schema(FrozenCodeableConcept)
+        interned = FrozenCodeableConcept.model_construct(_fields_set=concept.model_fields_set, text=concept.text, coding=codings)
+        if len(_INTERNED_CODEABLE_CONCEPTS) < MAX_INTERNED:
+            interned = _INTERNED_CODEABLE_CONCEPTS.setdefault(key, interned)
+    return interned
+
+def clear_interned():
+    """ Drop all interned values, e.g. between tenants or in tests """
+    _INTERNED_CODINGS.clear()
+    _INTERNED_CODEABLE_CONCEPTS.clear()
@@ -0,0 +1,94 @@
+
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Generic, Iterable, List, Sequence, Type, TypeVar
+
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import ErrorDetails
+
+from pydantic_fhir_extensions.element import FHIR_CONTEXT, BaseElement
+
+ElementT = TypeVar("ElementT", bound=BaseElement)
+ItemT = TypeVar("ItemT")
+ResultT = TypeVar("ResultT")
+
+
+@dataclass
+class BatchResult(Generic[ResultT]):
+    """ Outcome of a batch validation: `results[i]` is None whenever `errors` has an entry for index `i` """
+    results: List[ResultT | None]
+    errors: Dict[int, List[ErrorDetails]] = field(default_factory=dict)
+
+    @property
+    def valid(self) -> List[ResultT]:
+        return [result for result in self.results if result is not None]
+
+
+@lru_cache(maxsize=None)
+def get_list_adapter(model: Type[ElementT]) -> TypeAdapter[List[ElementT]]:
+    """ The shared `TypeAdapter(List[model])` used by the batch functions """
+    return TypeAdapter(List[model])
+
+
+def validate_many(model: Type[ElementT], items: Iterable[Any]) -> BatchResult[ElementT]:
+    """ Validate a batch of FHIR objects, lifting their extensions, without raising on the first failure """
+    return validate_batch(list(items), get_list_adapter(model).validate_python)
+
+
+def validate_many_json(model: Type[ElementT], items: Sequence[bytes]) -> BatchResult[ElementT]:
+    """ Validate a batch of raw FHIR JSON documents, each parsed on its own
+
+    Joining the documents into one JSON array is no faster, and a malformed document (e.g. with a top-level comma)
+    would then run into its neighbours and shift the indices of all the documents after it.
+    """
+    results: List[ElementT | None] = []
+    errors: Dict[int, List[ErrorDetails]] = {}
+    for index, item in enumerate(items):
+        try:
+            results.append(model.model_validate_json(item))
+        except ValidationError as exc:
+            results.append(None)
+            errors[index] = exc.errors()
+    return BatchResult(results, errors)
+
+
+def validate_batch(items: Sequence[ItemT], validate: Callable[[Sequence[ItemT]], List[ElementT]]) -> BatchResult[ElementT]:
+    """ Validate all items in one call, and only the valid items again when some of them fail """
+    try:
+        return BatchResult(validate(items))
+    except ValidationError as exc:
+        errors = group_errors_by_index(exc)
+
+    # the failing items are known now, validate the others in a second pass
+    valid_indices = [index for index in range(len(items)) if index not in errors]
+    results: List[ElementT | None] = [None] * len(items)
+    if valid_indices:
+        for index, result in zip(valid_indices, validate([items[index] for index in valid_indices])):
+            results[index] = result
+    return BatchResult(results, errors)
+
+
+def dump_many_fhir(model: Type[ElementT], elements: Iterable[ElementT]) -> List[Dict[str, Any]]:
+    """ Serialize a batch of elements to FHIR, the batch counterpart of `BaseElement.model_dump_fhir` """
+    adapter = get_list_adapter(model)
+    return adapter.dump_python(list(elements), mode="json", context=FHIR_CONTEXT, exclude_none=True, exclude=get_batch_exclude(model))
+
+
+def dump_many_fhir_json(model: Type[ElementT], elements: Iterable[ElementT]) -> bytes:
+    """ Serialize a batch of elements to a FHIR JSON array directly in pydantic-core """
+    adapter = get_list_adapter(model)
+    return adapter.dump_json(list(elements), context=FHIR_CONTEXT, exclude_none=True, exclude=get_batch_exclude(model))
+
+
+def get_batch_exclude(model: Type[BaseElement]) -> Dict[str, Any] | None:
+    return {"__all__": set(model.__fhir_exclude__)} if model.__fhir_exclude__ else None
+
+
+def group_errors_by_index(exc: ValidationError) -> Dict[int, List[ErrorDetails]]:
+    """ Split the errors of a list validation per item, with the item index removed from `loc` """
+    errors: Dict[int, List[ErrorDetails]] = {}
+    for error in exc.errors():
+        index, *loc = error["loc"]
+        assert isinstance(index, int)
+        errors.setdefault(index, []).append({**error, "loc": tuple(loc)})
+    return errors
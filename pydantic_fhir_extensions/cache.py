@@ -0,0 +1,111 @@
+
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, Hashable, Tuple, Type, TypeVar
+
+from pydantic_fhir_extensions.element import BaseElement
+
+ElementT = TypeVar("ElementT", bound=BaseElement)
+
+CacheKey = Tuple[type, Hashable, bytes]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def hash_input(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def canonical_json(data: Any) -> bytes:
+    """ The same bytes for equal JSON data, whatever the order of the keys """
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def get_context_key(context: Dict[str, Any] | None) -> Hashable:
+    return frozenset(context.items()) if context else None
+
+
+class ValidationCache:
+    """ LRU cache of validated elements, keyed by the model, the context and a hash of the input
+
+    The cached elements are frozen and shared by every hit: assigning a field or modifying a list of one
+    raises a TypeError, `model_copy(deep=True)` gives a mutable copy. Extensions kept raw in passthrough mode
+    are plain dicts and are shared as is. The size of an entry is the size of its JSON input.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[CacheKey, Tuple[BaseElement, int]] = OrderedDict()
+        self.stats = CacheStats()
+        self.lock = Lock()
+
+    def validate(self, model: Type[ElementT], data: Dict[str, Any], context: Dict[str, Any] | None = None) -> ElementT:
+        """ `model.model_validate(data)`, keyed by the canonical JSON of `data` """
+        try:
+            key = (model, get_context_key(context), hash_input(encoded := canonical_json(data)))
+        except TypeError:
+            # not plain JSON data or an unhashable context value: nothing to key it by
+            with self.lock:
+                self.stats.misses += 1
+            return model.model_validate(data, context=context)
+        return self.get_or_validate(key, len(encoded), lambda: model.model_validate(data, context=context))
+
+    def validate_json(self, model: Type[ElementT], data: str | bytes, context: Dict[str, Any] | None = None) -> ElementT:
+        """ `model.model_validate_json(data)`, keyed by the raw bytes """
+        encoded = data.encode() if isinstance(data, str) else data
+        try:
+            key = (model, get_context_key(context), hash_input(encoded))
+        except TypeError:
+            with self.lock:
+                self.stats.misses += 1
+            return model.model_validate_json(data, context=context)
+        return self.get_or_validate(key, len(encoded), lambda: model.model_validate_json(data, context=context))
+
+    def get_or_validate(self, key: CacheKey, size: int, validate: Any) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry[0]
+            self.stats.misses += 1
+        # validated outside of the lock: a concurrent miss on the same key validates twice, the last one is kept
+        element = validate()
+        element.freeze()
+        if size > self.max_bytes:
+            return element
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.stats.bytes -= previous[1]
+            self.entries[key] = (element, size)
+            self.stats.bytes += size
+            while len(self.entries) > self.max_entries or self.stats.bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.stats.bytes -= evicted_size
+                self.stats.evictions += 1
+            self.stats.entries = len(self.entries)
+        return element
+
+    def clear(self):
+        """ Drop all entries, the hit, miss and eviction counts are kept """
+        with self.lock:
+            self.entries.clear()
+            self.stats.entries = 0
+            self.stats.bytes = 0
@@ -0,0 +1,120 @@
+
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple, Type
+
+from pydantic_fhir_extensions.element import BaseElement
+from pydantic_fhir_extensions.extensions.validator import ExtensionBucket, partition_extensions
+
+Getter = Callable[[Any], Any]
+
+
+@dataclass
+class Columns:
+    """ Column-oriented values of a batch: `columns[path][i]` is the value at `path` of the i-th row
+
+    Columns of only ints or only floats are `array` buffers, the others are lists. A path that crosses a
+    list yields a list per row. `errors[i]` holds the extension-backed properties of the i-th row that
+    could not be lifted, by name: their columns are None in that row.
+    """
+    columns: Dict[str, Sequence[Any]]
+    rows: int
+    errors: Dict[int, Dict[str, Exception]] = field(default_factory=dict)
+
+    def __getitem__(self, path: str) -> Sequence[Any]:
+        return self.columns[path]
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """ The columns as NumPy arrays, without copying the `array` buffers. Requires numpy. """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("Columns.to_numpy() requires numpy to be installed") from None
+        result: Dict[str, Any] = {}
+        for path, column in self.columns.items():
+            if isinstance(column, array):
+                result[path] = numpy.frombuffer(column, dtype=numpy.int64 if column.typecode == "q" else numpy.float64)
+            else:
+                values = numpy.empty(len(column), dtype=object)
+                values[:] = column
+                result[path] = values
+        return result
+
+
+def get_value(value: Any, name: str) -> Any:
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+
+def make_getter(names: Sequence[str]) -> Getter:
+    """ Follow `names` from a value through models or raw dicts, mapping over the lists on the way """
+    def get(value: Any, start: int = 0) -> Any:
+        for position in range(start, len(names)):
+            if value is None:
+                return None
+            if isinstance(value, (list, tuple)):
+                return [get(child, position) for child in value]
+            value = get_value(value, names[position])
+        return value
+    return get
+
+
+def pack_column(values: List[Any]) -> Sequence[Any]:
+    """ Store a column of only ints or only floats in an `array` buffer """
+    if values and all(type(value) is int for value in values):
+        try:
+            return array("q", values)
+        except OverflowError:
+            return values
+    if values and all(type(value) is float for value in values):
+        return array("d", values)
+    return values
+
+
+def extract_columns(model: Type[BaseElement], items: Iterable[BaseElement | Dict[str, Any]], paths: Sequence[str]) -> Columns:
+    """ Extract the values at `paths` (e.g. `linkId`, `itemControl.code`, `answerOptionsToggleExpression.option.code`)
+    of a batch of elements or raw FHIR dicts of `model`, in a single pass over the rows
+
+    The first name of a path may be an extension-backed property. For raw dicts, the extension array is then
+    partitioned once per row and each property is lifted once by its ExtensionValidator, however many paths
+    start with it, unless the dict holds the property itself; the rest of the dict is not validated.
+    """
+    # group the paths on their first name, so that each property is read or lifted once per row
+    heads: Dict[str, List[Tuple[int, Getter]]] = {}
+    for index, path in enumerate(paths):
+        head, *tail = path.split(".")
+        heads.setdefault(head, []).append((index, make_getter(tail)))
+    lifted = {head: model.__extension_fields__[head] for head in heads if head in model.__extension_fields__}
+    urls = frozenset(ext_validator.url for ext_validator in lifted.values())
+
+    values: List[List[Any]] = [[] for _ in paths]
+    errors: Dict[int, Dict[str, Exception]] = {}
+    rows = 0
+    for item in items:
+        rows += 1
+        if isinstance(item, dict):
+            buckets, _ = partition_extensions(item.get("extension") or (), urls) if urls else ({}, [])
+            for head, getters in heads.items():
+                ext_validator = lifted.get(head)
+                if ext_validator is None or head in item:
+                    # like validation, a property given as such is not lifted from the extensions
+                    head_value = item.get(head)
+                else:
+                    try:
+                        head_value = ext_validator.lift(buckets.get(ext_validator.url, ExtensionBucket()), model=model.__name__)
+                    except (ValueError, AssertionError) as exc:
+                        # a missing or invalid extension fails this row only
+                        errors.setdefault(rows - 1, {})[head] = exc
+                        head_value = None
+                for index, getter in getters:
+                    values[index].append(getter(head_value))
+        else:
+            for head, getters in heads.items():
+                head_value = getattr(item, head, None)
+                for index, getter in getters:
+                    values[index].append(getter(head_value))
+    return Columns({path: pack_column(column) for path, column in zip(paths, values)}, rows, errors)
@@ -0,0 +1,186 @@
+
+import collections.abc
+import types
+from decimal import Decimal
+from functools import lru_cache, partial
+from typing import Annotated, Any, Callable, Dict, FrozenSet, List, NamedTuple, Set, Tuple, Type, TypeVar, Union, get_args, get_origin
+
+from pydantic import BaseModel, Discriminator, Tag
+
+from pydantic_fhir_extensions.base import build_schema
+from pydantic_fhir_extensions.dates import PartialDateTime, parse_value
+from pydantic_fhir_extensions.extensions.validator import ExtensionBucket, ExtensionValidator, partition_extensions
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+Converter = Callable[[Any], Any]
+
+SEQUENCE_ORIGINS = (list, tuple, collections.abc.Sequence)
+IMMUTABLE_TYPES = (str, int, float, bool, Decimal, tuple, frozenset)
+
+MISSING: Any = object()
+
+# never mutated: only iterated by `lift_trusted`
+EMPTY_BUCKET = ExtensionBucket()
+
+
+class LiftedField(NamedTuple):
+    """ An extension-backed field, lifted from `extension` when the input does not hold the property itself """
+    name: str
+    convert: Converter | None
+    ext_validator: ExtensionValidator
+    url: str
+
+
+class ModelPlan(NamedTuple):
+    """ How to construct a model: the field name and value converter (None to keep the value as is) per input key """
+    fields: Dict[str, Tuple[str, Converter | None]]
+    # copied as the starting values: every field in order, since they are serialized in the order of the
+    # instance dict, with its immutable default or a placeholder
+    defaults: Dict[str, Any]
+    required: Tuple[str, ...]
+    factories: Tuple[Tuple[str, Callable[[], Any]], ...]
+    lifted: Tuple[LiftedField, ...]
+    urls: FrozenSet[str]
+    init_private: bool
+
+
+def get_constructor(model: Type[BaseModel]) -> Callable[[Dict[str, Any]], Any]:
+    """ The trusted path of `model` when it has one, e.g. `BaseElement.model_construct_trusted` """
+    return getattr(model, "model_construct_trusted", None) or partial(construct, model)
+
+
+def make_model_converter(model: Type[BaseModel]) -> Converter:
+    constructor = get_constructor(model)
+
+    def convert(value: Any) -> Any:
+        return constructor(value) if type(value) is dict else value
+    return convert
+
+
+def make_converter(annotation: Any) -> Converter | None:
+    """ The function that turns trusted input into the value validation would give for `annotation` """
+    origin = get_origin(annotation)
+    if origin is Annotated:
+        inner, *metadata = get_args(annotation)
+        discriminator = next((item for item in metadata if isinstance(item, Discriminator)), None)
+        if discriminator is not None and callable(discriminator.discriminator):
+            return make_tagged_union_converter(inner, discriminator.discriminator)
+        return make_converter(inner)
+    if origin is Union or origin is types.UnionType:
+        choices = [choice for choice in get_args(annotation) if choice is not type(None)]
+        # unions of several types are left as is: there is no tag to pick one without validating
+        if len(choices) != 1:
+            return None
+        return make_converter(choices[0])
+    if origin in SEQUENCE_ORIGINS:
+        item_type = get_args(annotation)[0] if get_args(annotation) else Any
+        convert_item = make_converter(item_type)
+        if origin is tuple:
+            return (lambda value: tuple(map(convert_item, value))) if convert_item else tuple
+        return (lambda value: [convert_item(item) for item in value]) if convert_item else list
+    if isinstance(annotation, type):
+        if issubclass(annotation, BaseModel):
+            return make_model_converter(annotation)
+        if issubclass(annotation, PartialDateTime):
+            return lambda value: value if isinstance(value, PartialDateTime) else parse_value(annotation, value)
+        if annotation is Decimal:
+            return lambda value: value if isinstance(value, Decimal) else Decimal(str(value))
+    return None
+
+
+def make_tagged_union_converter(union: Any, get_tag: Callable[[Any], str]) -> Converter:
+    choices: Dict[str, Converter | None] = {}
+    for choice in get_args(union):
+        choice_type, *metadata = get_args(choice)
+        tag = next(item.tag for item in metadata if isinstance(item, Tag))
+        choices[tag] = make_converter(choice_type)
+
+    def convert(value: Any) -> Any:
+        convert_choice = choices.get(get_tag(value))
+        return convert_choice(value) if convert_choice else value
+    return convert
+
+
+@lru_cache(maxsize=None)
+def get_model_plan(model: Type[BaseModel]) -> ModelPlan:
+    # resolves the forward references of the annotations, and constructed instances need a serializer anyway
+    build_schema(model)
+    extension_fields: Dict[str, ExtensionValidator] = getattr(model, "__extension_fields__", {})
+    fields: Dict[str, Tuple[str, Converter | None]] = {}
+    defaults: Dict[str, Any] = {}
+    factories: List[Tuple[str, Callable[[], Any]]] = []
+    lifted: List[LiftedField] = []
+    required: List[str] = []
+    for field_name, field_info in model.model_fields.items():
+        convert = make_converter(field_info.annotation)
+        fields[field_info.alias or field_name] = (field_name, convert)
+        defaults[field_name] = MISSING
+        ext_validator = extension_fields.get(field_name)
+        if ext_validator is not None:
+            lifted.append(LiftedField(field_name, convert, ext_validator, ext_validator.url))
+        elif field_info.default_factory is not None:
+            factories.append((field_name, field_info.default_factory))
+        elif not field_info.is_required():
+            default = field_info.default
+            if default is None or isinstance(default, IMMUTABLE_TYPES):
+                defaults[field_name] = default
+            else:
+                factories.append((field_name, partial(field_info.get_default, call_default_factory=True)))
+        else:
+            required.append(field_name)
+    return ModelPlan(fields, defaults, tuple(required), tuple(factories), tuple(lifted), frozenset(extension_fields[field.name].url for field in lifted), bool(model.__pydantic_post_init__))
+
+
+def lift_trusted(ext_validator: ExtensionValidator, extensions: ExtensionBucket) -> Any:
+    """ Like `ExtensionValidator.lift`, but the extension models are constructed instead of validated """
+    constructor = get_constructor(ext_validator.extension_type)
+    matches = [constructor(extension) if type(extension) is dict else extension for extension in extensions]
+    return ext_validator.extension_type.to_property_value(*matches)
+
+
+def construct(model: Type[ModelT], data: Dict[str, Any]) -> ModelT:
+    """ Build `model` from trusted FHIR data without validating it
+
+    Nested models are constructed from the field annotations, and the extension-backed fields are lifted
+    from the `extension` array by the `to_property_value` of their extension type. Validators do not run:
+    the data must be what validation would accept, or the instance may be inconsistent.
+    """
+    plan = get_model_plan(model)
+    values = plan.defaults.copy()
+    fields_set: Set[str] = set()
+    fields = plan.fields
+    for key, value in data.items():
+        field = fields.get(key)
+        if field is None:
+            continue
+        field_name, convert = field
+        values[field_name] = convert(value) if convert is not None and value is not None else value
+        fields_set.add(field_name)
+    for field_name, factory in plan.factories:
+        if field_name not in fields_set:
+            values[field_name] = factory()
+    if plan.lifted:
+        buckets: Dict[str, ExtensionBucket] | None = None
+        for field_name, convert, ext_validator, url in plan.lifted:
+            if field_name in fields_set:
+                continue
+            if buckets is None:
+                buckets, _ = partition_extensions(data.get("extension") or (), plan.urls)
+            value = lift_trusted(ext_validator, buckets.get(url, EMPTY_BUCKET))
+            values[field_name] = convert(value) if convert is not None and value is not None else value
+            fields_set.add(field_name)
+    for field_name in plan.required:
+        # like `model_construct`, a missing required field is left unset
+        if values[field_name] is MISSING:
+            del values[field_name]
+    # what `model_construct` does, minus its per-field alias and default lookups
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__pydantic_fields_set__", fields_set)
+    object.__setattr__(instance, "__pydantic_extra__", None)
+    if plan.init_private:
+        instance.model_post_init(None)
+    else:
+        object.__setattr__(instance, "__pydantic_private__", None)
+    return instance
@@ -0,0 +1,252 @@
+
+from calendar import monthrange
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Callable, ClassVar, Literal, Tuple
+
+from pydantic import GetCoreSchemaHandler
+from pydantic_core import PydanticCustomError, core_schema
+
+Precision = Literal["year", "month", "day", "second"]
+PRECISION_RANK = {"year": 0, "month": 1, "day": 2, "second": 3}
+
+DATE_CACHE_SIZE = 4096
+
+DIGITS = frozenset("0123456789")
+
+
+def parse_digits(text: str, start: int, length: int) -> int:
+    part = text[start:start + length]
+    if len(part) != length or not DIGITS.issuperset(part):
+        raise ValueError
+    return int(part)
+
+def expect(text: str, pos: int, char: str):
+    if text[pos:pos + 1] != char:
+        raise ValueError
+
+
+class PartialDateTime:
+    """ A FHIR date/dateTime/instant value: the parsed parts, their precision and the original text
+
+    Values compare on the instant they start at and then on their precision; `start` and `end` give the
+    half-open range a partial value covers. A time without offset is taken as UTC for comparisons.
+    """
+    __slots__ = ("text", "year", "month", "day", "hour", "minute", "second", "fraction", "offset", "precision", "_start", "_hash")
+
+    allow_time: ClassVar[bool] = True
+    require_time: ClassVar[bool] = False
+    kind: ClassVar[str] = "dateTime"
+
+    text: str
+    year: int
+    month: int | None
+    day: int | None
+    hour: int | None
+    minute: int | None
+    second: int | None
+    fraction: str | None
+    offset: int | None
+    precision: Precision
+
+    def __init__(self, text: str):
+        set_slot = object.__setattr__
+        set_slot(self, "text", text)
+        for name, value in zip(self.__slots__[1:], self.parse(text)):
+            set_slot(self, name, value)
+        set_slot(self, "_start", None)
+        set_slot(self, "_hash", None)
+
+    @classmethod
+    def parse(cls, text: str) -> Tuple[Any, ...]:
+        """ Hand-written equivalent of DATE_PATTERN / DATETIME_PATTERN, plus calendar checks """
+        try:
+            return cls._parse(text)
+        except (ValueError, IndexError):
+            raise ValueError(f"`{text}` is not a valid FHIR {cls.kind}") from None
+
+    @classmethod
+    def _parse(cls, text: str) -> Tuple[Any, ...]:
+        length = len(text)
+        year = parse_digits(text, 0, 4)
+        if year == 0:
+            raise ValueError
+        month = day = hour = minute = second = fraction = offset = None
+        precision: Precision = "year"
+        if length > 4:
+            expect(text, 4, "-")
+            month = parse_digits(text, 5, 2)
+            if not 1 <= month <= 12:
+                raise ValueError
+            precision = "month"
+        if length > 7:
+            expect(text, 7, "-")
+            day = parse_digits(text, 8, 2)
+            if not 1 <= day <= monthrange(year, month)[1]:
+                raise ValueError
+            precision = "day"
+        if length > 10:
+            if not cls.allow_time:
+                raise ValueError
+            expect(text, 10, "T")
+            hour = parse_digits(text, 11, 2)
+            expect(text, 13, ":")
+            minute = parse_digits(text, 14, 2)
+            expect(text, 16, ":")
+            second = parse_digits(text, 17, 2)
+            if hour > 23 or minute > 59 or second > 60:
+                raise ValueError
+            precision = "second"
+            pos = 19
+            if text[pos:pos + 1] == ".":
+                end = pos + 1
+                while end < length and text[end] in DIGITS:
+                    end += 1
+                fraction = text[pos + 1:end]
+                if not 1 <= len(fraction) <= 9:
+                    raise ValueError
+                pos = end
+            if pos < length:
+                offset = cls._parse_offset(text, pos)
+            elif cls.require_time:
+                raise ValueError
+        elif cls.require_time:
+            raise ValueError
+        return year, month, day, hour, minute, second, fraction, offset, precision
+
+    @staticmethod
+    def _parse_offset(text: str, pos: int) -> int:
+        if text[pos:] == "Z":
+            return 0
+        sign = text[pos]
+        if sign not in "+-" or len(text) != pos + 6:
+            raise ValueError
+        hours = parse_digits(text, pos + 1, 2)
+        expect(text, pos + 3, ":")
+        minutes = parse_digits(text, pos + 4, 2)
+        if minutes > 59 or hours > 14 or (hours == 14 and minutes):
+            raise ValueError
+        return (hours * 60 + minutes) * (-1 if sign == "-" else 1)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return (type(self), (self.text,))
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.text!r})"
+
+    @property
+    def tzinfo(self) -> timezone:
+        return timezone.utc if not self.offset else timezone(timedelta(minutes=self.offset))
+
+    @property
+    def start(self) -> datetime:
+        """ The first instant covered by this value """
+        start = self._start
+        if start is None:
+            microsecond = int(self.fraction[:6].ljust(6, "0")) if self.fraction else 0
+            start = datetime(
+                self.year, self.month or 1, self.day or 1, self.hour or 0, self.minute or 0, min(self.second or 0, 59), microsecond, self.tzinfo
+            )
+            object.__setattr__(self, "_start", start)
+        return start
+
+    @property
+    def end(self) -> datetime:
+        """ The first instant after this value, e.g. the next day for a date """
+        start = self.start
+        match self.precision:
+            case "year":
+                return start.replace(year=start.year + 1) if start.year < 9999 else datetime.max.replace(tzinfo=start.tzinfo)
+            case "month":
+                return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+            case "day":
+                return start + timedelta(days=1)
+            case _:
+                return start + (timedelta(microseconds=1) if self.fraction else timedelta(seconds=1))
+
+    def overlaps(self, other: "PartialDateTime") -> bool:
+        return self.start < other.end and other.start < self.end
+
+    def contains(self, moment: "datetime | PartialDateTime") -> bool:
+        if isinstance(moment, PartialDateTime):
+            return self.start <= moment.start and moment.end <= self.end
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return self.start <= moment < self.end
+
+    def sort_key(self) -> Tuple[datetime, int]:
+        return self.start, PRECISION_RANK[self.precision]
+
+    def __eq__(self, other: Any):
+        if not isinstance(other, PartialDateTime):
+            return NotImplemented
+        return self.sort_key() == other.sort_key()
+
+    def __hash__(self):
+        value = self._hash
+        if value is None:
+            value = hash(self.sort_key())
+            object.__setattr__(self, "_hash", value)
+        return value
+
+    def __lt__(self, other: "PartialDateTime"):
+        return self.sort_key() < other.sort_key()
+
+    def __le__(self, other: "PartialDateTime"):
+        return self.sort_key() <= other.sort_key()
+
+    def __gt__(self, other: "PartialDateTime"):
+        return self.sort_key() > other.sort_key()
+
+    def __ge__(self, other: "PartialDateTime"):
+        return self.sort_key() >= other.sort_key()
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        from_text = core_schema.no_info_plain_validator_function(lambda value: parse_value(cls, value))
+        return core_schema.json_or_python_schema(
+            json_schema=from_text,
+            python_schema=core_schema.union_schema([core_schema.is_instance_schema(cls), from_text]),
+            serialization=core_schema.to_string_ser_schema(),
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, schema: core_schema.CoreSchema, handler: Callable[[Any], Any]) -> Any:
+        return {"type": "string", "format": cls.kind}
+
+
+class FHIRDate(PartialDateTime):
+    allow_time: ClassVar[bool] = False
+    kind: ClassVar[str] = "date"
+
+class FHIRDateTime(PartialDateTime):
+    kind: ClassVar[str] = "dateTime"
+
+class FHIRInstant(PartialDateTime):
+    require_time: ClassVar[bool] = True
+    kind: ClassVar[str] = "instant"
+
+
+def _parse_cached(cls: type[PartialDateTime], text: str) -> PartialDateTime:
+    return cls(text)
+
+_parse = lru_cache(maxsize=DATE_CACHE_SIZE)(_parse_cached)
+
+def set_date_cache_size(maxsize: int | None):
+    """ Resize the cache of parsed values (0 disables it, None makes it unbounded) """
+    global _parse
+    _parse = lru_cache(maxsize=maxsize)(_parse_cached) if maxsize != 0 else _parse_cached
+
+def parse_value(cls: type[PartialDateTime], value: Any) -> PartialDateTime:
+    if not isinstance(value, str):
+        raise PydanticCustomError(f"fhir_{cls.kind}", "Input should be a FHIR {kind} string", {"kind": cls.kind})
+    try:
+        return _parse(cls, value)
+    except ValueError as exc:
+        raise PydanticCustomError(f"fhir_{cls.kind}", str(exc)) from None
@@ -0,0 +1,115 @@
+
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Literal, NamedTuple, Sequence, Type, TypeVar
+
+from pydantic_fhir_extensions.element import ELEMENT_TYPES, BaseElement
+
+ElementT = TypeVar("ElementT", bound=BaseElement)
+
+Operation = Literal["add", "remove", "replace"]
+
+
+class Change(NamedTuple):
+    """ One JSON Patch (RFC 6902) operation on the `model_dump_fhir` form, `path` is a JSON pointer """
+    op: Operation
+    path: str
+    value: Any = None
+
+    def to_json_patch(self) -> Dict[str, Any]:
+        if self.op == "remove":
+            return {"op": self.op, "path": self.path}
+        return {"op": self.op, "path": self.path, "value": self.value}
+
+
+def escape_pointer(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+def unescape_pointer(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff(old: BaseElement, new: BaseElement) -> List[Change]:
+    """ The changes that turn the FHIR form of `old` into the one of `new`
+
+    Subtrees with the same content hash are skipped without being compared. Lists of elements are aligned on
+    the content hashes of their items, so inserting or removing an item yields a single add or remove.
+    """
+    changes: List[Change] = []
+    # bring both trees up to date once, then compare the cached digests and fragments
+    old.content_hash()
+    new.content_hash()
+    diff_elements(old, new, "", changes)
+    return changes
+
+
+def diff_elements(old: BaseElement, new: BaseElement, path: str, changes: List[Change]):
+    if old.get_content_digest() == new.get_content_digest():
+        return
+    old_fragment, new_fragment = old.get_rendered_fragment(), new.get_rendered_fragment()
+    old_children, new_children = dict(old.iter_child_fields()), dict(new.iter_child_fields())
+    for key, old_value in old_fragment.items():
+        if key not in new_fragment:
+            changes.append(Change("remove", f"{path}/{escape_pointer(key)}"))
+    for key, new_value in new_fragment.items():
+        key_path = f"{path}/{escape_pointer(key)}"
+        if key not in old_fragment:
+            changes.append(Change("add", key_path, new_value))
+            continue
+        old_child, new_child = old_children.get(key), new_children.get(key)
+        if type(old_child) in ELEMENT_TYPES and type(new_child) in ELEMENT_TYPES:
+            diff_elements(old_child, new_child, key_path, changes)
+        elif old_child is not None and new_child is not None and type(old_child) not in ELEMENT_TYPES and type(new_child) not in ELEMENT_TYPES:
+            diff_element_lists(old_child, new_child, key_path, changes)
+        elif old_fragment[key] != new_value:
+            changes.append(Change("replace", key_path, new_value))
+
+
+def diff_element_lists(old: Sequence[BaseElement], new: Sequence[BaseElement], path: str, changes: List[Change]):
+    old_hashes = [element.get_content_digest() for element in old]
+    new_hashes = [element.get_content_digest() for element in new]
+    matcher = SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    # the changes apply in order: everything before `new_start` already has the new layout
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        paired = min(old_end - old_start, new_end - new_start)
+        for offset in range(paired):
+            diff_elements(old[old_start + offset], new[new_start + offset], f"{path}/{new_start + offset}", changes)
+        for _ in range(old_end - old_start - paired):
+            changes.append(Change("remove", f"{path}/{new_start + paired}"))
+        for index in range(new_start + paired, new_end):
+            changes.append(Change("add", f"{path}/{index}", new[index].get_rendered_fragment()))
+
+
+def apply_patch(data: Dict[str, Any], changes: Sequence[Change]) -> Dict[str, Any]:
+    """ Apply the changes to FHIR data without mutating it: only the containers along the changed paths are copied """
+    root: Any = {**data}
+    copied = {id(root)}
+    for change in changes:
+        tokens = [unescape_pointer(token) for token in change.path.split("/")[1:]]
+        if not tokens:
+            raise ValueError("Patching the document root is not supported")
+        parent = root
+        for token in tokens[:-1]:
+            key: Any = int(token) if isinstance(parent, list) else token
+            child = parent[key]
+            if id(child) not in copied:
+                child = parent[key] = [*child] if isinstance(child, list) else {**child}
+                copied.add(id(child))
+            parent = child
+        key = int(tokens[-1]) if isinstance(parent, list) else tokens[-1]
+        match change.op:
+            case "add" if isinstance(parent, list):
+                parent.insert(key, change.value)
+            case "add" | "replace":
+                parent[key] = change.value
+            case "remove":
+                del parent[key]
+            case _:
+                raise ValueError(f"Unsupported patch operation `{change.op}`")
+    return root
+
+
+def patch(element: ElementT, changes: Sequence[Change], model: Type[ElementT] | None = None) -> ElementT:
+    """ Validate the FHIR form of `element` with the changes applied """
+    return (model or type(element)).model_validate(apply_patch(element.model_dump_fhir(incremental=True), changes))
@@ -1,49 +1,317 @@
 
-from itertools import filterfalse
-from typing import Any, List, Sequence
-from pydantic import BaseModel, SerializationInfo, field_serializer, model_serializer
+import hashlib
+import json
+from operator import is_
+from typing import Any, ClassVar, Dict, FrozenSet, Iterable, Iterator, List, Self, Sequence, Tuple
+from pydantic import SerializationInfo, SerializerFunctionWrapHandler, ValidationInfo, field_serializer, model_serializer, model_validator
 from pydantic import Field
 from pydantic.json_schema import SkipJsonSchema
+from pydantic_core import to_json
 
-from pydantic_fhir_extensions.base import BaseExtension
-from pydantic_fhir_extensions.extensions.validator import find_extension_validator
-from pydantic_fhir_extensions.util import is_serialization_to_fhir
+from pydantic_fhir_extensions import profiling
+from pydantic_fhir_extensions.base import DEFERRED_CONFIG, FREEZABLE_TYPES, Extension, FreezableModel, FrozenList, RawExtension, add_owner, build_extension_schemas, extension_schemas_built
+from pydantic_fhir_extensions.construct import construct
+from pydantic_fhir_extensions.extensions.validator import DeferredExtension, ExtensionBucket, ExtensionProperty, ExtensionValidator, find_extension_validator, get_extension_url, partition_extensions
+from pydantic_fhir_extensions.util import is_passthrough, is_serialization_to_fhir
 
+FHIR_CONTEXT = {"fhir": True}
 
-class BaseElement(BaseModel):
-    extension: SkipJsonSchema[Sequence["BaseExtension"]] = Field(default_factory=list)
+# exact types of the elements: much cheaper than isinstance on a pydantic model class in the incremental dumps
+ELEMENT_TYPES: set[type] = set()
+
+
+class FragmentCache:
+    """ The FHIR fragment rendered for an element, valid as long as its field values are the same objects """
+    __slots__ = ("refs", "shape", "fragment", "digest")
+
+    def __init__(self, refs: Tuple[Any, ...], shape: Tuple[int, ...], fragment: Dict[str, Any] | None = None):
+        self.refs = refs
+        self.shape = shape
+        self.fragment = fragment
+        self.digest: str | None = None
+
+    def matches(self, refs: Tuple[Any, ...], shape: Tuple[int, ...]) -> bool:
+        return shape == self.shape and len(refs) == len(self.refs) and all(map(is_, refs, self.refs))
+
+
+class BaseElement(FreezableModel):
+    model_config = DEFERRED_CONFIG
+    # state of the incremental dumps, not copied nor pickled: a copy starts without cached fragments. Weak
+    # references let the models an element renders point back to it, see `adopt_values`
+    __slots__ = ("__fhir_cache__", "__weakref__")
+
+    # per-class index of the extension-backed fields, built once in `__pydantic_init_subclass__`
+    __extension_fields__: ClassVar[Dict[str, ExtensionValidator]] = {}
+    __extension_urls__: ClassVar[FrozenSet[str]] = frozenset()
+    __extension_dispatch__: ClassVar[Dict[str, str]] = {}
+    __fhir_exclude__: ClassVar[FrozenSet[str]] = frozenset()
+
+    extension: SkipJsonSchema[Sequence[Extension]] = Field(default_factory=list)
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any):
+        super().__pydantic_init_subclass__(**kwargs)
+        ELEMENT_TYPES.add(cls)
+        cls.build_extension_index()
+
+    @classmethod
+    def build_extension_index(cls):
+        """ Index the extension-backed fields of this class """
+        extension_fields: Dict[str, ExtensionValidator] = {}
+        for field_name, field_info in cls.model_fields.items():
+            maybe_ext_validator = find_extension_validator(field_info.metadata)
+            if maybe_ext_validator is not None:
+                extension_fields[field_name] = maybe_ext_validator
+        cls.__extension_fields__ = extension_fields
+        cls.__extension_urls__ = frozenset(ext_validator.url for ext_validator in extension_fields.values())
+        cls.__extension_dispatch__ = {ext_validator.url: field_name for field_name, ext_validator in extension_fields.items()}
+        cls.__fhir_exclude__ = frozenset(extension_fields)
+        for field_name in extension_fields:
+            setattr(cls, field_name, ExtensionProperty(field_name))
+
+    def materialize_extensions(self):
+        """ Lift the extension-backed fields that were deferred by validating with `context={"lazy": True}` """
+        for field_name in self.__extension_fields__:
+            value = self.__dict__.get(field_name)
+            if type(value) is DeferredExtension:
+                self.__dict__[field_name] = value.materialize()
+
+    @classmethod
+    def model_construct_trusted(cls, data:Dict[str, Any]) -> Self:
+        """ Build from trusted FHIR data, e.g. read back from our own store, without validation
+
+        Nested elements are constructed recursively and the extension-backed fields are still lifted by the
+        `to_property_value` of their extension type, so the `model_dump_fhir` output is the same as for a
+        validated instance. Nothing is checked: use `model_validate` for any data that was not produced by us.
+        """
+        return construct(cls, data)
+
+    def validate_raw_extensions(self, context:Dict[str, Any] | None = None):
+        """ Validate the extensions of this element that were kept raw in passthrough mode, in place """
+        if any(type(item) is RawExtension for item in self.extension):
+            self.extension = [item.validate(context) if type(item) is RawExtension else item for item in self.extension]
+
+    def freeze(self):
+        """ Make this element and everything it holds read-only, e.g. to share a cached instance """
+        if self.__extension_fields__:
+            self.materialize_extensions()
+        super().freeze()
+
+    def __getstate__(self):
+        self.materialize_extensions()
+        return super().__getstate__()
+
+    def __eq__(self, other:Any):
+        if isinstance(other, BaseElement):
+            self.materialize_extensions()
+            other.materialize_extensions()
+        return super().__eq__(other)
+
+    @model_validator(mode="before")
+    @classmethod
+    def dispatch_extensions(cls, data:Any, info:ValidationInfo):
+        """ Hand the extensions of each owned url to the field that lifts them, and in passthrough mode
+        keep the others raw """
+        if not isinstance(data, dict):
+            return data
+        if is_passthrough(info) and data.get("extension"):
+            data = {**data, "extension": [
+                extension if get_extension_url(extension) in cls.__extension_urls__ else RawExtension.from_data(extension)
+                for extension in data["extension"]
+            ]}
+        if not cls.__extension_dispatch__:
+            return data
+        missing = {url: field_name for url, field_name in cls.__extension_dispatch__.items() if field_name not in data}
+        if not missing:
+            return data
+        profiler = profiling.PROFILER
+        if profiler is not None:
+            start = profiling.clock()
+        extensions = data.get("extension") or ()
+        buckets, _ = partition_extensions(extensions, cls.__extension_urls__)
+        if profiler is not None:
+            profiler.record(cls.__name__, None, "match", len(extensions), profiling.clock() - start)
+        data = {**data}
+        for url, field_name in missing.items():
+            data[field_name] = buckets.get(url, ExtensionBucket())
+        return data
 
     @field_serializer("extension", when_used="always")
-    def serialize_extension(self, value:List["BaseExtension"], info:SerializationInfo):
+    def serialize_extension(self, value:List[Extension], info:SerializationInfo):
+        # the list is serialized by the class serializer of each item: the generic extensions are only validated
+        # as part of their element, which does not build their classes
+        if not extension_schemas_built():
+            build_extension_schemas()
         to_fhir = is_serialization_to_fhir(info)
-        if not to_fhir:
+        if not to_fhir or not self.__extension_fields__:
             return value
-        extension:List[BaseExtension] = [*value]
-        for field_name, ext_validator in self.iter_extension_fields():
-            # remove attribute extensions from the list of extensions
-            extension = list(filterfalse(ext_validator.match, extension))
-        return extension
+        # replace attribute extensions by the lowered property values
+        model = type(self).__name__
+        profiler = profiling.PROFILER
+        if profiler is not None:
+            start = profiling.clock()
+        _, extension = partition_extensions(value, self.__extension_urls__)
+        if profiler is not None:
+            profiler.record(model, None, "match", len(value), profiling.clock() - start)
+        for field_name, ext_validator in self.__extension_fields__.items():
+            extension.extend(ext_validator.lower(getattr(self, field_name), model))
+        return extension or None
+
+    @model_serializer(mode="wrap")
+    def serialize_element(self, handler:SerializerFunctionWrapHandler, info:SerializationInfo):
+        if self.__extension_fields__:
+            self.materialize_extensions()
+        data = handler(self)
+        if not is_serialization_to_fhir(info) or not isinstance(data, dict):
+            return data
+        # one callback per element instead of one per field: drop the extension-backed fields
+        # (only excluded up front for the root element) and the empty collections
+        return {
+            key: value for key, value in data.items()
+            if value is not None and key not in self.__fhir_exclude__ and not is_empty_sequence(value)
+        }
 
     @classmethod
     def iter_extension_fields(cls):
         """ Iterate over the fields that are extensions """
-        for field_name, field_info in cls.model_fields.items():
-            maybe_ext_validator = find_extension_validator(field_info.metadata)
-            if maybe_ext_validator is not None:
-                yield field_name, maybe_ext_validator
+        yield from cls.__extension_fields__.items()
 
-    def model_dump_fhir(self):
-        exclude_fields = {field_name for field_name, _ in self.iter_extension_fields()}
-        return self.model_dump(mode="json", context={"fhir":True}, exclude_none=True, exclude=exclude_fields)
+    def model_dump_fhir(self, incremental:bool = False):
+        """ Serialize to FHIR JSON-compatible data
 
-    @field_serializer("*", when_used="always")
-    def serialize_fhir(self, value:Any, info:SerializationInfo):
-        to_fhir = is_serialization_to_fhir(info)
-        if to_fhir and is_empty_sequence(value):
-            return None
-        return value
+        With `incremental`, only the elements that changed since the previous incremental dump are rendered
+        again; the result shares the cached fragments of the others and must not be mutated.
+        """
+        if incremental:
+            return self.render_fragment()
+        return self.model_dump(mode="json", context=FHIR_CONTEXT, exclude_none=True, exclude=set(self.__fhir_exclude__))
+
+    def model_dump_fhir_json(self, indent:int | None = None, incremental:bool = False) -> bytes:
+        """ Serialize to FHIR JSON bytes directly in pydantic-core, without building the `model_dump_fhir` dict """
+        if incremental:
+            return to_json(self.render_fragment(), indent=indent)
+        return self.__pydantic_serializer__.to_json(self, indent=indent, context=FHIR_CONTEXT, exclude_none=True, exclude=set(self.__fhir_exclude__))
+
+    def get_fragment_refs(self) -> Tuple[Tuple[Any, ...], Tuple[int, ...]]:
+        """ The field values and list items a fragment is rendered from, and the list lengths """
+        refs: List[Any] = []
+        shape: List[int] = []
+        for value in self.__dict__.values():
+            refs.append(value)
+            if isinstance(value, (list, tuple)):
+                refs.extend(value)
+                shape.append(len(value))
+        return tuple(refs), tuple(shape)
+
+    def is_unchanged(self) -> bool:
+        """ Whether this element and its descendants hold the same values as at the previous check """
+        unchanged = True
+        for value in self.__dict__.values():
+            for child in iter_elements(value):
+                unchanged = child.is_unchanged() and unchanged
+        refs, shape = self.get_fragment_refs()
+        cache = getattr(self, "__fhir_cache__", None)
+        if cache is not None and cache.matches(refs, shape):
+            return unchanged
+        object.__setattr__(self, "__fhir_cache__", FragmentCache(refs, shape))
+        adopt_values(self, self.__dict__.values())
+        return False
+
+    def render_fragment(self) -> Dict[str, Any]:
+        """ The `model_dump_fhir` data of this element, rendered again only when it or a descendant changed
+
+        A change is a field assignment or an in-place edit of a list field, or a field assignment in a model
+        held by the element, like the Coding of an extension-backed property. Call `mark_dirty` after any other
+        in-place edit, e.g. of a list held by such a model or of a raw extension dict.
+        """
+        if self.__extension_fields__:
+            self.materialize_extensions()
+        cache = getattr(self, "__fhir_cache__", None)
+        unchanged = cache is not None and cache.fragment is not None
+        for field_name in self.__fhir_exclude__:
+            # lowered into `extension` by this element: only look for changes
+            for child in iter_elements(self.__dict__.get(field_name)):
+                unchanged = child.is_unchanged() and unchanged
+        children: Dict[str, Any] = {
+            field_name: value.render_fragment() if type(value) in ELEMENT_TYPES else [child.render_fragment() for child in value]
+            for field_name, value in self.iter_child_fields()
+        }
+        refs, shape = self.get_fragment_refs()
+        if unchanged and cache.matches(refs, shape) and all(is_same_fragment(rendered, cache.fragment.get(field_name)) for field_name, rendered in children.items()):
+            return cache.fragment
+        data = self.model_dump(mode="json", context=FHIR_CONTEXT, exclude_none=True, exclude=self.__fhir_exclude__ | children.keys())
+        # keep the field order of a full dump
+        fragment = {
+            field_name: children[field_name] if field_name in children else data[field_name]
+            for field_name in self.model_fields if field_name in children or field_name in data
+        }
+        object.__setattr__(self, "__fhir_cache__", FragmentCache(refs, shape, fragment))
+        adopt_values(self, self.__dict__.values())
+        return fragment
+
+    def iter_child_fields(self) -> Iterator[Tuple[str, Any]]:
+        """ The fields rendered as nested elements: an element or a non-empty list of elements """
+        for field_name, value in self.__dict__.items():
+            if field_name in self.__fhir_exclude__:
+                continue
+            if type(value) in ELEMENT_TYPES or (isinstance(value, (list, tuple)) and value and all(type(child) in ELEMENT_TYPES for child in value)):
+                yield field_name, value
+
+    def content_hash(self) -> str:
+        """ Merkle hash of the `model_dump_fhir` form: equal for equal content, whatever order or form
+        the extensions had in the input. Cached per element next to the incremental dump fragments. """
+        self.render_fragment()
+        return self.get_content_digest()
+
+    def get_rendered_fragment(self) -> Dict[str, Any]:
+        """ The fragment of the last `render_fragment` call, without checking for changes since """
+        return self.__fhir_cache__.fragment
+
+    def get_content_digest(self) -> str:
+        """ The content hash as of the last `render_fragment` call """
+        cache: FragmentCache = self.__fhir_cache__
+        if cache.digest is None:
+            # nested elements contribute their own digest, so an unchanged subtree is never hashed again
+            canonical = {**cache.fragment}
+            for field_name, value in self.iter_child_fields():
+                canonical[field_name] = value.get_content_digest() if type(value) in ELEMENT_TYPES else [child.get_content_digest() for child in value]
+            encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+            cache.digest = hashlib.sha256(encoded).hexdigest()
+        return cache.digest
+
+    def mark_dirty(self):
+        """ Render this element, and so its ancestors, again on the next incremental dump """
+        object.__setattr__(self, "__fhir_cache__", None)
+
+def adopt_values(owner:BaseElement, values:Iterable[Any]):
+    """ Make `owner` the element rendered again when a field of a model it holds, that is not an element
+    itself (e.g. a Coding), is assigned. Nested elements adopt their own values when they are rendered. """
+    for value in values:
+        value_type = type(value)
+        if value_type in FREEZABLE_TYPES:
+            if value_type not in ELEMENT_TYPES and add_owner(value, owner):
+                adopt_values(owner, value.__dict__.values())
+        elif value_type is list or value_type is FrozenList or value_type is tuple:
+            for item in value:
+                item_type = type(item)
+                if item_type in FREEZABLE_TYPES and item_type not in ELEMENT_TYPES and add_owner(item, owner):
+                    adopt_values(owner, item.__dict__.values())
+
+def iter_elements(value:Any):
+    """ The elements held by a field value: the value itself or the items of a list """
+    if type(value) in ELEMENT_TYPES:
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for child in value:
+            if type(child) in ELEMENT_TYPES:
+                yield child
+
+def is_same_fragment(rendered:Any, cached:Any)->bool:
+    if isinstance(rendered, list):
+        return isinstance(cached, list) and len(rendered) == len(cached) and all(map(is_, rendered, cached))
+    return rendered is cached
 
 def is_empty_sequence(value:Any)->bool:
-    if isinstance(value, (tuple, list, set)) and len(value):
+    if isinstance(value, (tuple, list, set)) and not len(value):
         return True
     return False
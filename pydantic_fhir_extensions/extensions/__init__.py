@@ -1,7 +1,27 @@
-from pydantic_fhir_extensions.extensions.toggle_exclusive import ExtAnswerOptionsToggleExpression
-from pydantic_fhir_extensions.extensions.item_control import ExtItemControl
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from pydantic_fhir_extensions.extensions.toggle_exclusive import ExtAnswerOptionsToggleExpression
+    from pydantic_fhir_extensions.extensions.item_control import ExtItemControl
+
+# exports are imported on first access: a worker only pays for the extension modules it uses
+_EXPORTS = {
+    "ExtItemControl": "pydantic_fhir_extensions.extensions.item_control",
+    "ExtAnswerOptionsToggleExpression": "pydantic_fhir_extensions.extensions.toggle_exclusive",
+}
 
 __all__ = [
     "ExtItemControl",
     "ExtAnswerOptionsToggleExpression",
 ]
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = getattr(import_module(module), name)
+    return value
+
+def __dir__():
+    return sorted({*globals(), *__all__})
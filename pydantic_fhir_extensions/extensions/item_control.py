@@ -1,101 +1,69 @@
 
-from typing import List, Literal, Self, Sequence
-from pydantic import Field, ValidationInfo, field_validator
+from functools import lru_cache
+from typing import List, Literal, Self
+from pydantic import Field, ValidationInfo, model_validator
 
 from pydantic_fhir_extensions.element import BaseElement
-from pydantic_fhir_extensions.base import Coding
-from pydantic_fhir_extensions.extensions.validator import ValidateableExtension
+from pydantic_fhir_extensions.base import Coding, FrozenCoding, intern_coding
+from pydantic_fhir_extensions.terminology import TERMINOLOGY, Binding
 
 
+TIRO_ITEM_CONTROL_SYSTEM = "http://tiro.health/fhir/CodeSystem/tiro-questionnaire-item-control"
+TIRO_ITEM_CONTROL_VALUE_SET = "http://tiro.health/fhir/ValueSet/tiro-questionnaire-item-control"
+SDC_ITEM_CONTROL_SYSTEM = "http://hl7.org/fhir/StructureDefinition/questionnaire-itemControl"
+
+TIRO_ITEM_CONTROL_CODES = TERMINOLOGY.add_code_system({
+    "resourceType": "CodeSystem",
+    "url": TIRO_ITEM_CONTROL_SYSTEM,
+    "content": "complete",
+    "concept": [
+        {"code": "text", "display": "Text"},
+        {"code": "radio", "display": "Radio"},
+        {"code": "checkbox", "display": "Checkbox"},
+        {"code": "dropdown", "display": "Dropdown"},
+        {"code": "text-area", "display": "Text Area"},
+    ],
+})
+TERMINOLOGY.add({
+    "resourceType": "ValueSet",
+    "url": TIRO_ITEM_CONTROL_VALUE_SET,
+    "compose": {"include": [{"system": TIRO_ITEM_CONTROL_SYSTEM}]},
+})
+
+ITEM_CONTROL_BINDING = Binding(TIRO_ITEM_CONTROL_VALUE_SET)
+
 class ItemControlCodeableConcept(BaseElement):
     text: str
     coding: List[Coding] = Field(default_factory=list, min_length=1)
 
-    @field_validator("coding")
-    @classmethod
-    def at_least_answer_control_code(cls, v: Sequence[Coding], info:ValidationInfo):
-        assert any(
-            coding.system == TIRO_ITEM_CONTROL_SYSTEM
-            for coding in v
-        ), "At least one coding must be from the TIRO answer control system"
-        return v
-TIRO_ITEM_CONTROL_SYSTEM = "http://tiro.health/fhir/CodeSystem/tiro-questionnaire-item-control"
-SDC_ITEM_CONTROL_SYSTEM = "http://hl7.org/fhir/StructureDefinition/questionnaire-itemControl"
-
-TiroItemControl = Literal["text", "radio", "checkbox", "dropdown", "text-area"]
+    @model_validator(mode="after")
+    def at_least_answer_control_code(self, info:ValidationInfo):
+        # at least one coding must be a Tiro.health item control
+        return ITEM_CONTROL_BINDING.check(self, info)
 
 def map_item_control_coding_to_codeable_concept(code:str) -> ItemControlCodeableConcept:
     """ Map an item control coding to a codeable concept """
+    display = TIRO_ITEM_CONTROL_CODES.get_display(code)
+    if display is None:
+        raise ValueError(f"Item control code `{code}` not recognized")
+    return ItemControlCodeableConcept(text=display, coding=[Coding(system=TIRO_ITEM_CONTROL_SYSTEM, code=code, display=display)])
 
-    match code:
-        case "text":
-            return ItemControlCodeableConcept(
-                text="Text",
-                coding=[
-                    Coding(
-                        system=TIRO_ITEM_CONTROL_SYSTEM,
-                        code="text",
-                        display="Text"
-                    )
-                ]
-            )
-        case "radio":
-            return ItemControlCodeableConcept(
-                text="Radio",
-                coding=[
-                    Coding(
-                        system=TIRO_ITEM_CONTROL_SYSTEM,
-                        code="radio",
-                        display="Radio"
-                    )
-                ],
-            )
-        case "checkbox":
-            return ItemControlCodeableConcept(
-                text="Checkbox",
-                coding=[
-                    Coding(
-                        system=TIRO_ITEM_CONTROL_SYSTEM,
-                        code="checkbox",
-                        display="Checkbox"
-                    )
-                ],
-            )
-        case "dropdown":
-            return ItemControlCodeableConcept(
-                text="Dropdown",
-                coding=[
-                    Coding(
-                        system=TIRO_ITEM_CONTROL_SYSTEM,
-                        code="dropdown",
-                        display="Dropdown"
-                    )
-                ],
-            )
-        case "text-area":
-            return ItemControlCodeableConcept(
-                text="Text Area",
-                coding=[
-                    Coding(
-                        system=TIRO_ITEM_CONTROL_SYSTEM,
-                        code="text-area",
-                        display="Text Area"
-                    )
-                ],
-            )
-        case _:
-            raise ValueError(f"Item control code `{code}` not recognized")
 
-    raise ValueError('No item control code found')
+@lru_cache(maxsize=None)
+def interned_item_control_codeable_concept(code:str) -> ItemControlCodeableConcept:
+    """ Shared codeable concept for an item control code, with interned codings. Do not mutate. """
+    concept = map_item_control_coding_to_codeable_concept(code)
+    concept.coding = [intern_coding(coding) for coding in concept.coding]
+    return concept
 
 
-def map_item_control_codeable_concept_to_coding(concept: ItemControlCodeableConcept) -> str:
+def map_item_control_codeable_concept_to_coding(concept: ItemControlCodeableConcept) -> Coding:
     """ Extract the Tiro.health item control coding from a codeable concept """
 
     for coding in concept.coding:
         match coding:
-            case Coding(system="http://tiro.health/fhir/CodeSystem/tiro-questionnaire-item-control", code=code, display=_):
-                return code
+            case Coding(system="http://tiro.health/fhir/CodeSystem/tiro-questionnaire-item-control"):
+                return coding
     raise ValueError('No item control code found')
 
 class ExtItemControl(BaseElement):
@@ -108,5 +76,9 @@ class ExtItemControl(BaseElement):
         return map_item_control_codeable_concept_to_coding(extensions[0].valueCodeableConcept)
 
     @classmethod
-    def from_property_value(cls, value:str):
-        yield cls(valueCodeableConcept=map_item_control_coding_to_codeable_concept(value))
+    def from_property_value(cls, value:Coding):
+        if isinstance(value, FrozenCoding):
+            # the property was validated with interning: reuse the shared concept as well
+            yield cls(valueCodeableConcept=interned_item_control_codeable_concept(value.code))
+            return
+        yield cls(valueCodeableConcept=map_item_control_coding_to_codeable_concept(value.code))
@@ -0,0 +1,182 @@
+
+from dataclasses import dataclass
+from typing import Any, Container, Dict, Iterable, List, Protocol, Self, Sequence, Tuple
+
+from pydantic import GetCoreSchemaHandler, ValidationInfo, ValidatorFunctionWrapHandler
+from pydantic_core import core_schema
+
+from pydantic_fhir_extensions import profiling
+from pydantic_fhir_extensions.util import is_lazy
+
+
+class ValidateableExtension(Protocol):
+    """ An extension model that can be lifted to and lowered from a Python property """
+    url: str
+
+    @classmethod
+    def model_validate(cls, obj: Any, *, strict: bool | None = None, from_attributes: bool | None = None, context: dict[str, Any] | None = None) -> Self:
+        ...
+
+    @classmethod
+    def to_property_value(cls, *extensions: Self) -> Any:
+        ...
+
+    @classmethod
+    def from_property_value(cls, value: Any) -> Iterable[Self]:
+        ...
+
+
+class _FromExtension:
+    """ Default of an extension-backed field: lift the value from the `extension` array """
+
+    def __repr__(self):
+        return "<from extension>"
+
+FROM_EXTENSION: Any = _FromExtension()
+
+
+class ExtensionBucket(List[Any]):
+    """ The extensions of a single url, ready to be lifted by the ExtensionValidator that owns the url """
+
+
+def get_extension_url(extension: Any) -> str | None:
+    if isinstance(extension, dict):
+        return extension.get("url")
+    return getattr(extension, "url", None)
+
+
+def partition_extensions(extensions: Iterable[Any], urls: Container[str]) -> Tuple[Dict[str, ExtensionBucket], List[Any]]:
+    """ Split the extensions in one pass into a bucket per owned url and a list of the remaining extensions """
+    buckets: Dict[str, ExtensionBucket] = {}
+    remaining: List[Any] = []
+    for extension in extensions:
+        url = get_extension_url(extension)
+        if url in urls:
+            bucket = buckets.get(url)
+            if bucket is None:
+                bucket = buckets[url] = ExtensionBucket()
+            bucket.append(extension)
+        else:
+            remaining.append(extension)
+    return buckets, remaining
+
+
+class DeferredExtension:
+    """ Placeholder for an extension-backed field validated in lazy mode, lifted on first access """
+    __slots__ = ("validator", "extensions", "context", "handler", "model")
+
+    def __init__(self, validator: "ExtensionValidator", extensions: Sequence[Any], context: dict[str, Any] | None, handler: ValidatorFunctionWrapHandler, model: str | None = None):
+        self.validator = validator
+        self.extensions = extensions
+        self.context = context
+        self.handler = handler
+        self.model = model
+
+    def __repr__(self):
+        return f"<deferred {self.validator.url}>"
+
+    def __deepcopy__(self, memo: dict[int, Any]) -> "DeferredExtension":
+        # the raw extensions are never mutated, a copied element can share the placeholder
+        return self
+
+    def materialize(self) -> Any:
+        return self.handler(self.validator.lift(self.extensions, self.context, self.model))
+
+
+class ExtensionProperty:
+    """ Data descriptor in front of an extension-backed field that materializes a deferred value once """
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, instance: Any, owner: Any = None) -> Any:
+        if instance is None:
+            # like any pydantic field, and keeps pydantic from taking the descriptor for a default
+            raise AttributeError(self.name)
+        try:
+            value = instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name) from None
+        if type(value) is DeferredExtension:
+            value = instance.__dict__[self.name] = value.materialize()
+        return value
+
+    def __set__(self, instance: Any, value: Any):
+        instance.__dict__[self.name] = value
+
+
+def get_model_name(info: ValidationInfo) -> str:
+    """ Name of the model being validated, as used in the profiling stats """
+    return (info.config or {}).get("title") or ""
+
+
+@dataclass(frozen=True)
+class ExtensionValidator:
+    """ Annotation that backs a field with the extensions of `extension_type` """
+    extension_type: type[ValidateableExtension]
+
+    @property
+    def url(self) -> str:
+        return self.extension_type.model_fields["url"].default
+
+    def match(self, extension: Any) -> bool:
+        return get_extension_url(extension) == self.url
+
+    def lift(self, extensions: Sequence[Any], context: dict[str, Any] | None = None, model: str | None = None) -> Any:
+        """ Validate the extensions of this url and convert them to the property value """
+        profiler = profiling.PROFILER
+        if profiler is not None:
+            start = profiling.clock()
+        matches = [
+            self.extension_type.model_validate(extension, from_attributes=not isinstance(extension, dict), context=context)
+            for extension in extensions
+        ]
+        value = self.extension_type.to_property_value(*matches)
+        if profiler is not None:
+            profiler.record(model or "", self.url, "lift", len(matches), profiling.clock() - start)
+        return value
+
+    def lower(self, value: Any, model: str | None = None) -> Iterable[ValidateableExtension]:
+        """ Convert the property value back to extensions """
+        if value is None:
+            return ()
+        profiler = profiling.PROFILER
+        if profiler is None:
+            return self.extension_type.from_property_value(value)
+        start = profiling.clock()
+        extensions = list(self.extension_type.from_property_value(value))
+        profiler.record(model or "", self.url, "lower", len(extensions), profiling.clock() - start)
+        return extensions
+
+    def validate(self, value: Any, handler: ValidatorFunctionWrapHandler, info: ValidationInfo) -> Any:
+        if value is FROM_EXTENSION:
+            profiler = profiling.PROFILER
+            if profiler is not None:
+                start = profiling.clock()
+            extensions = info.data.get("extension", ())
+            buckets, _ = partition_extensions(extensions, (self.url,))
+            value = buckets.get(self.url, ExtensionBucket())
+            if profiler is not None:
+                profiler.record(get_model_name(info), self.url, "match", len(extensions), profiling.clock() - start)
+        if isinstance(value, ExtensionBucket):
+            model = get_model_name(info) if profiling.PROFILER is not None else None
+            if is_lazy(info):
+                return DeferredExtension(self, value, info.context, handler, model)
+            value = self.lift(value, info.context, model)
+        return handler(value)
+
+    def __get_pydantic_core_schema__(self, source_type: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        return core_schema.with_default_schema(
+            core_schema.with_info_wrap_validator_function(self.validate, handler(source_type)),
+            default=FROM_EXTENSION,
+            validate_default=True,
+        )
+
+
+def find_extension_validator(metadata: Sequence[Any]) -> ExtensionValidator | None:
+    """ Find the extension validator in the metadata of a field """
+    for item in metadata:
+        if isinstance(item, ExtensionValidator):
+            return item
+    return None
@@ -0,0 +1,535 @@
+
+import re
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Tuple
+
+from pydantic import BaseModel
+
+from pydantic_fhir_extensions.base import Coding
+from pydantic_fhir_extensions.questionnaire import Questionnaire
+
+FHIRPATH_CACHE_SIZE = 1024
+
+
+class FHIRPathError(ValueError):
+    pass
+
+
+class Node:
+    """ A value in an evaluation collection, linked to the node it was navigated from """
+    __slots__ = ("value", "parent")
+
+    def __init__(self, value: Any, parent: "Node | None" = None):
+        self.value = value
+        self.parent = parent
+
+    def __repr__(self):
+        return f"Node({self.value!r})"
+
+
+Collection = List[Node]
+Env = Dict[str, Collection]
+Evaluator = Callable[[Collection, Env], Collection]
+
+
+# --- navigation ---
+
+def get_children(node: Node, name: str) -> Iterator[Node]:
+    value = node.value
+    if isinstance(value, Mapping):
+        child = value.get(name)
+        if child is None:
+            child = next((value[key] for key in value if is_choice_of(key, name)), None)
+    elif isinstance(value, BaseModel):
+        child = getattr(value, name, None) if name in type(value).model_fields else None
+        if child is None:
+            child = next((getattr(value, key) for key in value.model_fields_set if is_choice_of(key, name)), None)
+    else:
+        child = None
+    if child is None:
+        return
+    if isinstance(child, (list, tuple)):
+        for item in child:
+            if item is not None:
+                yield Node(item, node)
+    else:
+        yield Node(child, node)
+
+def is_choice_of(key: str, name: str) -> bool:
+    """ `valueCoding` is a choice of `value` (FHIR value[x]) """
+    return len(key) > len(name) and key.startswith(name) and key[len(name)].isupper()
+
+def get_resource_type(value: Any) -> str | None:
+    if isinstance(value, Mapping):
+        return value.get("resourceType")
+    return getattr(value, "resourceType", None)
+
+
+# --- values and comparison ---
+
+def plain(value: Any) -> Any:
+    if isinstance(value, BaseModel) and not isinstance(value, Coding):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, float):
+        return Decimal(str(value))
+    return value
+
+def values_equal(left: Collection, right: Collection) -> Collection:
+    if not left or not right:
+        return []
+    if len(left) != len(right):
+        return [Node(False)]
+    return [Node(all(plain(a.value) == plain(b.value) for a, b in zip(left, right)))]
+
+def singleton(collection: Collection, what: str = "value") -> Any:
+    if len(collection) > 1:
+        raise FHIRPathError(f"Expected a single {what}, got {len(collection)} items")
+    return collection[0].value if collection else None
+
+def to_boolean(collection: Collection) -> bool | None:
+    """ FHIRPath singleton evaluation of collections as booleans """
+    if not collection:
+        return None
+    if len(collection) == 1:
+        value = collection[0].value
+        return value if isinstance(value, bool) else True
+    raise FHIRPathError(f"Expected a single boolean, got {len(collection)} items")
+
+def boolean(value: bool | None) -> Collection:
+    return [] if value is None else [Node(value)]
+
+
+# --- tokenizer ---
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<ws>\s+|//[^\n]*|/\*.*?\*/)
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<string>'(?:[^'\\]|\\.)*')
+    |(?P<parent>\.\./?)
+    |(?P<variable>%(?:[A-Za-z_][A-Za-z0-9_]*|`[^`]*`|'[^']*'))
+    |(?P<special>\$(?:this|index|total))
+    |(?P<identifier>[A-Za-z_][A-Za-z0-9_]*|`[^`]*`)
+    |(?P<operator><=|>=|!=|!~|[=~<>|+\-*/&()\[\].,{}])
+""", re.VERBOSE | re.DOTALL)
+
+Token = Tuple[str, str]
+
+def tokenize(expression: str) -> List[Token]:
+    tokens: List[Token] = []
+    pos = 0
+    while pos < len(expression):
+        match = TOKEN_PATTERN.match(expression, pos)
+        if match is None:
+            raise FHIRPathError(f"Unexpected character `{expression[pos]}` at {pos} in `{expression}`")
+        kind = match.lastgroup
+        assert kind is not None
+        if kind != "ws":
+            tokens.append((kind, match.group()))
+        pos = match.end()
+    tokens.append(("end", ""))
+    return tokens
+
+def unescape(text: str) -> str:
+    return re.sub(r"\\(.)", lambda match: {"n": "\n", "t": "\t", "r": "\r", "f": "\f"}.get(match.group(1), match.group(1)), text[1:-1])
+
+
+# --- functions ---
+
+FunctionImpl = Callable[[Collection, List[Evaluator], Env], Collection]
+
+def each(focus: Collection, criteria: Evaluator, env: Env) -> Iterator[Tuple[Node, Collection]]:
+    for index, node in enumerate(focus):
+        yield node, criteria([node], {**env, "$this": [node], "$index": [Node(index)]})
+
+def fn_where(focus: Collection, args: List[Evaluator], env: Env) -> Collection:
+    return [node for node, result in each(focus, args[0], env) if to_boolean(result)]
+
+def fn_select(focus: Collection, args: List[Evaluator], env: Env) -> Collection:
+    return [item for _, result in each(focus, args[0], env) for item in result]
+
+def fn_exists(focus: Collection, args: List[Evaluator], env: Env) -> Collection:
+    if args:
+        focus = fn_where(focus, args, env)
+    return [Node(bool(focus))]
+
+def fn_all(focus: Collection, args: List[Evaluator], env: Env) -> Collection:
+    return [Node(all(to_boolean(result) for _, result in each(focus, args[0], env)))]
+
+def fn_not(focus: Collection, args: List[Evaluator], env: Env) -> Collection:
+    value = to_boolean(focus)
+    return boolean(None if value is None else not value)
+
+def fn_iif(focus: Collection, args: List[Evaluator], env: Env) -> Collection:
+    if to_boolean(args[0](focus, env)):
+        return args[1](focus, env)
+    return args[2](focus, env) if len(args) > 2 else []
+
+def fn_distinct(focus: Collection, args: List[Evaluator], env: Env) -> Collection:
+    result: Collection = []
+    for node in focus:
+        if not any(plain(node.value) == plain(seen.value) for seen in result):
+            result.append(node)
+    return result
+
+def fn_parent(focus: Collection, args: List[Evaluator], env: Env) -> Collection:
+    return [node.parent for node in focus if node.parent is not None]
+
+FUNCTIONS: Dict[str, FunctionImpl] = {
+    "where": fn_where,
+    "select": fn_select,
+    "exists": fn_exists,
+    "all": fn_all,
+    "not": fn_not,
+    "iif": fn_iif,
+    "distinct": fn_distinct,
+    "parent": fn_parent,
+    "empty": lambda focus, args, env: [Node(not focus)],
+    "count": lambda focus, args, env: [Node(len(focus))],
+    "first": lambda focus, args, env: focus[:1],
+    "last": lambda focus, args, env: focus[-1:],
+    "tail": lambda focus, args, env: focus[1:],
+    "single": lambda focus, args, env: focus[:1] if singleton(focus) is not None else [],
+    "hasValue": lambda focus, args, env: [Node(len(focus) == 1 and not isinstance(focus[0].value, (Mapping, BaseModel)))],
+    "allTrue": lambda focus, args, env: [Node(all(node.value is True for node in focus))],
+    "anyTrue": lambda focus, args, env: [Node(any(node.value is True for node in focus))],
+}
+
+# functions without parameters that are also written with the input as argument, e.g. `count(../answer)`
+ARGUMENT_AS_FOCUS = frozenset({"count", "empty", "first", "last", "tail", "single", "hasValue", "distinct", "not", "allTrue", "anyTrue"})
+
+
+# --- operators ---
+
+def compare(op: Callable[[Any, Any], bool]) -> Callable[[Collection, Collection], Collection]:
+    def apply(left: Collection, right: Collection) -> Collection:
+        a, b = singleton(left), singleton(right)
+        if a is None or b is None:
+            return []
+        try:
+            return [Node(op(plain(a), plain(b)))]
+        except TypeError:
+            raise FHIRPathError(f"Cannot compare {a!r} with {b!r}")
+    return apply
+
+def arithmetic(op: Callable[[Any, Any], Any]) -> Callable[[Collection, Collection], Collection]:
+    def apply(left: Collection, right: Collection) -> Collection:
+        a, b = singleton(left), singleton(right)
+        if a is None or b is None:
+            return []
+        try:
+            return [Node(op(plain(a), plain(b)))]
+        except ZeroDivisionError:
+            return []
+    return apply
+
+def truncated_div(a: Any, b: Any) -> int:
+    """ FHIRPath `div`: the quotient truncated toward zero, unlike Python's floor division """
+    if type(a) is int and type(b) is int:
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+    # Decimal integer division truncates toward zero
+    return int(Decimal(a) // Decimal(b))
+
+def truncated_mod(a: Any, b: Any) -> Any:
+    """ FHIRPath `mod`: the remainder of `div`, with the sign of the dividend """
+    if type(a) is int and type(b) is int:
+        return a - b * truncated_div(a, b)
+    return Decimal(a) % Decimal(b)
+
+def logical_and(left: Collection, right: Collection) -> Collection:
+    a, b = to_boolean(left), to_boolean(right)
+    if a is False or b is False:
+        return [Node(False)]
+    return [] if a is None or b is None else [Node(True)]
+
+def logical_or(left: Collection, right: Collection) -> Collection:
+    a, b = to_boolean(left), to_boolean(right)
+    if a is True or b is True:
+        return [Node(True)]
+    return [] if a is None or b is None else [Node(False)]
+
+def logical_xor(left: Collection, right: Collection) -> Collection:
+    a, b = to_boolean(left), to_boolean(right)
+    return [] if a is None or b is None else [Node(a != b)]
+
+def logical_implies(left: Collection, right: Collection) -> Collection:
+    a, b = to_boolean(left), to_boolean(right)
+    if a is False or b is True:
+        return [Node(True)]
+    return [] if a is None or b is None else [Node(False)]
+
+def membership(item: Collection, collection: Collection) -> Collection:
+    if not item:
+        return []
+    value = plain(singleton(item))
+    return [Node(any(plain(node.value) == value for node in collection))]
+
+def union(left: Collection, right: Collection) -> Collection:
+    return fn_distinct([*left, *right], [], {})
+
+def inequality(left: Collection, right: Collection) -> Collection:
+    result = values_equal(left, right)
+    return [Node(not result[0].value)] if result else []
+
+def concatenate(left: Collection, right: Collection) -> Collection:
+    return [Node(f"{singleton(left) or ''}{singleton(right) or ''}")]
+
+BINARY_OPERATORS: Dict[str, Tuple[int, Callable[[Collection, Collection], Collection]]] = {
+    "*": (9, arithmetic(lambda a, b: a * b)),
+    "/": (9, arithmetic(lambda a, b: Decimal(a) / Decimal(b))),
+    "div": (9, arithmetic(truncated_div)),
+    "mod": (9, arithmetic(truncated_mod)),
+    "+": (8, arithmetic(lambda a, b: a + b)),
+    "-": (8, arithmetic(lambda a, b: a - b)),
+    "&": (8, concatenate),
+    "|": (7, union),
+    "<": (6, compare(lambda a, b: a < b)),
+    "<=": (6, compare(lambda a, b: a <= b)),
+    ">": (6, compare(lambda a, b: a > b)),
+    ">=": (6, compare(lambda a, b: a >= b)),
+    "=": (5, values_equal),
+    "~": (5, values_equal),
+    "!=": (5, inequality),
+    "!~": (5, inequality),
+    "in": (4, membership),
+    "contains": (4, lambda left, right: membership(right, left)),
+    "and": (3, logical_and),
+    "xor": (2, logical_xor),
+    "or": (2, logical_or),
+    "implies": (1, logical_implies),
+}
+
+
+# --- parser / compiler ---
+
+class Compiler:
+    """ Recursive-descent parser that turns the expression directly into nested closures """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.pos = 0
+
+    def peek(self) -> Token:
+        return self.tokens[self.pos]
+
+    def next(self) -> Token:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expect(self, text: str):
+        kind, value = self.next()
+        if value != text:
+            raise FHIRPathError(f"Expected `{text}` but got `{value or kind}` in `{self.expression}`")
+
+    def compile(self) -> Evaluator:
+        evaluator = self.binary(0)
+        if self.peek()[0] != "end":
+            raise FHIRPathError(f"Unexpected `{self.peek()[1]}` in `{self.expression}`")
+        return evaluator
+
+    def binary(self, min_precedence: int) -> Evaluator:
+        left = self.unary()
+        while True:
+            kind, value = self.peek()
+            operator = BINARY_OPERATORS.get(value) if kind in ("operator", "identifier") else None
+            if operator is None or operator[0] < min_precedence:
+                return left
+            precedence, apply = operator
+            self.next()
+            right = self.binary(precedence + 1)
+            left = self.combine(left, right, apply)
+
+    @staticmethod
+    def combine(left: Evaluator, right: Evaluator, apply: Callable[[Collection, Collection], Collection]) -> Evaluator:
+        return lambda focus, env: apply(left(focus, env), right(focus, env))
+
+    def unary(self) -> Evaluator:
+        if self.peek()[1] in ("-", "+") and self.peek()[0] == "operator":
+            sign = self.next()[1]
+            operand = self.unary()
+            if sign == "+":
+                return operand
+            return self.combine(lambda focus, env: [Node(0)], operand, BINARY_OPERATORS["-"][1])
+        return self.postfix(self.term())
+
+    def postfix(self, evaluator: Evaluator) -> Evaluator:
+        while True:
+            kind, value = self.peek()
+            if value == ".":
+                self.next()
+                evaluator = self.invocation(evaluator)
+            elif value == "[":
+                self.next()
+                index = self.binary(0)
+                self.expect("]")
+                evaluator = self.indexer(evaluator, index)
+            elif kind == "parent":
+                self.next()
+                evaluator = self.parent(evaluator, value)
+            else:
+                return evaluator
+
+    @staticmethod
+    def indexer(evaluator: Evaluator, index: Evaluator) -> Evaluator:
+        def evaluate(focus: Collection, env: Env) -> Collection:
+            position = singleton(index(focus, env))
+            collection = evaluator(focus, env)
+            return collection[position:position + 1] if isinstance(position, int) and position >= 0 else []
+        return evaluate
+
+    def parent(self, evaluator: Evaluator, token: str) -> Evaluator:
+        """ `..` / `../name`: a non-standard parent step, used by the toggle expressions in the wild """
+        def evaluate(focus: Collection, env: Env) -> Collection:
+            return fn_parent(evaluator(focus, env), [], env)
+        if token == "../" and self.peek()[0] in ("identifier", "parent"):
+            if self.peek()[0] == "parent":
+                return self.parent(evaluate, self.next()[1])
+            return self.invocation(evaluate)
+        return evaluate
+
+    def term(self) -> Evaluator:
+        kind, value = self.next()
+        if kind == "number":
+            number = Decimal(value) if "." in value else int(value)
+            return lambda focus, env: [Node(number)]
+        if kind == "string":
+            text = unescape(value)
+            return lambda focus, env: [Node(text)]
+        if kind == "variable":
+            name = value[1:].strip("`'")
+            return lambda focus, env: env.get(f"%{name}", [])
+        if kind == "special":
+            return lambda focus, env: env.get(value, focus if value == "$this" else [])
+        if kind == "parent":
+            return self.parent(lambda focus, env: focus, value)
+        if value == "(":
+            evaluator = self.binary(0)
+            self.expect(")")
+            return evaluator
+        if value == "{":
+            self.expect("}")
+            return lambda focus, env: []
+        if kind == "identifier":
+            if value in ("true", "false"):
+                flag = value == "true"
+                return lambda focus, env: [Node(flag)]
+            self.pos -= 1
+            return self.invocation(lambda focus, env: focus, first=True)
+        raise FHIRPathError(f"Unexpected `{value or kind}` in `{self.expression}`")
+
+    def invocation(self, evaluator: Evaluator, first: bool = False) -> Evaluator:
+        kind, value = self.next()
+        if kind != "identifier":
+            raise FHIRPathError(f"Expected a name but got `{value or kind}` in `{self.expression}`")
+        name = value.strip("`")
+        if self.peek()[1] == "(":
+            self.next()
+            args: List[Evaluator] = []
+            if self.peek()[1] != ")":
+                args.append(self.binary(0))
+                while self.peek()[1] == ",":
+                    self.next()
+                    args.append(self.binary(0))
+            self.expect(")")
+            function = FUNCTIONS.get(name)
+            if function is None:
+                raise FHIRPathError(f"Function `{name}` is not supported in `{self.expression}`")
+            if name in ARGUMENT_AS_FOCUS and len(args) == 1:
+                # `count(answer)` is read as `answer.count()`
+                [argument] = args
+                return lambda focus, env: function(argument(evaluator(focus, env), env), [], env)
+            return lambda focus, env: function(evaluator(focus, env), args, env)
+
+        def navigate(focus: Collection, env: Env) -> Collection:
+            collection = evaluator(focus, env)
+            if first and name[:1].isupper():
+                # a leading type name, e.g. `QuestionnaireResponse.item`
+                typed = [node for node in collection if get_resource_type(node.value) == name]
+                if typed:
+                    return typed
+            return [child for node in collection for child in get_children(node, name)]
+        return navigate
+
+
+class CompiledExpression:
+    """ A FHIRPath expression compiled once into a reusable callable """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.evaluator = Compiler(expression).compile()
+
+    def __repr__(self):
+        return f"CompiledExpression({self.expression!r})"
+
+    def evaluate_nodes(self, context: Collection, env: Env) -> Collection:
+        return self.evaluator(context, {"$this": context, **env})
+
+    def __call__(self, resource: Any, context: Any = None, variables: Mapping[str, Any] | None = None) -> List[Any]:
+        """ Evaluate against `resource`, with `context` (default: the resource) as focus """
+        root = [Node(resource)]
+        focus = root if context is None else [Node(context)]
+        env: Env = {"%resource": root, "%rootResource": root, "%context": focus}
+        for name, value in (variables or {}).items():
+            env[f"%{name}"] = [Node(item) for item in (value if isinstance(value, list) else [value])]
+        return [node.value for node in self.evaluate_nodes(focus, env)]
+
+
+@lru_cache(maxsize=FHIRPATH_CACHE_SIZE)
+def compile_expression(expression: str) -> CompiledExpression:
+    """ Compile an expression, cached by its text """
+    return CompiledExpression(expression)
+
+
+def evaluate(expression: str, resource: Any, context: Any = None, variables: Mapping[str, Any] | None = None) -> List[Any]:
+    return compile_expression(expression)(resource, context, variables)
+
+
+# --- answerOptionsToggleExpression ---
+
+def index_response_items(response: Any) -> Dict[str, List[Node]]:
+    """ Map linkId to the response item nodes, linked to their parents, without recursion """
+    root = Node(response)
+    index: Dict[str, List[Node]] = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for child in get_children(node, "item"):
+            link_id = child.value.get("linkId") if isinstance(child.value, Mapping) else getattr(child.value, "linkId", None)
+            index.setdefault(link_id, []).append(child)
+            stack.append(child)
+        for answer in get_children(node, "answer"):
+            stack.append(answer)
+    return index
+
+
+def evaluate_toggle_expressions(questionnaire: Questionnaire, response: Any) -> Dict[str, Dict[Coding, bool]]:
+    """ Evaluate all answerOptionsToggleExpressions of a questionnaire against a response in one pass
+
+    Returns for each item with toggles whether each toggled option is enabled. Expressions are evaluated
+    with the matching response item as `%context` (an empty focus when the item was not answered).
+    """
+    response_items = index_response_items(response)
+    root = [Node(response)]
+    result: Dict[str, Dict[Coding, bool]] = {}
+    for item in questionnaire.iter_items():
+        if not item.answerOptionsToggleExpression:
+            continue
+        context: Collection = response_items.get(item.linkId, [])[:1]
+        env: Env = {"%resource": root, "%rootResource": root, "%context": context, "%questionnaire": [Node(questionnaire)]}
+        options = result.setdefault(item.linkId, {})
+        for toggle in item.answerOptionsToggleExpression:
+            compiled = compile_expression(toggle.expression.expression)
+            options[toggle.option] = to_boolean(compiled.evaluate_nodes(context, env)) is True
+    return result
+
+
+def precompile_toggle_expressions(questionnaire: Questionnaire) -> List[CompiledExpression]:
+    """ Compile the toggle expressions of a questionnaire ahead of time, e.g. when it is loaded """
+    return [
+        compile_expression(toggle.expression.expression)
+        for item in questionnaire.iter_items()
+        for toggle in item.answerOptionsToggleExpression
+    ]
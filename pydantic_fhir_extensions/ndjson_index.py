@@ -0,0 +1,202 @@
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+from typing import IO, Any, Dict, Iterator, List, Tuple, Type, TypeVar
+
+from pydantic_fhir_extensions.element import BaseElement
+
+ElementT = TypeVar("ElementT", bound=BaseElement)
+
+MAGIC = b"FHIRNDX1"
+# magic, size of the indexed file, number of resource records, number of item records
+HEADER = struct.Struct("<8sQQQ")
+# key hash, byte offset and byte length of the JSON value in the indexed file
+RECORD = struct.Struct("<QQQ")
+
+# JSON strings and the punctuation that delimits objects, arrays and keys. The bytes of a multi-byte UTF-8
+# character are never ASCII, so scanning the raw bytes is safe.
+TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]:]')
+
+Record = Tuple[int, int, int]
+
+
+def hash_key(key: str) -> int:
+    """ Stable 64 bit hash of an index key, the same in every process """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+def resource_key(resource_type: str, resource_id: str) -> str:
+    return f"{resource_type}/{resource_id}"
+
+
+def item_key(resource_type: str, resource_id: str, link_id: str) -> str:
+    return f"{resource_type}/{resource_id}#{link_id}"
+
+
+def iter_item_spans(line: bytes) -> Iterator[Tuple[str, int, int]]:
+    """ The linkId, start and end offset of every object in an `item` array of a resource, at any depth """
+    # per open container: whether it is an `item` array, or the linkId found so far in an item object
+    stack: List[Any] = []
+    starts: List[int] = []
+    pending: bytes | None = None
+    key: bytes | None = None
+    for match in TOKEN.finditer(line):
+        token = match.group()
+        if token == b":":
+            key, pending = pending, None
+            continue
+        if pending is not None and key == b'"linkId"' and stack and type(stack[-1]) is list:
+            # the string value of a linkId key, in an item object
+            stack[-1][0] = json.loads(pending)
+        pending = None
+        if token[0] == 0x22:  # "
+            pending = token
+            continue
+        if token == b"{":
+            # an object directly inside an `item` array is an item
+            stack.append([None] if stack and stack[-1] is True else False)
+            starts.append(match.start())
+        elif token == b"[":
+            stack.append(key == b'"item"' and bool(stack) and stack[-1] is not True)
+            starts.append(match.start())
+        else:
+            container = stack.pop()
+            start = starts.pop()
+            if type(container) is list and container[0] is not None:
+                yield container[0], start, match.end()
+        key = None
+
+
+def build_index(path: str, index_path: str | None = None, link_ids: bool = False) -> str:
+    """ Scan an NDJSON file once and write a sidecar index of the byte range of each resource, by type and id
+
+    With `link_ids`, the range of every nested `item` object with a linkId is indexed as well, per resource.
+    Resources without an id are not indexed. Returns the path of the index, `<path>.idx` by default.
+    """
+    index_path = index_path or f"{path}.idx"
+    resources: List[Record] = []
+    items: List[Record] = []
+    offset = 0
+    with open(path, "rb") as fp:
+        for line in fp:
+            start, length = offset, len(line.rstrip(b"\r\n"))
+            offset += len(line)
+            if not line.strip():
+                continue
+            resource = json.loads(line)
+            resource_id = resource.get("id") if isinstance(resource, dict) else None
+            if not isinstance(resource_id, str):
+                continue
+            resource_type = resource.get("resourceType") or ""
+            resources.append((hash_key(resource_key(resource_type, resource_id)), start, length))
+            if link_ids and "item" in resource:
+                for link_id, item_start, item_end in iter_item_spans(line):
+                    items.append((hash_key(item_key(resource_type, resource_id, link_id)), start + item_start, item_end - item_start))
+    resources.sort()
+    items.sort()
+    with open(index_path, "wb") as fp:
+        fp.write(HEADER.pack(MAGIC, offset, len(resources), len(items)))
+        for record in resources:
+            fp.write(RECORD.pack(*record))
+        for record in items:
+            fp.write(RECORD.pack(*record))
+    return index_path
+
+
+def open_mmap(fp: IO[bytes]) -> mmap.mmap | None:
+    # an empty file cannot be mapped
+    return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(fp.fileno()).st_size else None
+
+
+class IndexedNDJSON:
+    """ Random access to the resources of an NDJSON file through its `build_index` sidecar
+
+    Both files are memory-mapped: opening does not depend on their size, and a lookup is a binary search in
+    the index followed by the validation of only the bytes of the requested resource or item.
+    """
+
+    def __init__(self, path: str, index_path: str | None = None):
+        self.data_fp = open(path, "rb")
+        try:
+            self.index_fp = open(index_path or f"{path}.idx", "rb")
+        except OSError:
+            self.data_fp.close()
+            raise
+        self.data = self.index = None
+        try:
+            self.data = open_mmap(self.data_fp)
+            self.index = open_mmap(self.index_fp)
+            if self.index is None or len(self.index) < HEADER.size or self.index[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"`{self.index_fp.name}` is not an NDJSON index")
+            _, size, self.resource_count, self.item_count = HEADER.unpack_from(self.index)
+            if size != (len(self.data) if self.data is not None else 0):
+                raise ValueError(f"The index of `{path}` is stale, build it again")
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self) -> "IndexedNDJSON":
+        return self
+
+    def __exit__(self, *exc_info: Any):
+        self.close()
+
+    def close(self):
+        for mapped in (self.data, self.index):
+            if mapped is not None:
+                mapped.close()
+        self.data_fp.close()
+        self.index_fp.close()
+
+    def __len__(self) -> int:
+        return self.resource_count
+
+    def find(self, key: str, items: bool = False) -> Iterator[Tuple[int, int]]:
+        """ The byte ranges recorded under the hash of `key`: usually one, more on a hash collision """
+        key_hash = hash_key(key)
+        first = HEADER.size + (self.resource_count * RECORD.size if items else 0)
+        low, high = 0, self.item_count if items else self.resource_count
+        while low < high:
+            middle = (low + high) // 2
+            if RECORD.unpack_from(self.index, first + middle * RECORD.size)[0] < key_hash:
+                low = middle + 1
+            else:
+                high = middle
+        end = self.item_count if items else self.resource_count
+        while low < end:
+            record_hash, offset, length = RECORD.unpack_from(self.index, first + low * RECORD.size)
+            if record_hash != key_hash:
+                return
+            yield offset, length
+            low += 1
+
+    def get_bytes(self, offset: int, length: int) -> bytes:
+        return self.data[offset:offset + length]
+
+    def get(self, model: Type[ElementT], resource_id: str, resource_type: str | None = None, context: Dict[str, Any] | None = None) -> ElementT | None:
+        """ Validate the resource with this id, of the `resourceType` of `model` unless given """
+        resource_type = resource_type or get_resource_type(model)
+        for offset, length in self.find(resource_key(resource_type, resource_id)):
+            resource = model.model_validate_json(self.get_bytes(offset, length), context=context)
+            if getattr(resource, "id", None) == resource_id:
+                return resource
+        return None
+
+    def get_item(self, model: Type[ElementT], resource_id: str, link_id: str, resource_type: str = "Questionnaire", context: Dict[str, Any] | None = None) -> ElementT | None:
+        """ Validate the item with this linkId of a resource, as indexed with `link_ids=True` """
+        for offset, length in self.find(item_key(resource_type, resource_id, link_id), items=True):
+            item = model.model_validate_json(self.get_bytes(offset, length), context=context)
+            if getattr(item, "linkId", None) == link_id:
+                return item
+        return None
+
+
+def get_resource_type(model: Type[BaseElement]) -> str:
+    field_info = model.model_fields.get("resourceType")
+    if field_info is None or not isinstance(field_info.default, str):
+        raise ValueError(f"{model.__name__} has no default resourceType, pass `resource_type`")
+    return field_info.default
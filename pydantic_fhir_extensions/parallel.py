@@ -0,0 +1,83 @@
+
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Deque, Generic, Iterable, Iterator, List, Literal, Tuple, Type, TypeVar
+
+from pydantic_fhir_extensions.base import build_schema
+from pydantic_fhir_extensions.batch import BatchResult, get_list_adapter, validate_many, validate_many_json
+from pydantic_fhir_extensions.element import BaseElement
+
+ElementT = TypeVar("ElementT", bound=BaseElement)
+
+Output = Literal["model", "fhir", "json"]
+
+
+def warm_up_worker(model: Type[BaseElement]):
+    """ Worker initializer: unpickling `model` imports its module, then build its deferred schemas """
+    build_schema(model)
+    get_list_adapter(model)
+
+
+def process_shard(model: Type[BaseElement], items: List[Any], output: Output) -> BatchResult[Any]:
+    """ Validate one shard inside a worker, and optionally serialize it to FHIR data or JSON before sending it back """
+    if items and all(isinstance(item, bytes) for item in items):
+        batch = validate_many_json(model, items)
+    else:
+        batch = validate_many(model, items)
+    if output == "json":
+        batch.results = [None if element is None else element.model_dump_fhir_json() for element in batch.results]
+    elif output == "fhir":
+        batch.results = [None if element is None else element.model_dump_fhir() for element in batch.results]
+    return batch
+
+
+class ParallelValidator(Generic[ElementT]):
+    """ Validate a corpus of FHIR objects or raw JSON documents across a pool of worker processes
+
+    The input is sharded in chunks of `chunk_size` items and results come back in input order, either as
+    validated models, as `model_dump_fhir` data or as FHIR JSON bytes. Raw `bytes` items are shipped as-is, which is much cheaper to
+    pickle than parsed dicts. At most `max_pending` shards are in flight so the input can be a lazy iterator.
+    """
+
+    def __init__(self, model: Type[ElementT], max_workers: int | None = None, chunk_size: int = 512, max_pending: int | None = None, mp_context: Any = None):
+        max_workers = max_workers or os.cpu_count() or 1
+        self.model = model
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or 2 * max_workers
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context, initializer=warm_up_worker, initargs=(model,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def iter_shards(self, items: Iterable[Any], output: Output = "model") -> Iterator[Tuple[int, BatchResult[Any]]]:
+        """ Yield `(offset, result)` per shard, in input order """
+        pending: Deque[Tuple[int, Future[BatchResult[Any]]]] = deque()
+        iterator = iter(items)
+        offset = 0
+        while True:
+            while len(pending) < self.max_pending:
+                shard = list(islice(iterator, self.chunk_size))
+                if not shard:
+                    break
+                pending.append((offset, self.executor.submit(process_shard, self.model, shard, output)))
+                offset += len(shard)
+            if not pending:
+                return
+            shard_offset, future = pending.popleft()
+            yield shard_offset, future.result()
+
+    def validate(self, items: Iterable[Any], output: Output = "model") -> BatchResult[Any]:
+        """ Validate all items, with the errors keyed by their index in the input """
+        result: BatchResult[Any] = BatchResult([])
+        for offset, shard in self.iter_shards(items, output):
+            result.results.extend(shard.results)
+            result.errors.update((offset + index, errors) for index, errors in shard.errors.items())
+        return result
@@ -0,0 +1,94 @@
+
+import asyncio
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Deque, Generic, List, NamedTuple, Tuple, Type, TypeVar
+
+from pydantic_core import ErrorDetails
+
+from pydantic_fhir_extensions.batch import BatchResult
+from pydantic_fhir_extensions.element import BaseElement
+from pydantic_fhir_extensions.parallel import Output, process_shard, warm_up_worker
+
+ElementT = TypeVar("ElementT", bound=BaseElement)
+
+
+class PipelineResult(NamedTuple):
+    """ The outcome for the item at `index` in the input: `value` is None whenever `errors` is set """
+    index: int
+    value: Any
+    errors: List[ErrorDetails] | None = None
+
+
+class AsyncPipeline(Generic[ElementT]):
+    """ Validate, and optionally dump, an async stream of FHIR objects or raw JSON documents off the event loop
+
+    Items are pulled from the source in chunks of `chunk_size` and handed to the executor, a thread pool by
+    default. At most `max_in_flight` items are submitted and not yet consumed: the source is not read while
+    the limit is reached, so a fast producer is slowed down to the pace of the executor and the consumer.
+    Results come back in input order. With a process pool, prefer raw `bytes` items, see `ParallelValidator`.
+    """
+
+    def __init__(self, model: Type[ElementT], executor: Executor | None = None, max_in_flight: int = 64, chunk_size: int = 1, output: Output = "model"):
+        if max_in_flight < chunk_size:
+            raise ValueError("max_in_flight must be at least chunk_size")
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.chunk_size = chunk_size
+        self.output = output
+        self.owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="fhir-pipeline")
+
+    @classmethod
+    def with_processes(cls, model: Type[ElementT], max_workers: int | None = None, **kwargs: Any) -> "AsyncPipeline[ElementT]":
+        """ A pipeline over its own process pool, with the schemas built when the workers start """
+        pipeline = cls(model, ProcessPoolExecutor(max_workers=max_workers, initializer=warm_up_worker, initargs=(model,)), **kwargs)
+        pipeline.owns_executor = True
+        return pipeline
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.owns_executor:
+            self.executor.shutdown()
+
+    async def read_chunk(self, iterator: AsyncIterator[Any]) -> Tuple[List[Any], bool]:
+        """ Up to `chunk_size` items, and whether the source is exhausted """
+        chunk: List[Any] = []
+        try:
+            while len(chunk) < self.chunk_size:
+                chunk.append(await anext(iterator))
+        except StopAsyncIteration:
+            return chunk, True
+        return chunk, False
+
+    async def process(self, items: AsyncIterable[Any]) -> AsyncIterator[PipelineResult]:
+        """ Yield a result per input item, in input order """
+        loop = asyncio.get_running_loop()
+        pending: Deque[Tuple[int, int, asyncio.Future[BatchResult[Any]]]] = deque()
+        iterator = aiter(items)
+        offset = in_flight = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and in_flight + self.chunk_size <= self.max_in_flight:
+                    chunk, exhausted = await self.read_chunk(iterator)
+                    if chunk:
+                        future = loop.run_in_executor(self.executor, process_shard, self.model, chunk, self.output)
+                        pending.append((offset, len(chunk), future))
+                        offset += len(chunk)
+                        in_flight += len(chunk)
+                if not pending:
+                    return
+                chunk_offset, size, future = pending.popleft()
+                batch = await future
+                in_flight -= size
+                for index, value in enumerate(batch.results):
+                    yield PipelineResult(chunk_offset + index, value, batch.errors.get(index))
+        finally:
+            for _, _, future in pending:
+                future.cancel()
@@ -0,0 +1,94 @@
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Literal, NamedTuple, Tuple
+
+Phase = Literal["match", "lift", "lower"]
+
+
+class ProfileEvent(NamedTuple):
+    """ One timed step: `count` extensions of `url` matched, lifted or lowered on `model`
+
+    `url` is None for `match` events, which partition the extensions of all urls owned by the model at once.
+    """
+    model: str
+    url: str | None
+    phase: Phase
+    count: int
+    seconds: float
+
+
+@dataclass
+class ProfileStat:
+    calls: int = 0
+    count: int = 0
+    seconds: float = 0.0
+
+
+ProfileKey = Tuple[str, str | None, Phase]
+ProfileHook = Callable[[ProfileEvent], None]
+
+
+class ExtensionProfiler:
+    """ Calls, extension counts and cumulative time per (model, url, phase), plus hooks that get every event """
+
+    def __init__(self, hooks: List[ProfileHook] | None = None):
+        self.stats: Dict[ProfileKey, ProfileStat] = {}
+        self.hooks: List[ProfileHook] = list(hooks or ())
+
+    def record(self, model: str, url: str | None, phase: Phase, count: int, seconds: float):
+        key = (model, url, phase)
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats[key] = ProfileStat()
+        stat.calls += 1
+        stat.count += count
+        stat.seconds += seconds
+        if self.hooks:
+            event = ProfileEvent(model, url, phase, count, seconds)
+            for hook in self.hooks:
+                hook(event)
+
+    def by_url(self) -> Dict[Tuple[str | None, Phase], ProfileStat]:
+        """ The stats summed over the models """
+        totals: Dict[Tuple[str | None, Phase], ProfileStat] = {}
+        for (_, url, phase), stat in self.stats.items():
+            total = totals.setdefault((url, phase), ProfileStat())
+            total.calls += stat.calls
+            total.count += stat.count
+            total.seconds += stat.seconds
+        return totals
+
+    def reset(self):
+        self.stats.clear()
+
+
+# None unless profiling is enabled: the instrumented code only pays for reading this global
+PROFILER: ExtensionProfiler | None = None
+
+clock = perf_counter
+
+
+def enable_profiling(*hooks: ProfileHook) -> ExtensionProfiler:
+    """ Start recording extension stats process-wide, in a fresh profiler """
+    global PROFILER
+    PROFILER = ExtensionProfiler(list(hooks))
+    return PROFILER
+
+def disable_profiling() -> ExtensionProfiler | None:
+    """ Stop recording and return the profiler that was active """
+    global PROFILER
+    profiler, PROFILER = PROFILER, None
+    return profiler
+
+@contextmanager
+def profile_extensions(*hooks: ProfileHook) -> Iterator[ExtensionProfiler]:
+    """ Record extension stats for the duration of the block """
+    global PROFILER
+    previous = PROFILER
+    profiler = enable_profiling(*hooks)
+    try:
+        yield profiler
+    finally:
+        PROFILER = previous
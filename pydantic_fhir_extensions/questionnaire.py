@@ -1,10 +1,13 @@
 
-from typing import Annotated, List, Literal
+from typing import Annotated, Any, Dict, Iterable, Iterator, List, Literal, Sequence
+
+from pydantic import ValidationInfo, model_validator
 
 from pydantic_fhir_extensions.element import BaseElement
-from pydantic_fhir_extensions.base import Coding
+from pydantic_fhir_extensions.base import Coding, canonical, id as fhir_id
 from pydantic_fhir_extensions.extensions import ExtItemControl, ExtAnswerOptionsToggleExpression
 from pydantic_fhir_extensions.extensions.validator import ExtensionValidator
+from pydantic_fhir_extensions.util import is_lazy
 
 class AnswerOption(BaseElement):
     valueCoding: Coding
@@ -18,3 +21,120 @@ class QuestionnaireItem(BaseElement):
     itemControl: Annotated[Coding, ExtensionValidator(ExtItemControl)]
     answerOption: List[AnswerOption]|None = None
     answerOptionsToggleExpression: Annotated[List[ExtAnswerOptionsToggleExpression], ExtensionValidator(ExtAnswerOptionsToggleExpression)]
+    item: List["QuestionnaireItem"]|None = None
+
+    # derived from the lists: left out of equality and copies, dropped when either list is assigned, and rebuilt on
+    # first lookup when missing
+    __slots__ = ("__answer_option_index__", "__toggle_index__")
+
+    def __setattr__(self, name:str, value:Any):
+        super().__setattr__(name, value)
+        if name == "answerOption" or name == "answerOptionsToggleExpression":
+            object.__setattr__(self, "__answer_option_index__", None)
+            object.__setattr__(self, "__toggle_index__", None)
+
+    @model_validator(mode="after")
+    def index_answer_options(self, info:ValidationInfo):
+        # in lazy mode the toggles are not lifted yet: index, and check them, on first lookup
+        if not is_lazy(info):
+            self.reindex_answer_options()
+        return self
+
+    def reindex_answer_options(self):
+        """ Rebuild the answer option and toggle indexes, needed after either list was modified in place """
+        options: Dict[Coding, AnswerOption] = {}
+        for answer_option in self.answerOption or ():
+            options.setdefault(answer_option.valueCoding, answer_option)
+        toggles: Dict[Coding, List[ExtAnswerOptionsToggleExpression]] = {}
+        for toggle in self.answerOptionsToggleExpression:
+            if toggle.option not in options:
+                raise ValueError(f"Toggle expression option `{toggle.option.system}|{toggle.option.code}` is not an answerOption of item `{self.linkId}`")
+            toggles.setdefault(toggle.option, []).append(toggle)
+        object.__setattr__(self, "__answer_option_index__", options)
+        object.__setattr__(self, "__toggle_index__", toggles)
+
+    def get_answer_option(self, coding: Coding) -> AnswerOption | None:
+        """ The answer option with the same system, code and version as `coding` """
+        index = getattr(self, "__answer_option_index__", None)
+        if index is None:
+            self.reindex_answer_options()
+            index = self.__answer_option_index__
+        return index.get(coding)
+
+    def get_toggle_expressions(self, coding: Coding) -> Sequence[ExtAnswerOptionsToggleExpression]:
+        """ The toggle expressions of the answer option `coding` """
+        index = getattr(self, "__toggle_index__", None)
+        if index is None:
+            self.reindex_answer_options()
+            index = self.__toggle_index__
+        return index.get(coding, ())
+
+    def iter_items(self) -> Iterator["QuestionnaireItem"]:
+        """ Iterate depth-first over the nested items of this item, in document order """
+        return iter_items(self.item or ())
+
+QuestionnaireStatus = Literal["draft", "active", "retired", "unknown"]
+
+class Questionnaire(BaseElement):
+    resourceType: Literal["Questionnaire"] = "Questionnaire"
+    id: fhir_id | None = None
+    url: canonical | None = None
+    version: str | None = None
+    name: str | None = None
+    title: str | None = None
+    status: QuestionnaireStatus
+    item: List[QuestionnaireItem]|None = None
+
+    # derived from the item tree: left out of equality and copies, dropped when `item` is assigned, and rebuilt on
+    # first lookup when missing
+    __slots__ = ("__item_index__",)
+
+    def __setattr__(self, name:str, value:Any):
+        super().__setattr__(name, value)
+        if name == "item":
+            object.__setattr__(self, "__item_index__", None)
+
+    @classmethod
+    def model_construct_trusted(cls, data:Dict[str, Any]) -> "Questionnaire":
+        questionnaire = super().model_construct_trusted(data)
+        # the after validators do not run: build the linkId index here
+        questionnaire.reindex()
+        return questionnaire
+
+    @model_validator(mode="after")
+    def index_items(self):
+        self.reindex()
+        return self
+
+    def reindex(self):
+        """ Rebuild the linkId index, needed after the item tree was modified in place """
+        index: Dict[str, QuestionnaireItem] = {}
+        for item in self.iter_items():
+            if item.linkId in index:
+                raise ValueError(f"Duplicate linkId `{item.linkId}`")
+            index[item.linkId] = item
+        object.__setattr__(self, "__item_index__", index)
+
+    def iter_items(self) -> Iterator[QuestionnaireItem]:
+        """ Iterate depth-first over all items of the questionnaire, in document order """
+        return iter_items(self.item or ())
+
+    def get_item(self, link_id: str) -> QuestionnaireItem | None:
+        """ Look up an item anywhere in the tree by its linkId """
+        index = getattr(self, "__item_index__", None)
+        if index is None:
+            self.reindex()
+            index = self.__item_index__
+        return index.get(link_id)
+
+def iter_items(items: Iterable[QuestionnaireItem]) -> Iterator[QuestionnaireItem]:
+    """ Depth-first, pre-order traversal with an explicit stack instead of recursion """
+    stack = [iter(items)]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            continue
+        yield item
+        if item.item:
+            stack.append(iter(item.item))
@@ -0,0 +1,129 @@
+
+import codecs
+import json
+from typing import IO, Any, Iterator, Type, TypeVar
+
+from pydantic_fhir_extensions.element import BaseElement
+
+ElementT = TypeVar("ElementT", bound=BaseElement)
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\n\r"
+# a chunk boundary can cut a literal (`false`), a number or a `\uXXXX` escape: the decoder then fails a few
+# characters before the end of the buffer. An error further back is in the input itself.
+TRUNCATION_MARGIN = 8
+
+
+class BundleReader:
+    """ Incremental reader over the text of a FHIR Bundle, holding at most one entry in memory """
+
+    def __init__(self, fp: IO[bytes], chunk_size: int = CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: int) -> bool:
+        """ Read at least `size` more bytes into the buffer, dropping the consumed text """
+        if self.eof:
+            return False
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        chunk = self.fp.read(max(size, self.chunk_size))
+        if not chunk:
+            self.eof = True
+        self.buffer += self.decoder.decode(chunk, final=self.eof)
+        return True
+
+    def peek(self) -> str:
+        """ The next non-whitespace character, or an empty string at the end of the input """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill(self.chunk_size):
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected `{char}` at offset {self.pos} of the buffered bundle text")
+        self.pos += 1
+
+    def decode_value(self) -> Any:
+        """ Decode the next JSON value, reading more input until it is complete """
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                # fail without reading the rest of the input when more of it cannot fix the value
+                if not is_truncation(error, self.buffer):
+                    raise
+                # grow geometrically so a large value is not re-parsed once per chunk
+                if not self.fill(len(self.buffer) - self.pos):
+                    raise
+                continue
+            if end == len(self.buffer) and not self.eof:
+                # a number could continue in the next chunk
+                self.fill(self.chunk_size)
+                continue
+            self.pos = end
+            return value
+
+    def iter_entries(self) -> Iterator[Any]:
+        """ Yield the items of the top-level `entry` array, skipping the other Bundle properties """
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(":")
+            if key == "entry":
+                self.expect("[")
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self.decode_value()
+                        if self.peek() == "]":
+                            self.pos += 1
+                            break
+                        self.expect(",")
+            else:
+                self.decode_value()
+            if self.peek() == "}":
+                return
+            self.expect(",")
+
+
+def is_truncation(error: json.JSONDecodeError, text: str) -> bool:
+    """ Whether the decoding error may be due to the end of the buffered text rather than to invalid JSON """
+    return error.msg.startswith("Unterminated string") or error.pos >= len(text) - TRUNCATION_MARGIN
+
+
+def iter_bundle(fp: IO[bytes], model: Type[ElementT], resource_type: str | None = None) -> Iterator[ElementT]:
+    """ Stream `Bundle.entry[].resource` from a binary file and validate each resource as `model` """
+    for entry in BundleReader(fp).iter_entries():
+        resource = entry.get("resource") if isinstance(entry, dict) else None
+        if resource is None or not matches_resource_type(resource, resource_type):
+            continue
+        yield model.model_validate(resource)
+
+
+def iter_ndjson(fp: IO[bytes], model: Type[ElementT], resource_type: str | None = None) -> Iterator[ElementT]:
+    """ Stream the resources of a bulk-export NDJSON file and validate each one as `model` """
+    for line in fp:
+        if not line.strip():
+            continue
+        if resource_type is None:
+            yield model.model_validate_json(line)
+            continue
+        resource = json.loads(line)
+        if matches_resource_type(resource, resource_type):
+            yield model.model_validate(resource)
+
+
+def matches_resource_type(resource: Any, resource_type: str | None) -> bool:
+    return resource_type is None or (isinstance(resource, dict) and resource.get("resourceType") == resource_type)
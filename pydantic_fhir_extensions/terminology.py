@@ -0,0 +1,294 @@
+
+import json
+import os
+import pickle
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Literal, Set, Tuple
+
+from pydantic import GetCoreSchemaHandler, ValidationInfo
+from pydantic_core import core_schema
+
+# system, code and version: a None version is any version
+CodeKey = Tuple[str, str, str | None]
+
+SNAPSHOT_VERSION = 2
+
+BindingStrength = Literal["required", "extensible", "preferred", "example"]
+
+
+@dataclass
+class CodeSystemIndex:
+    """ The codes of a CodeSystem, nested concepts included, with their display """
+    url: str
+    version: str | None
+    concepts: Dict[str, str | None]
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.concepts
+
+    def __len__(self) -> int:
+        return len(self.concepts)
+
+    def get_display(self, code: str) -> str | None:
+        return self.concepts.get(code)
+
+
+@dataclass
+class ValueSetIndex:
+    """ The expanded codes of a ValueSet, as hash sets: a lookup is O(1) whatever its size """
+    url: str
+    version: str | None
+    codes: FrozenSet[CodeKey]
+    # the (system, code) of every entry, for codings without a version
+    unversioned: FrozenSet[Tuple[str, str]] = field(default=frozenset())
+
+    def __post_init__(self):
+        if not self.unversioned:
+            self.unversioned = frozenset((system, code) for system, code, _ in self.codes)
+
+    def __len__(self) -> int:
+        return len(self.unversioned)
+
+    def contains(self, system: str | None, code: str | None, version: str | None = None) -> bool:
+        """ Whether the code is in the value set: a versioned entry only matches codings of that version """
+        if version is None:
+            return (system, code) in self.unversioned
+        return (system, code, version) in self.codes or (system, code, None) in self.codes
+
+    def matches(self, value: Any) -> bool:
+        """ A Coding in the value set, or a CodeableConcept with at least one such coding """
+        # read from the instance dict: a missing attribute of a model goes through the slow `__getattr__`
+        codings = value.__dict__.get("coding")
+        if codings is None:
+            codings = (value,)
+        unversioned = self.unversioned
+        for coding in codings:
+            fields = coding.__dict__
+            key = (fields.get("system"), fields.get("code"))
+            if key in unversioned and (fields.get("version") is None or self.contains(*key, fields["version"])):
+                return True
+        return False
+
+
+def iter_concepts(concepts: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, str | None]]:
+    """ The code and display of concepts and of their nested concepts """
+    stack = [iter(concepts)]
+    while stack:
+        concept = next(stack[-1], None)
+        if concept is None:
+            stack.pop()
+            continue
+        yield concept["code"], concept.get("display")
+        if concept.get("concept"):
+            stack.append(iter(concept["concept"]))
+
+
+def iter_contains(contains: Iterable[Dict[str, Any]]) -> Iterator[CodeKey]:
+    """ The codes of a ValueSet expansion, nested `contains` included """
+    stack = [iter(contains)]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            continue
+        if "code" in entry and not entry.get("abstract"):
+            yield sys.intern(entry["system"]), entry["code"], entry.get("version")
+        if entry.get("contains"):
+            stack.append(iter(entry["contains"]))
+
+
+class Terminology:
+    """ Local CodeSystems and ValueSets, indexed for O(1) membership checks
+
+    ValueSets are expanded on first use, so they can be added before the CodeSystems they include, and again
+    after a CodeSystem or ValueSet they include is added or replaced. Expansion supports pre-expanded ValueSets,
+    and compose includes and excludes of listed concepts, of whole loaded CodeSystems and of other ValueSets;
+    filters are not supported.
+    """
+
+    def __init__(self):
+        self.code_systems: Dict[str, CodeSystemIndex] = {}
+        self.value_sets: Dict[str, ValueSetIndex] = {}
+        # the ValueSet definitions, by url and `url|version`, to expand on first use
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        # url of a CodeSystem or ValueSet: the urls of the expanded ValueSets that include it
+        self.dependents: Dict[str, Set[str]] = {}
+
+    def add(self, resource: Dict[str, Any]):
+        """ Add a CodeSystem, a ValueSet or the CodeSystems and ValueSets of a Bundle """
+        match resource.get("resourceType"):
+            case "CodeSystem":
+                self.add_code_system(resource)
+            case "ValueSet":
+                url = resource["url"]
+                keys = [url] if resource.get("version") is None else [url, f"{url}|{resource['version']}"]
+                for key in keys:
+                    self.pending[key] = resource
+                self.invalidate(url)
+            case "Bundle":
+                for entry in resource.get("entry") or ():
+                    if entry.get("resource", {}).get("resourceType") in ("CodeSystem", "ValueSet"):
+                        self.add(entry["resource"])
+            case resource_type:
+                raise ValueError(f"Expected a CodeSystem, ValueSet or Bundle, got `{resource_type}`")
+
+    def add_code_system(self, resource: Dict[str, Any]) -> CodeSystemIndex:
+        url, version = sys.intern(resource["url"]), resource.get("version")
+        index = CodeSystemIndex(url, version, dict(iter_concepts(resource.get("concept") or ())))
+        self.code_systems[url] = index
+        if version is not None:
+            self.code_systems[f"{url}|{version}"] = index
+        self.invalidate(url)
+        return index
+
+    def invalidate(self, url: str):
+        """ Drop the expansions of the ValueSet `url`, and of the ValueSets that include the CodeSystem or
+        ValueSet `url`, directly or not: they are expanded again on next use """
+        stale: Set[str] = set()
+        urls = [url]
+        while urls:
+            url = urls.pop()
+            if url not in stale:
+                stale.add(url)
+                urls.extend(self.dependents.pop(url, ()))
+        for key in [key for key in self.value_sets if key.partition("|")[0] in stale]:
+            del self.value_sets[key]
+
+    def load(self, *paths: str):
+        """ Add the resources of JSON files, or of the `*.json` files of directories """
+        for path in paths:
+            if os.path.isdir(path):
+                self.load(*(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".json")))
+                continue
+            with open(path, "rb") as fp:
+                self.add(json.load(fp))
+
+    def get_code_system(self, url: str, version: str | None = None) -> CodeSystemIndex | None:
+        return self.code_systems.get(f"{url}|{version}" if version is not None else url)
+
+    def get_value_set(self, url: str) -> ValueSetIndex | None:
+        """ The index of a ValueSet by url, or `url|version`, expanded on first use """
+        index = self.value_sets.get(url)
+        if index is None and url in self.pending:
+            index = self.value_sets[url] = self.expand(self.pending[url], set())
+        return index
+
+    def validate_coding(self, value_set: str, value: Any) -> bool:
+        """ Whether a Coding, or a CodeableConcept by one of its codings, is in the ValueSet """
+        index = self.get_value_set(value_set)
+        if index is None:
+            raise KeyError(f"ValueSet `{value_set}` is not loaded")
+        return index.matches(value)
+
+    def expand(self, resource: Dict[str, Any], expanding: Set[str]) -> ValueSetIndex:
+        url = resource["url"]
+        if url in expanding:
+            raise ValueError(f"ValueSet `{url}` includes itself")
+        expansion = resource.get("expansion")
+        if expansion is not None:
+            codes = frozenset(iter_contains(expansion.get("contains") or ()))
+        else:
+            expanding = expanding | {url}
+            compose = resource.get("compose") or {}
+            included: Set[CodeKey] = set()
+            for include in compose.get("include") or ():
+                included.update(self.expand_include(include, url, expanding))
+            excluded = {(system, code) for exclude in compose.get("exclude") or () for system, code, _ in self.expand_include(exclude, url, expanding)}
+            codes = frozenset(key for key in included if key[:2] not in excluded)
+        return ValueSetIndex(url, resource.get("version"), codes)
+
+    def expand_include(self, include: Dict[str, Any], url: str, expanding: Set[str]) -> Set[CodeKey]:
+        if include.get("filter"):
+            raise ValueError(f"ValueSet `{url}` uses filters, which are not supported")
+        codes: Set[CodeKey] | None = None
+        system, version = include.get("system"), include.get("version")
+        if system is not None:
+            system = sys.intern(system)
+            if include.get("concept"):
+                codes = {(system, concept["code"], version) for concept in include["concept"]}
+            else:
+                code_system = self.get_code_system(system, version) or self.get_code_system(system)
+                if code_system is None:
+                    raise ValueError(f"ValueSet `{url}` includes CodeSystem `{system}`, which is not loaded")
+                self.dependents.setdefault(system, set()).add(url)
+                codes = {(system, code, version) for code in code_system.concepts}
+        for value_set_url in include.get("valueSet") or ():
+            # several value sets, or a system and value sets: the codes in all of them
+            if value_set_url in expanding:
+                raise ValueError(f"ValueSet `{value_set_url}` includes itself")
+            self.dependents.setdefault(value_set_url.partition("|")[0], set()).add(url)
+            value_set = self.value_sets.get(value_set_url)
+            if value_set is None:
+                if value_set_url not in self.pending:
+                    raise ValueError(f"ValueSet `{url}` includes ValueSet `{value_set_url}`, which is not loaded")
+                value_set = self.value_sets[value_set_url] = self.expand(self.pending[value_set_url], expanding)
+            if codes is None:
+                codes = set(value_set.codes)
+            else:
+                codes = {key for key in codes if value_set.contains(*key)}
+        return codes or set()
+
+    def save_snapshot(self, path: str):
+        """ Expand every ValueSet and write the indexes, for other processes to load with `load_snapshot` """
+        for url in list(self.pending):
+            self.get_value_set(url)
+        with open(path, "wb") as fp:
+            pickle.dump((SNAPSHOT_VERSION, self.code_systems, self.value_sets, self.pending, self.dependents), fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load_snapshot(cls, path: str) -> "Terminology":
+        """ Load the indexes written by `save_snapshot`. A snapshot is a pickle: only load the ones you wrote. """
+        with open(path, "rb") as fp:
+            version, *indexes = pickle.load(fp)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Terminology snapshot `{path}` has version {version}, expected {SNAPSHOT_VERSION}")
+        terminology = cls()
+        terminology.code_systems, terminology.value_sets, terminology.pending, terminology.dependents = indexes
+        return terminology
+
+
+# the terminology of the bindings of this package, and the default one of every binding
+TERMINOLOGY = Terminology()
+
+
+def find_value_set(url: str, info: ValidationInfo) -> ValueSetIndex:
+    """ The ValueSet in the terminology of `context={"terminology": ...}`, else in the default terminology """
+    terminology = info.context.get("terminology") if info.context is not None else None
+    index = terminology.get_value_set(url) if terminology is not None else None
+    if index is None:
+        index = TERMINOLOGY.get_value_set(url)
+    if index is None:
+        raise ValueError(f"ValueSet `{url}` is not loaded")
+    return index
+
+
+@dataclass(frozen=True)
+class Binding:
+    """ Annotation that binds a Coding or CodeableConcept field, or a list of them, to a ValueSet
+
+    Only required bindings are checked: every Coding must be in the ValueSet, and every CodeableConcept
+    must have at least one coding in it.
+    """
+    value_set: str
+    strength: BindingStrength = "required"
+
+    def check(self, value: Any, info: ValidationInfo) -> Any:
+        if self.strength != "required" or value is None:
+            return value
+        index = find_value_set(self.value_set, info)
+        for item in value if isinstance(value, (list, tuple)) else (value,):
+            if not index.matches(item):
+                raise ValueError(describe_mismatch(item, self.value_set))
+        return value
+
+    def __get_pydantic_core_schema__(self, source_type: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        return core_schema.with_info_after_validator_function(self.check, handler(source_type))
+
+
+def describe_mismatch(value: Any, value_set: str) -> str:
+    codings: List[Any] | None = getattr(value, "coding", None)
+    if codings is not None:
+        codes = ", ".join(f"`{coding.system}|{coding.code}`" for coding in codings) or "none"
+        return f"The CodeableConcept has no coding in ValueSet `{value_set}`, its codings are {codes}"
+    return f"Coding `{getattr(value, 'system', None)}|{getattr(value, 'code', None)}` is not in ValueSet `{value_set}`"
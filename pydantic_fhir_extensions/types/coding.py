@@ -1,7 +1,7 @@
 from typing import Protocol
 
 
-class Coding(Protocol)
+class Coding(Protocol):
     @property
     def system(self)->str|None:
         ...
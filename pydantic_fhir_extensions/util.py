@@ -1,6 +1,18 @@
 
-from pydantic import SerializationInfo
+from pydantic import SerializationInfo, ValidationInfo
 
 
 def is_serialization_to_fhir(info:SerializationInfo):
     return bool(info.context is not None and info.context.get("fhir", False) == True)
+
+def is_interning(info:ValidationInfo):
+    """ Validation was called with `context={"intern": True}`: share frozen instances of identical values """
+    return bool(info.context is not None and info.context.get("intern", False))
+
+def is_lazy(info:ValidationInfo):
+    """ Validation was called with `context={"lazy": True}`: defer lifting extensions until first access """
+    return bool(info.context is not None and info.context.get("lazy", False))
+
+def is_passthrough(info:ValidationInfo):
+    """ Validation was called with `context={"passthrough": True}`: keep the extensions no field lifts as raw JSON """
+    return bool(info.context is not None and info.context.get("passthrough", False))
@@ -0,0 +1,33 @@
+""" Builders of FHIR test data shared by the test modules """
+
+
+def make_item(link_id: str, code: str = "text"):
+    return {
+        "extension": [
+            {
+                "url": "http://hl7.org/fhir/StructureDefinition/questionnaire-itemControl",
+                "valueCodeableConcept": {
+                    "text": code.capitalize(),
+                    "coding": [
+                        {
+                            "system": "http://tiro.health/fhir/CodeSystem/tiro-questionnaire-item-control",
+                            "code": code,
+                            "display": code.capitalize()
+                        }
+                    ]
+                }
+            }
+        ],
+        "type": "text",
+        "text": "This is a question",
+        "linkId": link_id
+    }
+
+def make_questionnaire(depth: int = 10, width: int = 2):
+    def make_group(prefix: str, level: int):
+        item = {**make_item(prefix, "radio" if level % 2 else "text"), "type": "group"}
+        if level < depth:
+            item["item"] = [make_group(f"{prefix}.{i}", level + 1) for i in range(width)]
+        return item
+
+    return {"resourceType": "Questionnaire", "status": "active", "item": [make_group("q", 1)]}
@@ -1,7 +1,10 @@
-from pydantic import ValidationError
+from typing import List
+
+from pydantic import TypeAdapter, ValidationError
 import pytest
 
-from pydantic_fhir_extensions.base import BaseExtension
+from pydantic_fhir_extensions.base import BaseExtension, CodingExtension, ComplexExtension, Extension, StringExtension
+from pydantic_fhir_extensions.element import BaseElement
 
 def test_if_value_and_nested_extension_fails():
     json = {
@@ -39,3 +42,37 @@ def test_if_multiple_values_fail():
 
     with pytest.raises(ValidationError):
         BaseExtension.model_validate(json)
+
+def test_compact_extension_picks_the_value_type():
+
+    adapter = TypeAdapter(List[Extension])
+    json = [
+        {"url": "urn:string", "valueString": "This is a string"},
+        {"url": "urn:coding", "valueCoding": {"system": "urn:CodeSystem:toggle", "code": "yes"}},
+        {"url": "urn:complex", "extension": [{"url": "nested", "valueInteger": 1}]},
+    ]
+
+    string, coding, complex = adapter.validate_python(json)
+
+    assert isinstance(string, StringExtension) and string.value == "This is a string"
+    assert isinstance(coding, CodingExtension) and coding.value.code == "yes"
+    assert isinstance(complex, ComplexExtension) and complex.extension[0].value == 1
+    assert adapter.dump_python([string, coding, complex], exclude_none=True, context={"fhir": True}) == json
+
+@pytest.mark.parametrize("json", [
+    {"url": "test-uri", "valueString": "This is a string", "valueInteger": 1},
+    {"url": "test-uri", "valueString": "This is a string", "extension": [{"url": "nested", "valueInteger": 1}]},
+])
+def test_compact_extension_rules_are_structural(json):
+
+    with pytest.raises(ValidationError) as exc_info:
+        TypeAdapter(Extension).validate_python(json)
+    assert exc_info.value.errors()[0]["type"] == "extension_value"
+
+def test_nested_complex_extensions_are_dumped():
+    json = {"extension": [{"url": "urn:complex", "extension": [{"url": "nested", "extension": [{"url": "leaf", "valueString": "x"}]}]}]}
+
+    element = BaseElement.model_validate(json)
+
+    assert element.extension[0].extension[0].extension[0].value == "x"
+    assert element.model_dump_fhir() == json
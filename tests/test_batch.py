@@ -0,0 +1,42 @@
+
+import json
+
+from pydantic_fhir_extensions.batch import dump_many_fhir, validate_many, validate_many_json
+from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+from tests.helpers import make_item
+
+
+def test_validate_many_returns_errors_per_index():
+    items = [make_item("q1"), {**make_item("q2"), "type": "unknown"}, {"linkId": "q3"}, make_item("q4")]
+
+    batch = validate_many(QuestionnaireItem, items)
+
+    assert set(batch.errors) == {1, 2}
+    assert batch.results[1] is None and batch.results[2] is None
+    assert [item.linkId for item in batch.valid] == ["q1", "q4"]
+    assert all(error["loc"][0] != 2 for error in batch.errors[2])
+
+def test_dump_many_fhir_matches_model_dump_fhir():
+    batch = validate_many(QuestionnaireItem, (make_item(f"q{i}") for i in range(3)))
+
+    assert not batch.errors
+    assert dump_many_fhir(QuestionnaireItem, batch.valid) == [item.model_dump_fhir() for item in batch.valid]
+    assert dump_many_fhir(QuestionnaireItem, batch.valid)[0] == make_item("q0")
+
+def test_validate_many_json_isolates_malformed_documents():
+    items = [json.dumps(make_item("q1")).encode(), b'{"linkId": ', json.dumps(make_item("q3")).encode()]
+
+    batch = validate_many_json(QuestionnaireItem, items)
+
+    assert set(batch.errors) == {1}
+    assert [item.linkId for item in batch.valid] == ["q1", "q3"]
+
+def test_validate_many_json_keeps_documents_apart():
+    first, second, third = (json.dumps(make_item(f"q{i}")).encode() for i in range(3))
+    items = [first + b"," + second, third, b'{"linkId": "q4"}', third]
+
+    batch = validate_many_json(QuestionnaireItem, items)
+
+    assert set(batch.errors) == {0, 2}
+    assert batch.errors[0][0]["type"] == "json_invalid"
+    assert [item and item.linkId for item in batch.results] == [None, "q2", None, "q2"]
@@ -0,0 +1,32 @@
+import json
+
+from benchmarks.corpus import CorpusSpec, iter_items, make_questionnaire
+from benchmarks.run import compare, run, save
+from pydantic_fhir_extensions.questionnaire import Questionnaire
+
+SPEC = CorpusSpec(items=30, depth=4, extensions_per_item=8, known_ratio=0.5, options_per_item=3)
+
+
+def test_corpus_is_deterministic_and_round_trips():
+    json_data = make_questionnaire(SPEC)
+    assert json_data == make_questionnaire(SPEC)
+    assert json_data != make_questionnaire(CorpusSpec(**{**SPEC.__dict__, "seed": 1}))
+
+    questionnaire = Questionnaire.model_validate(json_data)
+
+    items = list(questionnaire.iter_items())
+    assert [item.linkId for item in items] == [item["linkId"] for item in iter_items(json_data)]
+    assert all(len(item.answerOptionsToggleExpression) == 3 for item in items)
+    dumped = questionnaire.model_dump_fhir_json()
+    assert Questionnaire.model_validate_json(dumped).model_dump_fhir_json() == dumped
+
+def test_runner_saves_and_compares_baselines(tmp_path, monkeypatch):
+    monkeypatch.setattr("benchmarks.run.SPECS", {"tiny": CorpusSpec(items=5, depth=2)})
+
+    results = run(["tiny"], repeat=1, operations=["round_trip"])
+
+    assert [result.key for result in results] == [f"tiny/{model}/round_trip" for model in ("Questionnaire", "QuestionnaireItem", "ExtItemControl", "ExtAnswerOptionsToggleExpression")]
+    baseline = tmp_path / "baseline.json"
+    save(results, str(baseline))
+    assert set(json.loads(baseline.read_text())["results"]) == {result.key for result in results}
+    assert compare(results, str(baseline), threshold=float("inf"))
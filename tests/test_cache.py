@@ -0,0 +1,87 @@
+import copy
+import json
+import pickle
+
+import pytest
+from pydantic import ValidationError
+
+from pydantic_fhir_extensions.base import Coding, FrozenList
+from pydantic_fhir_extensions.cache import ValidationCache, canonical_json
+from pydantic_fhir_extensions.extensions import ExtItemControl
+from pydantic_fhir_extensions.questionnaire import Questionnaire, QuestionnaireItem
+from tests.helpers import make_item, make_questionnaire
+
+
+def test_hits_share_a_frozen_instance():
+    cache = ValidationCache()
+    data = make_questionnaire(depth=3)
+
+    questionnaire = cache.validate(Questionnaire, data)
+
+    assert cache.validate(Questionnaire, json.loads(json.dumps(data, sort_keys=True))) is questionnaire
+    assert cache.validate(Questionnaire, data, context={"intern": True}) is not questionnaire
+    assert questionnaire == Questionnaire.model_validate(data)
+    assert questionnaire.model_dump_fhir_json() == Questionnaire.model_validate(data).model_dump_fhir_json()
+    assert questionnaire.get_item("q.0.1").itemControl.code == "radio"
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.entries) == (1, 2, 2)
+
+    item = questionnaire.get_item("q.0")
+    with pytest.raises(TypeError, match="frozen"):
+        item.text = "Edited"
+    with pytest.raises(TypeError, match="frozen"):
+        item.itemControl = Coding(code="radio")
+    with pytest.raises(TypeError):
+        item.item.append(item)
+    with pytest.raises(TypeError, match="frozen"):
+        item.itemControl.code = "radio"
+    assert type(item.item) is FrozenList
+
+    mutable = questionnaire.model_copy(deep=True)
+    mutable.get_item("q.0").text = "Edited"
+    mutable.get_item("q.0").item.append(mutable.get_item("q.0.0").model_copy(update={"linkId": "q.0.2"}))
+    edited = mutable.model_dump_fhir()
+    assert mutable.item[0].item[0] is mutable.get_item("q.0")
+    assert edited["item"][0]["item"][0]["text"] == "Edited" and edited["item"][0]["item"][0]["item"][-1]["linkId"] == "q.0.2"
+    # the edited content is another entry, the cached instance is untouched
+    assert cache.validate(Questionnaire, edited) is not questionnaire
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.entries) == (1, 3, 3)
+    assert cache.validate(Questionnaire, data) is questionnaire
+    assert questionnaire.model_dump_fhir() == Questionnaire.model_validate(data).model_dump_fhir()
+    assert pickle.loads(pickle.dumps(questionnaire)).item[0].item == questionnaire.item[0].item
+    assert type(copy.copy(item.item)) is list and item.text == data["item"][0]["item"][0]["text"]
+
+def test_json_inputs_and_failures():
+    cache = ValidationCache()
+    raw = json.dumps(make_item("q1"))
+
+    item = cache.validate_json(QuestionnaireItem, raw)
+
+    assert cache.validate_json(QuestionnaireItem, raw.encode()) is item
+    with pytest.raises(ValidationError):
+        cache.validate_json(QuestionnaireItem, "{}")
+    with pytest.raises(ValidationError):
+        cache.validate_json(QuestionnaireItem, "{}")
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.entries) == (1, 3, 1)
+
+def test_eviction_by_entries_and_bytes():
+    cache = ValidationCache(max_entries=2)
+    extensions = [next(ExtItemControl.from_property_value(Coding(code=code))).model_dump_fhir() for code in ("text", "radio", "checkbox")]
+
+    first, _, _ = [cache.validate(ExtItemControl, extension) for extension in extensions]
+
+    assert (cache.stats.evictions, cache.stats.entries) == (1, 2)
+    assert cache.validate(ExtItemControl, extensions[0]) is not first
+    assert cache.stats.evictions == 2
+
+    sizes = [len(canonical_json(extension)) for extension in extensions]
+    cache = ValidationCache(max_bytes=sizes[1] + sizes[2])
+    cache.validate(ExtItemControl, extensions[1])
+    cache.validate(ExtItemControl, extensions[2])
+    recent = cache.validate(ExtItemControl, extensions[1])
+    cache.validate(ExtItemControl, extensions[0])
+    # the least recently used entry went out to make room
+    assert cache.validate(ExtItemControl, extensions[1]) is recent
+    assert (cache.stats.evictions, cache.stats.entries, cache.stats.bytes) == (1, 2, sizes[0] + sizes[1])
+
+    cache.clear()
+    assert (cache.stats.entries, cache.stats.bytes, cache.stats.hits) == (0, 0, 2)
@@ -0,0 +1,55 @@
+from array import array
+
+import pytest
+
+from benchmarks.corpus import CorpusSpec, iter_items, make_questionnaire
+from pydantic_fhir_extensions.columns import extract_columns
+from pydantic_fhir_extensions.extensions.item_control import SDC_ITEM_CONTROL_SYSTEM, TIRO_ITEM_CONTROL_SYSTEM
+from pydantic_fhir_extensions.profiling import profile_extensions
+from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+
+PATHS = ["linkId", "type", "itemControl.code", "itemControl.display", "answerOptionsToggleExpression.option.code", "answerOption.valueCoding.code"]
+
+
+def test_raw_dicts_and_elements_give_the_same_columns():
+    raw = iter_items(make_questionnaire(CorpusSpec(items=20, depth=2, options_per_item=2)))
+    elements = [QuestionnaireItem.model_validate(item) for item in raw]
+
+    with profile_extensions() as profiler:
+        from_raw = extract_columns(QuestionnaireItem, raw, PATHS)
+    from_elements = extract_columns(QuestionnaireItem, elements, PATHS)
+
+    assert len(from_raw) == len(from_elements) == 20
+    assert from_raw.columns == from_elements.columns
+    assert from_raw["linkId"] == [item.linkId for item in elements]
+    assert from_raw["itemControl.code"] == [item.itemControl.code for item in elements]
+    assert from_raw["answerOptionsToggleExpression.option.code"][0] == [toggle.option.code for toggle in elements[0].answerOptionsToggleExpression]
+    # two paths start with itemControl, it is still lifted once per row
+    assert profiler.by_url()[(SDC_ITEM_CONTROL_SYSTEM, "lift")].calls == 20
+
+def test_numeric_columns_are_packed():
+    columns = extract_columns(QuestionnaireItem, [{"linkId": "a", "weight": 1, "score": 0.5}, {"linkId": "b", "weight": 2, "score": 1.5}], ["linkId", "weight", "score"])
+
+    assert columns["weight"] == array("q", [1, 2])
+    assert columns["score"] == array("d", [0.5, 1.5])
+    assert columns["linkId"] == ["a", "b"]
+
+def test_to_numpy():
+    numpy = pytest.importorskip("numpy")
+    columns = extract_columns(QuestionnaireItem, [{"linkId": "a", "weight": 1}], ["linkId", "weight"])
+
+    arrays = columns.to_numpy()
+
+    assert arrays["weight"].dtype == numpy.int64 and arrays["linkId"].dtype == object
+
+def test_raw_dicts_use_given_properties_and_fail_per_row():
+    raw = iter_items(make_questionnaire(CorpusSpec(items=3, depth=1)))
+    given = {**raw[0], "extension": [], "itemControl": {"system": TIRO_ITEM_CONTROL_SYSTEM, "code": "dropdown"}}
+    missing = {**raw[1], "extension": []}
+
+    columns = extract_columns(QuestionnaireItem, [given, missing, raw[2]], ["linkId", "itemControl.code"])
+
+    assert columns["itemControl.code"] == ["dropdown", None, QuestionnaireItem.model_validate(raw[2]).itemControl.code]
+    assert columns["itemControl.code"][0] == QuestionnaireItem.model_validate(given).itemControl.code
+    assert columns["linkId"] == [item["linkId"] for item in raw]
+    assert list(columns.errors) == [1] and isinstance(columns.errors[1]["itemControl"], AssertionError)
@@ -0,0 +1,50 @@
+import re
+
+from pydantic import BaseModel, ValidationError
+import pytest
+
+from pydantic_fhir_extensions.base import DATE_PATTERN, DATETIME_PATTERN
+from pydantic_fhir_extensions.dates import FHIRDate, FHIRDateTime, FHIRInstant
+
+
+class Observation(BaseModel):
+    date: FHIRDate | None = None
+    effective: FHIRDateTime | None = None
+    issued: FHIRInstant | None = None
+
+@pytest.mark.parametrize("text", [
+    "2024", "2024-02", "2024-02-29", "2024-02-29T13:45:00Z", "2024-02-29T13:45:00.123456789+14:00", "2024-12-31T23:59:60-05:30",
+])
+def test_valid_date_times_round_trip(text):
+    assert re.fullmatch(DATETIME_PATTERN, text)
+    observation = Observation.model_validate_json(f'{{"effective": "{text}"}}')
+
+    assert str(observation.effective) == text
+    assert observation.model_dump_json() == f'{{"date":null,"effective":"{text}","issued":null}}'
+
+@pytest.mark.parametrize("text", ["0000", "202", "2024-13", "2023-02-29", "2024-02-29T24:00:00Z", "2024-02-29T13:45", "2024-02-29T13:45:00+15:00", "2024-02-29 13:45:00Z"])
+def test_invalid_date_times_fail(text):
+    with pytest.raises(ValidationError):
+        Observation.model_validate({"effective": text})
+
+def test_date_and_instant_precision():
+    assert re.fullmatch(DATE_PATTERN, "2024-02-29")
+    with pytest.raises(ValidationError):
+        Observation.model_validate({"date": "2024-02-29T13:45:00Z"})
+    with pytest.raises(ValidationError):
+        Observation.model_validate({"issued": "2024-02-29"})
+
+    observation = Observation.model_validate({"date": "2024-02", "issued": "2024-02-29T13:45:00+01:00"})
+
+    assert observation.date.precision == "month" and observation.date.day is None
+    assert observation.issued.offset == 60
+    assert observation.date.contains(observation.issued)
+    assert observation.date.end.isoformat() == "2024-03-01T00:00:00+00:00"
+
+def test_comparison_without_reparsing():
+    values = [FHIRDateTime(text) for text in ["2024-02-29T13:45:00+01:00", "2024", "2024-02-29T12:44:59Z", "2024-02"]]
+
+    assert [str(value) for value in sorted(values)] == ["2024", "2024-02", "2024-02-29T12:44:59Z", "2024-02-29T13:45:00+01:00"]
+    assert FHIRDateTime("2024-02-29T13:45:00+01:00") == FHIRDateTime("2024-02-29T12:45:00Z")
+    assert FHIRDateTime("2024").overlaps(FHIRDateTime("2024-06"))
+    assert Observation.model_validate({"effective": "2024-06"}).effective is Observation.model_validate({"effective": "2024-06"}).effective
@@ -0,0 +1,62 @@
+import copy
+
+from benchmarks.corpus import CorpusSpec, make_questionnaire
+from pydantic_fhir_extensions.diff import Change, apply_patch, diff, patch
+from pydantic_fhir_extensions.questionnaire import Questionnaire, QuestionnaireItem
+from tests.helpers import make_item
+
+SPEC = CorpusSpec(items=40, depth=3, extensions_per_item=6, options_per_item=2)
+
+
+def test_content_hash_is_independent_of_the_extension_form():
+    json = make_item("q1", "radio")
+    unknown = {"url": "urn:vendor:extension", "valueString": "kept"}
+    lifted_last = QuestionnaireItem.model_validate({**json, "extension": [unknown, *json["extension"]]})
+    lifted_first = QuestionnaireItem.model_validate({**json, "extension": [*json["extension"], unknown]})
+
+    assert lifted_first.content_hash() == lifted_last.content_hash()
+    assert lifted_first.content_hash() == QuestionnaireItem.model_validate(lifted_last.model_dump_fhir()).content_hash()
+
+    lifted_first.text = "Edited"
+    assert lifted_first.content_hash() != lifted_last.content_hash()
+
+def test_diff_of_identical_trees_is_empty():
+    old = Questionnaire.model_validate(make_questionnaire(SPEC))
+    new = Questionnaire.model_validate(make_questionnaire(SPEC))
+
+    assert old.content_hash() == new.content_hash()
+    assert diff(old, new) == []
+
+def test_diff_and_patch_round_trip():
+    json = make_questionnaire(SPEC)
+    edited = copy.deepcopy(json)
+    edited["item"][3]["item"][0]["text"] = "Edited"
+    del edited["item"][5]
+    edited["item"].insert(1, make_item("inserted"))
+    edited["item"][8]["extension"].reverse()
+    edited["title"] = "Revision 2"
+    old, new = Questionnaire.model_validate(json), Questionnaire.model_validate(edited)
+
+    changes = diff(old, new)
+
+    assert [(change.op, change.path) for change in changes] == [
+        ("add", "/title"),
+        ("add", "/item/1"),
+        ("replace", "/item/4/item/0/text"),
+        ("remove", "/item/6"),
+        ("replace", "/item/8/extension"),
+    ]
+    assert changes[2].to_json_patch() == {"op": "replace", "path": "/item/4/item/0/text", "value": "Edited"}
+    patched = patch(old, changes)
+    assert patched.content_hash() == new.content_hash()
+    assert patched.model_dump_fhir() == new.model_dump_fhir()
+    # the source data is left untouched
+    assert old.model_dump_fhir(incremental=True) == Questionnaire.model_validate(json).model_dump_fhir()
+
+def test_apply_patch_escapes_pointers():
+    data = {"a/b": {"c~d": 1}, "list": [1, 2]}
+
+    patched = apply_patch(data, [Change("replace", "/a~1b/c~0d", 2), Change("add", "/list/1", 3), Change("remove", "/list/0")])
+
+    assert patched == {"a/b": {"c~d": 2}, "list": [3, 2]}
+    assert data == {"a/b": {"c~d": 1}, "list": [1, 2]}
@@ -1,7 +1,15 @@
 
 
+import json
+
+from pydantic import ValidationError
+import pytest
+
+from pydantic_fhir_extensions.base import DecimalExtension, RawExtension
 from pydantic_fhir_extensions.extensions import ExtAnswerOptionsToggleExpression, ExtItemControl
-from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+from pydantic_fhir_extensions.extensions.validator import DeferredExtension
+from pydantic_fhir_extensions.questionnaire import Questionnaire, QuestionnaireItem
+from tests.helpers import make_item, make_questionnaire
 
 def test_validation_of_item_control_extension():
     json = {
@@ -232,3 +240,107 @@ def test_validation_of_question_with_toggle_expression():
 
     result_2 = QuestionnaireItem.model_validate(json_2)
     assert result_1.model_dump_fhir() == result_2.model_dump_fhir()
+
+def test_extension_field_index():
+    assert dict(QuestionnaireItem.iter_extension_fields()).keys() == {"itemControl", "answerOptionsToggleExpression"}
+    assert QuestionnaireItem.__extension_urls__ == {
+        "http://hl7.org/fhir/StructureDefinition/questionnaire-itemControl",
+        "http://hl7.org/fhir/uv/sdc/StructureDefinition/sdc-questionnaire-answerOptionsToggleExpression",
+    }
+    assert ExtAnswerOptionsToggleExpression.__fhir_exclude__ == {"option", "expression"}
+    assert ExtItemControl.__extension_fields__ == {}
+
+def test_unknown_extensions_are_kept_next_to_lifted_extensions():
+    unknown = {"url": "urn:vendor:extension", "valueString": "kept"}
+    json = {
+        "extension": [
+            unknown,
+            {
+                "url": "http://hl7.org/fhir/StructureDefinition/questionnaire-itemControl",
+                "valueCodeableConcept": {
+                    "text": "Text",
+                    "coding": [
+                        {
+                            "system": "http://tiro.health/fhir/CodeSystem/tiro-questionnaire-item-control",
+                            "code": "text",
+                            "display": "Text"
+                        }
+                    ]
+                }
+            },
+        ],
+        "type": "text",
+        "text": "This is a question",
+        "linkId": "question-1.1"
+    }
+
+    result = QuestionnaireItem.model_validate(json)
+    assert result.itemControl.code == "text"
+    assert result.answerOptionsToggleExpression == []
+
+    serialized = result.model_dump_fhir()
+    assert serialized["extension"][0] == unknown
+    assert serialized == json
+
+def test_lazy_extension_lifting():
+
+    json = make_questionnaire(depth=3)
+    eager = Questionnaire.model_validate(json)
+    lazy = Questionnaire.model_validate(json, context={"lazy": True})
+
+    item = lazy.get_item("q.0")
+    assert isinstance(item.__dict__["itemControl"], DeferredExtension)
+    assert item.itemControl.code == "text"
+    assert not isinstance(item.__dict__["itemControl"], DeferredExtension)
+    assert lazy.model_dump_fhir_json() == eager.model_dump_fhir_json()
+    assert lazy == eager
+
+def test_lazy_extension_errors_are_raised_on_access():
+
+    json = {
+        "extension": [{
+            "url": "http://hl7.org/fhir/StructureDefinition/questionnaire-itemControl",
+            "valueCodeableConcept": {"text": "Other", "coding": [{"system": "urn:other", "code": "other"}]}
+        }],
+        "type": "text",
+        "text": "This is a question",
+        "linkId": "question-1.1"
+    }
+
+    result = QuestionnaireItem.model_validate(json, context={"lazy": True})
+
+    assert result.linkId == "question-1.1"
+    with pytest.raises(ValidationError):
+        result.itemControl
+
+def test_subclasses_inherit_extension_fields():
+    class RequiredItem(QuestionnaireItem):
+        required: bool = True
+
+    assert RequiredItem.__extension_fields__.keys() == QuestionnaireItem.__extension_fields__.keys()
+    assert RequiredItem.model_fields["itemControl"].is_required() is QuestionnaireItem.model_fields["itemControl"].is_required()
+
+def test_passthrough_keeps_unknown_extensions_raw():
+
+    unknown = {"url": "urn:vendor:weight", "valueDecimal": 1.50, "extension": [{"url": "not checked"}]}
+    data = make_item("q1")
+    data["extension"] = [unknown, *data["extension"]]
+
+    result = QuestionnaireItem.model_validate_json(json.dumps(data), context={"passthrough": True})
+
+    assert result.itemControl.code == "text"
+    raw = result.extension[0]
+    assert type(raw) is RawExtension and raw == unknown and raw.url == "urn:vendor:weight"
+    assert result.model_dump_fhir()["extension"][0] == unknown
+    assert json.loads(result.model_dump_fhir_json())["extension"][0] == unknown
+    with pytest.raises(ValidationError):
+        result.validate_raw_extensions()
+
+    unknown.pop("extension")
+    result = QuestionnaireItem.model_validate(data, context={"passthrough": True})
+    result.validate_raw_extensions()
+    assert type(result.extension[0]) is DecimalExtension and result.model_dump_fhir() == QuestionnaireItem.model_validate(data).model_dump_fhir()
+
+    data["extension"].append({"valueString": "no url"})
+    with pytest.raises(ValidationError, match="string url"):
+        QuestionnaireItem.model_validate(data, context={"passthrough": True})
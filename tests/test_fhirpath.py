@@ -0,0 +1,79 @@
+from decimal import Decimal
+
+import pytest
+
+from pydantic_fhir_extensions.base import Coding
+from pydantic_fhir_extensions.fhirpath import FHIRPathError, compile_expression, evaluate, evaluate_toggle_expressions, precompile_toggle_expressions
+from pydantic_fhir_extensions.questionnaire import Questionnaire
+
+RESPONSE = {
+    "resourceType": "QuestionnaireResponse",
+    "item": [
+        {"linkId": "a", "answer": [{"valueCoding": {"system": "urn:yes-no", "code": "yes"}}, {"valueString": "x"}]},
+        {"linkId": "b", "item": [{"linkId": "c", "answer": [{"valueInteger": 3}]}]},
+    ],
+}
+
+@pytest.mark.parametrize("expression,expected", [
+    ("QuestionnaireResponse.item.linkId", ["a", "b"]),
+    ("item.where(linkId = 'a').answer.value.code", ["yes"]),
+    ("item.answer.value.count() = 2", [True]),
+    ("item[1].item.answer.value + 2", [5]),
+    ("-3 + 5 * 2", [7]),
+    ("(1 | 2 | 1).count()", [2]),
+    ("'c' in item.item.linkId", [True]),
+    ("true and {}", []),
+    ("false and {}", [False]),
+    ("item.exists(linkId = 'z').not()", [True]),
+    ("iif(item.empty(), 'empty', 'answered')", ["answered"]),
+    ("7 div 2", [3]),
+    ("-7 div 2", [-3]),
+    ("7 div -2", [-3]),
+    ("-7 mod 2", [-1]),
+    ("7 mod -2", [1]),
+    ("-5.5 div 0.7", [-7]),
+    ("-5.5 mod 0.7", [Decimal("-0.6")]),
+    ("1 div 0", []),
+])
+def test_evaluate(expression, expected):
+    assert evaluate(expression, RESPONSE) == expected
+
+def test_compiled_expressions_are_cached():
+    assert compile_expression("count(../answer) = 0") is compile_expression("count(../answer) = 0")
+    with pytest.raises(FHIRPathError):
+        compile_expression("item.unknownFunction()")
+
+def test_evaluate_toggle_expressions():
+    def toggle(code, expression):
+        return {
+            "url": "http://hl7.org/fhir/uv/sdc/StructureDefinition/sdc-questionnaire-answerOptionsToggleExpression",
+            "extension": [
+                {"url": "option", "valueCoding": {"system": "urn:yes-no", "code": code}},
+                {"url": "expression", "valueExpression": {"language": "text/fhirpath", "expression": expression}},
+            ],
+        }
+
+    questionnaire = Questionnaire.model_validate({
+        "status": "active",
+        "item": [{
+            "linkId": "b",
+            "text": "Group",
+            "type": "group",
+            "itemControl": {"system": "http://tiro.health/fhir/CodeSystem/tiro-questionnaire-item-control", "code": "text"},
+            "item": [{
+                "linkId": "c",
+                "text": "Question",
+                "type": "integer",
+                "itemControl": {"system": "http://tiro.health/fhir/CodeSystem/tiro-questionnaire-item-control", "code": "text"},
+                "extension": [toggle("yes", "answer.value > 2"), toggle("no", "count(../answer) > 0")],
+                "answerOption": [{"valueCoding": {"system": "urn:yes-no", "code": code}} for code in ("yes", "no")],
+            }],
+        }],
+    })
+
+    compiled = precompile_toggle_expressions(questionnaire)
+    assert compiled == [compile_expression("answer.value > 2"), compile_expression("count(../answer) > 0")]
+
+    result = evaluate_toggle_expressions(questionnaire, RESPONSE)
+
+    assert result == {"c": {Coding(system="urn:yes-no", code="yes"): True, Coding(system="urn:yes-no", code="no"): False}}
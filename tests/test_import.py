@@ -0,0 +1,60 @@
+import json
+import pickle
+import subprocess
+import sys
+
+from benchmarks.corpus import CorpusSpec, make_questionnaire as make_corpus_questionnaire
+from pydantic_fhir_extensions.questionnaire import Questionnaire
+
+def run_python(code: str):
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+def test_import_builds_no_schemas():
+    result = run_python("""
+import json, sys
+import pydantic_fhir_extensions.questionnaire
+from pydantic import BaseModel
+built = sorted(
+    name for module_name, module in list(sys.modules.items()) if module_name.startswith("pydantic_fhir_extensions")
+    for name, value in vars(module).items()
+    if isinstance(value, type) and issubclass(value, BaseModel) and value is not BaseModel and value.__pydantic_complete__
+)
+print(json.dumps({"built": built}))
+""")
+
+    # building the schemas is what made the import slow; a wall-clock budget would be flaky on shared CI
+    assert result["built"] == []
+
+def test_extension_exports_are_loaded_on_access():
+    result = run_python("""
+import json, sys
+import pydantic_fhir_extensions.extensions as extensions
+before = "pydantic_fhir_extensions.extensions.item_control" in sys.modules
+control = extensions.ExtItemControl
+after = "pydantic_fhir_extensions.extensions.item_control" in sys.modules
+print(json.dumps({"before": before, "after": after, "name": control.__name__, "toggle": "pydantic_fhir_extensions.extensions.toggle_exclusive" in sys.modules}))
+""")
+
+    assert result == {"before": False, "after": True, "name": "ExtItemControl", "toggle": False}
+
+def test_deferred_schemas_build_on_first_use():
+    result = run_python("""
+import json
+from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+from tests.helpers import make_item
+item = QuestionnaireItem.model_validate(make_item("q1", "radio"))
+print(json.dumps({"complete": QuestionnaireItem.__pydantic_complete__, "dump": item.model_dump_fhir() == make_item("q1", "radio")}))
+""")
+
+    assert result == {"complete": True, "dump": True}
+
+def test_unpickled_models_dump_before_any_validation():
+    questionnaire = Questionnaire.model_validate(make_corpus_questionnaire(CorpusSpec(items=5, depth=2, options_per_item=2)))
+    result = run_python(f"""
+import json, pickle
+questionnaire = pickle.loads({pickle.dumps(questionnaire)!r})
+print(json.dumps({{"dump": questionnaire.model_dump_fhir(), "incremental": questionnaire.model_dump_fhir(incremental=True)}}))
+""")
+
+    assert result["dump"] == result["incremental"] == questionnaire.model_dump_fhir()
@@ -0,0 +1,56 @@
+from pydantic import ValidationError
+import pytest
+
+from pydantic_fhir_extensions import base
+from pydantic_fhir_extensions.base import BaseExtension, Coding, FrozenCodeableConcept, FrozenCoding, clear_interned
+from pydantic_fhir_extensions.extensions import ExtItemControl
+from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+from tests.helpers import make_item
+
+
+def test_interned_codings_are_shared_and_frozen():
+    clear_interned()
+    item_1 = QuestionnaireItem.model_validate(make_item("q1"), context={"intern": True})
+    item_2 = QuestionnaireItem.model_validate(make_item("q2"), context={"intern": True})
+
+    assert isinstance(item_1.itemControl, FrozenCoding)
+    assert item_1.itemControl is item_2.itemControl
+    assert hash(item_1.itemControl) == hash((item_1.itemControl.system, item_1.itemControl.code))
+    with pytest.raises(ValidationError):
+        item_1.itemControl.code = "radio"
+
+    assert item_1.model_dump_fhir() == QuestionnaireItem.model_validate(make_item("q1")).model_dump_fhir()
+    assert not isinstance(QuestionnaireItem.model_validate(make_item("q3")).itemControl, FrozenCoding)
+
+def test_interned_property_values_lower_to_shared_concepts():
+    item = QuestionnaireItem.model_validate(make_item("q1"), context={"intern": True})
+
+    [ext_1] = ExtItemControl.from_property_value(item.itemControl)
+    [ext_2] = ExtItemControl.from_property_value(item.itemControl)
+
+    assert ext_1.valueCodeableConcept is ext_2.valueCodeableConcept
+    assert ext_1.valueCodeableConcept.coding[0] is item.itemControl
+
+def test_interned_codeable_concepts():
+    json = {"url": "urn:vendor:concept", "valueCodeableConcept": {"text": "Yes", "coding": [{"system": "urn:yes-no", "code": "yes"}]}}
+
+    ext_1 = BaseExtension.model_validate(json, context={"intern": True})
+    ext_2 = BaseExtension.model_validate(json, context={"intern": True})
+
+    assert isinstance(ext_1.valueCodeableConcept, FrozenCodeableConcept)
+    assert ext_1.valueCodeableConcept is ext_2.valueCodeableConcept
+    assert ext_1.model_dump(mode="json", exclude_none=True) == {"url": "urn:vendor:concept", "extension": [], **json}
+
+@pytest.mark.parametrize("data", [{"code": ["x"]}, {"code": "x", "system": {"url": "urn:x"}}, {"code": "x", "userSelected": []}])
+def test_invalid_codings_fail_validation_when_interning(data):
+    with pytest.raises(ValidationError):
+        Coding.model_validate(data, context={"intern": True})
+
+def test_interning_is_bounded(monkeypatch):
+    clear_interned()
+    monkeypatch.setattr(base, "MAX_INTERNED", 2)
+    codings = [Coding.model_validate({"system": "urn:bounded", "code": f"c{i % 3}"}, context={"intern": True}) for i in range(6)]
+
+    assert codings[0] is codings[3] and codings[1] is codings[4]
+    assert codings[2] is not codings[5] and codings[2] == codings[5] and isinstance(codings[5], FrozenCoding)
+    clear_interned()
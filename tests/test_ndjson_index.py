@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from pydantic_fhir_extensions.ndjson_index import IndexedNDJSON, build_index, iter_item_spans
+from pydantic_fhir_extensions.questionnaire import Questionnaire, QuestionnaireItem
+from tests.helpers import make_questionnaire
+
+
+def write_ndjson(path, resources):
+    with open(path, "w", encoding="utf-8") as fp:
+        for resource in resources:
+            fp.write(json.dumps(resource, ensure_ascii=False) + "\n" if resource is not None else "\n")
+
+def test_item_spans_follow_nested_items_only():
+    resource = {"id": "a", "title": "\"item\" é", "item": [
+        {"linkId": "1", "text": "x", "code": [{"linkId": "not an item"}], "item": [{"text": "no linkId"}, {"linkId": "1.1"}]},
+        {"text": "linkId", "linkId": "2"},
+    ]}
+    line = json.dumps(resource, ensure_ascii=False).encode()
+
+    spans = {link_id: json.loads(line[start:end]) for link_id, start, end in iter_item_spans(line)}
+
+    assert spans == {"1": resource["item"][0], "1.1": resource["item"][0]["item"][1], "2": resource["item"][1]}
+
+def test_lookup_by_id_and_link_id(tmp_path):
+    path = str(tmp_path / "export.ndjson")
+    questionnaires = [{**make_questionnaire(depth=3), "id": f"q{index}", "title": f"Vragenlijst {index} ✓"} for index in range(5)]
+    write_ndjson(path, [questionnaires[0], {"resourceType": "Patient", "id": "q1"}, None, *questionnaires[1:]])
+
+    build_index(path, link_ids=True)
+
+    with IndexedNDJSON(path) as index:
+        assert len(index) == 6
+        questionnaire = index.get(Questionnaire, "q1")
+        assert questionnaire.model_dump_fhir() == Questionnaire.model_validate(questionnaires[1]).model_dump_fhir()
+        item = index.get_item(QuestionnaireItem, "q3", "q.1.0")
+        assert item.itemControl.code == "radio" and item == Questionnaire.model_validate(questionnaires[3]).get_item("q.1.0")
+        assert index.get(Questionnaire, "missing") is None
+        assert index.get_item(QuestionnaireItem, "q3", "missing") is None
+        assert index.get_bytes(*next(index.find("Patient/q1"))) == b'{"resourceType": "Patient", "id": "q1"}'
+
+def test_stale_or_missing_index_is_refused(tmp_path):
+    path = str(tmp_path / "export.ndjson")
+    write_ndjson(path, [{**make_questionnaire(depth=1), "id": "q"}])
+    index_path = build_index(path, str(tmp_path / "export.index"))
+
+    with IndexedNDJSON(path, index_path) as index:
+        assert index.get_item(QuestionnaireItem, "q", "q") is None
+
+    with open(path, "a") as fp:
+        fp.write("\n")
+    with pytest.raises(ValueError, match="stale"):
+        IndexedNDJSON(path, index_path)
+    with pytest.raises(ValueError, match="not an NDJSON index"):
+        IndexedNDJSON(path, path)
@@ -0,0 +1,31 @@
+import json
+
+from pydantic_fhir_extensions.parallel import ParallelValidator
+from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+from tests.helpers import make_item
+
+
+def test_parallel_validation_keeps_input_order():
+    items = [make_item(f"q{i}", "radio" if i % 2 else "text") for i in range(25)]
+    items[7] = {"linkId": "broken"}
+
+    with ParallelValidator(QuestionnaireItem, max_workers=2, chunk_size=4) as validator:
+        result = validator.validate(items)
+        as_json = validator.validate(json.dumps(item).encode() for item in items)
+        dumped = validator.validate(items, output="json")
+
+    assert set(result.errors) == set(as_json.errors) == set(dumped.errors) == {7}
+    assert [item.linkId for item in result.valid] == [f"q{i}" for i in range(25) if i != 7]
+    assert result.results == as_json.results
+    assert [json.loads(document) for document in dumped.valid] == [item.model_dump_fhir() for item in result.valid]
+
+def test_malformed_documents_keep_their_shard_index():
+    documents = [json.dumps(make_item(f"q{i}")).encode() for i in range(10)]
+    # a top-level comma must not split the document into two models
+    documents[2] = documents[2] + b"," + documents[3]
+
+    with ParallelValidator(QuestionnaireItem, max_workers=2, chunk_size=4) as validator:
+        result = validator.validate(documents)
+
+    assert len(result.results) == 10 and set(result.errors) == {2}
+    assert [item and item.linkId for item in result.results] == [f"q{i}" if i != 2 else None for i in range(10)]
@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+from pydantic_fhir_extensions.pipeline import AsyncPipeline
+from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+from tests.helpers import make_item
+
+
+async def produce(items, produced):
+    for item in items:
+        produced.append(item)
+        yield item
+        await asyncio.sleep(0)
+
+async def collect(pipeline, items, produced, consumed):
+    results = []
+    async for result in pipeline.process(produce(items, produced)):
+        consumed.append(len(produced))
+        results.append(result)
+    return results
+
+def test_pipeline_keeps_order_and_reports_errors():
+    items = [make_item(f"q{i}", "radio" if i % 2 else "text") for i in range(20)]
+    items[5] = {"linkId": "broken"}
+
+    async def main():
+        async with AsyncPipeline(QuestionnaireItem, chunk_size=3, max_in_flight=6) as pipeline:
+            models = await collect(pipeline, items, [], [])
+        async with AsyncPipeline(QuestionnaireItem, output="fhir") as pipeline:
+            dumped = await collect(pipeline, [json.dumps(item).encode() for item in items], [], [])
+        return models, dumped
+
+    models, dumped = asyncio.run(main())
+
+    assert [result.index for result in models] == list(range(20))
+    assert models[5].value is None and models[5].errors
+    assert [result.value.linkId for result in models if result.value is not None] == [f"q{i}" for i in range(20) if i != 5]
+    assert [result.value for result in dumped if result.value is not None] == [item for i, item in enumerate(items) if i != 5]
+
+def test_pipeline_applies_back_pressure():
+    items = [make_item(f"q{i}") for i in range(30)]
+    produced, consumed = [], []
+
+    async def main():
+        async with AsyncPipeline(QuestionnaireItem, chunk_size=2, max_in_flight=4) as pipeline:
+            return await collect(pipeline, items, produced, consumed)
+
+    results = asyncio.run(main())
+
+    assert len(results) == 30
+    # when the n-th result is consumed, at most `max_in_flight` items were read ahead of it
+    assert all(read - index <= 4 for index, read in enumerate(consumed, start=1))
+
+def test_pipeline_with_processes():
+    items = [json.dumps(make_item(f"q{i}")).encode() for i in range(10)]
+
+    async def main():
+        async with AsyncPipeline.with_processes(QuestionnaireItem, max_workers=2, chunk_size=4, max_in_flight=8, output="json") as pipeline:
+            return await collect(pipeline, items, [], [])
+
+    results = asyncio.run(main())
+
+    assert [json.loads(result.value)["linkId"] for result in results] == [f"q{i}" for i in range(10)]
@@ -0,0 +1,40 @@
+from pydantic_fhir_extensions import profiling
+from pydantic_fhir_extensions.extensions.item_control import SDC_ITEM_CONTROL_SYSTEM
+from pydantic_fhir_extensions.extensions.toggle_exclusive import ANSWER_OPTION_TOGGLE_EXPRESSION
+from pydantic_fhir_extensions.profiling import disable_profiling, enable_profiling, profile_extensions
+from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+from tests.helpers import make_item
+
+
+def test_profiler_records_match_lift_and_lower_per_model_and_url():
+    events = []
+    with profile_extensions(events.append) as profiler:
+        item = QuestionnaireItem.model_validate(make_item("q1", "radio"))
+        item.model_dump_fhir()
+
+    assert profiling.PROFILER is None
+    stats = profiler.stats
+    assert stats[("QuestionnaireItem", None, "match")].calls == 2
+    assert stats[("QuestionnaireItem", SDC_ITEM_CONTROL_SYSTEM, "lift")].count == 1
+    assert stats[("QuestionnaireItem", SDC_ITEM_CONTROL_SYSTEM, "lower")].count == 1
+    assert stats[("QuestionnaireItem", ANSWER_OPTION_TOGGLE_EXPRESSION, "lift")].count == 0
+    assert all(stat.seconds >= 0 for stat in stats.values())
+    assert len(events) == sum(stat.calls for stat in stats.values())
+    assert profiler.by_url()[(SDC_ITEM_CONTROL_SYSTEM, "lift")].calls == 1
+
+def test_lazy_lifting_is_recorded_on_access():
+    profiler = enable_profiling()
+    try:
+        item = QuestionnaireItem.model_validate(make_item("q1"), context={"lazy": True})
+        assert ("QuestionnaireItem", SDC_ITEM_CONTROL_SYSTEM, "lift") not in profiler.stats
+        assert item.itemControl.code == "text"
+        assert profiler.stats[("QuestionnaireItem", SDC_ITEM_CONTROL_SYSTEM, "lift")].calls == 1
+    finally:
+        assert disable_profiling() is profiler
+
+def test_nothing_is_recorded_when_disabled():
+    with profile_extensions() as profiler:
+        pass
+    QuestionnaireItem.model_validate(make_item("q1")).model_dump_fhir()
+
+    assert profiler.stats == {}
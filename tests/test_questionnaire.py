@@ -0,0 +1,202 @@
+import gc
+import json
+import pickle
+
+from pydantic import ValidationError
+import pytest
+
+from benchmarks.corpus import CorpusSpec, make_questionnaire as make_corpus_questionnaire
+from pydantic_fhir_extensions.base import CodeableConcept, CodeableConceptExtension, Coding, Expression, get_owners
+from pydantic_fhir_extensions.batch import dump_many_fhir_json
+from pydantic_fhir_extensions.extensions.item_control import TIRO_ITEM_CONTROL_SYSTEM
+from pydantic_fhir_extensions.questionnaire import AnswerOption, Questionnaire, QuestionnaireItem
+from tests.helpers import make_item, make_questionnaire
+
+
+def test_nested_items_are_lifted_and_indexed():
+    json = make_questionnaire(depth=10)
+
+    questionnaire = Questionnaire.model_validate(json)
+
+    items = list(questionnaire.iter_items())
+    assert len(items) == 2 ** 10 - 1
+    assert items[0].linkId == "q" and items[1].linkId == "q.0" and items[-1].linkId == "q" + ".1" * 9
+    deepest = questionnaire.get_item("q" + ".0" * 9)
+    assert deepest is not None and deepest.itemControl.code == "text"
+    assert questionnaire.get_item("q.1.0").itemControl.code == "radio"
+    assert questionnaire.get_item("missing") is None
+    assert questionnaire.model_dump_fhir() == json
+
+def test_copies_index_their_own_items():
+    questionnaire = Questionnaire.model_validate(make_questionnaire(depth=3))
+
+    for copy in (questionnaire.model_copy(deep=True), pickle.loads(pickle.dumps(questionnaire))):
+        copy.get_item("q.0.1").text = "Edited"
+
+        assert copy.get_item("q.0.1") is copy.item[0].item[0].item[1]
+        assert copy.model_dump_fhir()["item"][0]["item"][0]["item"][1]["text"] == "Edited"
+    assert questionnaire.get_item("q.0.1").text == "This is a question"
+
+def test_assigned_items_are_indexed():
+    questionnaire = Questionnaire.model_validate(make_questionnaire(depth=3))
+    assert questionnaire.get_item("q.0") is not None
+    new_item = QuestionnaireItem.model_validate(make_item("new"))
+
+    questionnaire.item = [new_item]
+
+    assert questionnaire.get_item("new") is new_item
+    assert questionnaire.get_item("q.0") is None
+
+def test_duplicate_link_ids_fail():
+    json = make_questionnaire(depth=2)
+    json["item"][0]["item"][1]["linkId"] = "q.0"
+
+    with pytest.raises(ValidationError):
+        Questionnaire.model_validate(json)
+
+def test_model_dump_fhir_json_matches_model_dump_fhir():
+    questionnaire = Questionnaire.model_validate(make_questionnaire(depth=4))
+
+    assert json.loads(questionnaire.model_dump_fhir_json()) == questionnaire.model_dump_fhir()
+    assert json.loads(dump_many_fhir_json(Questionnaire, [questionnaire])) == [questionnaire.model_dump_fhir()]
+
+def test_incremental_dump_renders_only_the_changed_path():
+    questionnaire = Questionnaire.model_validate(make_questionnaire(depth=4))
+    first = questionnaire.model_dump_fhir(incremental=True)
+    assert first == questionnaire.model_dump_fhir()
+    assert questionnaire.model_dump_fhir(incremental=True) is first
+
+    questionnaire.get_item("q.0.1.1").text = "Edited"
+    second = questionnaire.model_dump_fhir(incremental=True)
+
+    assert second == questionnaire.model_dump_fhir()
+    assert second["item"][0]["item"][0]["item"][1]["item"][1]["text"] == "Edited"
+    # untouched siblings along the path reuse their fragments
+    assert second["item"][0]["item"][1] is first["item"][0]["item"][1]
+    assert second["item"][0]["item"][0]["item"][0] is first["item"][0]["item"][0]["item"][0]
+    assert json.loads(questionnaire.model_dump_fhir_json(incremental=True)) == second
+
+def test_incremental_dump_sees_list_edits_and_extension_properties():
+    questionnaire = Questionnaire.model_validate(make_corpus_questionnaire(CorpusSpec(items=12, depth=3, options_per_item=3)))
+    questionnaire.model_dump_fhir(incremental=True)
+    items = list(questionnaire.iter_items())
+
+    items[1].item.append(QuestionnaireItem.model_validate(make_item("new")))
+    items[2].answerOptionsToggleExpression[0].expression = Expression(expression="false")
+    items[3].answerOptionsToggleExpression.pop()
+    items[4].itemControl = Coding(system=TIRO_ITEM_CONTROL_SYSTEM, code="radio")
+    assert questionnaire.model_dump_fhir(incremental=True) == questionnaire.model_dump_fhir()
+
+    # in-place edits of a list held by a value that is not an element need mark_dirty
+    concept = CodeableConcept(text="Tags", coding=[Coding(system="urn:tags", code="a")])
+    items[5].extension = [*items[5].extension, CodeableConceptExtension(url="urn:tags", valueCodeableConcept=concept)]
+    assert questionnaire.model_dump_fhir(incremental=True) == questionnaire.model_dump_fhir()
+    concept.coding.append(Coding(system="urn:tags", code="b"))
+    items[5].mark_dirty()
+    assert questionnaire.model_dump_fhir(incremental=True) == questionnaire.model_dump_fhir()
+
+def test_incremental_dump_sees_assignments_in_nested_property_values():
+    questionnaire = Questionnaire.model_validate(make_corpus_questionnaire(CorpusSpec(items=12, depth=3, options_per_item=3)))
+    first = questionnaire.model_dump_fhir(incremental=True)
+    items = list(questionnaire.iter_items())
+    copy = items[6].model_copy()
+    copy.model_dump_fhir(incremental=True)
+
+    items[2].answerOptionsToggleExpression[0].expression.expression = "1 = 2"
+    items[4].itemControl.code = "checkbox"
+    items[5].answerOption[0].valueCoding.display = "Renamed"
+    # shared with the shallow copy: both are rendered again
+    items[6].itemControl.code = "dropdown"
+    second = questionnaire.model_dump_fhir(incremental=True)
+
+    assert second == questionnaire.model_dump_fhir()
+    assert second != first
+    assert copy.model_dump_fhir(incremental=True) == copy.model_dump_fhir()
+    item_control = next(extension for extension in copy.model_dump_fhir(incremental=True)["extension"] if "valueCodeableConcept" in extension)
+    assert item_control["valueCodeableConcept"]["coding"][0]["code"] == "dropdown"
+
+def test_shared_property_values_do_not_keep_their_owners_alive():
+    shared = Coding(system="urn:options", code="a")
+    options = [AnswerOption(valueCoding=shared) for _ in range(1000)]
+    for option in options:
+        option.model_dump_fhir(incremental=True)
+    kept = options[-1]
+    del options, option
+    gc.collect()
+
+    assert get_owners(shared) == [kept]
+    shared.display = "A"
+    assert kept.model_dump_fhir(incremental=True)["valueCoding"]["display"] == "A"
+
+def make_item_with_options(codes, toggled):
+    item = make_item("choice", "radio")
+    item["answerOption"] = [{"valueCoding": {"system": "urn:options", "code": code, "display": code.upper()}} for code in codes]
+    item["extension"] = item["extension"] + [
+        {
+            "url": "http://hl7.org/fhir/uv/sdc/StructureDefinition/sdc-questionnaire-answerOptionsToggleExpression",
+            "extension": [
+                {"url": "option", "valueCoding": {"system": "urn:options", "code": code}},
+                {"url": "expression", "valueExpression": {"expression": expression}},
+            ],
+        }
+        for code, expression in toggled
+    ]
+    return item
+
+def test_answer_option_and_toggle_indexes():
+    codes = [f"o{i}" for i in range(300)]
+    item = QuestionnaireItem.model_validate(make_item_with_options(codes, [("o1", "true"), ("o7", "false"), ("o1", "1 = 1")]))
+
+    option = item.get_answer_option(Coding(system="urn:options", code="o250"))
+    assert option is item.answerOption[250]
+    assert item.get_answer_option(Coding(system="urn:options", code="o250", version="2")) is None
+    assert item.get_answer_option(Coding(system="urn:other", code="o250")) is None
+    assert [toggle.expression.expression for toggle in item.get_toggle_expressions(Coding(system="urn:options", code="o1"))] == ["true", "1 = 1"]
+    assert item.get_toggle_expressions(Coding(system="urn:options", code="o2")) == ()
+
+    item.answerOption.append(AnswerOption(valueCoding=Coding(system="urn:options", code="new")))
+    item.reindex_answer_options()
+    assert item.get_answer_option(Coding(system="urn:options", code="new")) is item.answerOption[-1]
+    assert item.model_copy().get_answer_option(Coding(system="urn:options", code="o3")) is item.answerOption[3]
+
+def test_assigned_answer_options_and_toggles_are_indexed():
+    item = QuestionnaireItem.model_validate(make_item_with_options(["a", "b"], [("a", "true")]))
+    assert item.get_answer_option(Coding(system="urn:options", code="a")) is item.answerOption[0]
+
+    item.answerOption = [AnswerOption(valueCoding=Coding(system="urn:options", code="c"))]
+
+    # the toggle of the removed option is checked again
+    with pytest.raises(ValueError, match="not an answerOption"):
+        item.get_answer_option(Coding(system="urn:options", code="c"))
+
+    item.answerOptionsToggleExpression = []
+
+    assert item.get_answer_option(Coding(system="urn:options", code="c")) is item.answerOption[0]
+    assert item.get_answer_option(Coding(system="urn:options", code="a")) is None
+    assert item.get_toggle_expressions(Coding(system="urn:options", code="a")) == ()
+
+def test_toggles_must_match_an_answer_option():
+    json = make_item_with_options(["yes", "no"], [("maybe", "true")])
+
+    with pytest.raises(ValidationError, match="not an answerOption of item `choice`"):
+        QuestionnaireItem.model_validate(json)
+
+    # lazy validation does not lift the toggles: the check runs on first lookup
+    item = QuestionnaireItem.model_validate(json, context={"lazy": True})
+    with pytest.raises(ValueError, match="not an answerOption"):
+        item.get_answer_option(Coding(system="urn:options", code="yes"))
+
+def test_trusted_construction_matches_validation():
+    json_data = make_corpus_questionnaire(CorpusSpec(items=40, depth=4, extensions_per_item=8, known_ratio=0.5, options_per_item=3))
+    validated = Questionnaire.model_validate(json_data)
+
+    questionnaire = Questionnaire.model_construct_trusted(json_data)
+
+    assert questionnaire == validated
+    assert questionnaire.model_dump_fhir() == validated.model_dump_fhir()
+    assert questionnaire.model_dump_fhir_json() == validated.model_dump_fhir_json()
+    item = questionnaire.get_item(validated.item[0].linkId)
+    assert item is questionnaire.item[0] and item.itemControl == validated.item[0].itemControl
+    option = item.answerOption[1]
+    assert item.get_answer_option(option.valueCoding) is option
+    assert type(item.extension[0].url) is str and item.model_fields_set == validated.item[0].model_fields_set
@@ -0,0 +1,65 @@
+import io
+import json
+
+import pytest
+
+from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+from pydantic_fhir_extensions.stream import BundleReader, iter_bundle, iter_ndjson
+from tests.helpers import make_item
+
+
+def make_bundle():
+    return {
+        "resourceType": "Bundle",
+        "type": "collection",
+        "meta": {"tag": [{"code": "entry"}], "versionId": "v\u00e9", "security": [False, True, None, -1.5e3, "\\\""]},
+        "entry": [
+            {"fullUrl": "urn:uuid:1", "resource": {"resourceType": "QuestionnaireItem", **make_item("q1")}},
+            {"fullUrl": "urn:uuid:2", "resource": {"resourceType": "Patient", "id": "p1"}},
+            {"fullUrl": "urn:uuid:3", "resource": {"resourceType": "QuestionnaireItem", **make_item("q3", "radio")}},
+        ],
+        "total": 3,
+    }
+
+def test_bundle_reader_handles_chunk_boundaries():
+    bundle = make_bundle()
+    text = json.dumps(bundle, indent=2).encode()
+
+    for chunk_size in (1, 7, 64, 1 << 16):
+        entries = list(BundleReader(io.BytesIO(text), chunk_size=chunk_size).iter_entries())
+        assert entries == bundle["entry"]
+
+def test_iter_bundle_matches_model_validate():
+    bundle = make_bundle()
+    fp = io.BytesIO(json.dumps(bundle).encode())
+
+    items = list(iter_bundle(fp, QuestionnaireItem, resource_type="QuestionnaireItem"))
+
+    assert items == [QuestionnaireItem.model_validate(bundle["entry"][i]["resource"]) for i in (0, 2)]
+    assert items[1].itemControl.code == "radio"
+
+def test_iter_ndjson_filters_on_resource_type():
+    resources = [entry["resource"] for entry in make_bundle()["entry"]]
+    fp = io.BytesIO(b"\n".join(json.dumps(resource).encode() for resource in resources) + b"\n\n")
+
+    items = list(iter_ndjson(fp, QuestionnaireItem, resource_type="QuestionnaireItem"))
+
+    assert [item.linkId for item in items] == ["q1", "q3"]
+
+class CountingReader(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+def test_malformed_entry_fails_without_reading_the_rest():
+    entries = b", ".join(json.dumps({"resource": make_item(f"q{i}")}).encode() for i in range(2000))
+    fp = CountingReader(b'{"resourceType": "Bundle", "entry": [{"resource": {"linkId": nope}}, ' + entries + b"]}")
+
+    with pytest.raises(ValueError, match="Expecting value"):
+        list(BundleReader(fp, chunk_size=1024).iter_entries())
+    assert fp.bytes_read <= 1024 < len(fp.getvalue()) // 100
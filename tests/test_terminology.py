@@ -0,0 +1,135 @@
+from typing import Annotated, List
+
+import pytest
+from pydantic import ValidationError
+
+from pydantic_fhir_extensions.base import Coding
+from pydantic_fhir_extensions.element import BaseElement
+from pydantic_fhir_extensions.extensions.item_control import ItemControlCodeableConcept
+from pydantic_fhir_extensions.questionnaire import QuestionnaireItem
+from pydantic_fhir_extensions.terminology import Binding, Terminology
+from tests.helpers import make_item
+
+SYSTEM = "urn:test:codes"
+
+
+def make_code_system(count: int, version: str | None = None):
+    return {
+        "resourceType": "CodeSystem",
+        "url": SYSTEM,
+        "version": version,
+        "concept": [{"code": f"c{i}", "display": f"Code {i}", "concept": [{"code": f"c{i}.child"}]} for i in range(count)],
+    }
+
+def make_value_set(url: str, *include, exclude=()):
+    return {"resourceType": "ValueSet", "url": url, "compose": {"include": list(include), "exclude": list(exclude)}}
+
+
+class Observation(BaseElement):
+    code: Annotated[Coding, Binding("urn:vs:small")]
+    category: Annotated[List[Coding], Binding("urn:vs:small")] = []
+
+
+def make_terminology():
+    terminology = Terminology()
+    terminology.add({"resourceType": "Bundle", "entry": [
+        {"resource": make_value_set("urn:vs:small", {"system": SYSTEM, "concept": [{"code": "c1"}, {"code": "c2"}]})},
+        {"resource": make_code_system(20_000)},
+    ]})
+    return terminology
+
+def test_value_sets_are_expanded_to_hash_indexes():
+    terminology = make_terminology()
+    terminology.add(make_value_set("urn:vs:all", {"system": SYSTEM}, exclude=[{"system": SYSTEM, "concept": [{"code": "c5"}]}]))
+    terminology.add(make_value_set("urn:vs:both", {"system": SYSTEM, "valueSet": ["urn:vs:small"]}, {"valueSet": ["urn:vs:all", "urn:vs:small"]}))
+
+    everything = terminology.get_value_set("urn:vs:all")
+    assert len(everything) == 40_000 - 1
+    assert everything.contains(SYSTEM, "c19999.child") and not everything.contains(SYSTEM, "c5")
+    assert not everything.contains("urn:other", "c1")
+    assert terminology.get_code_system(SYSTEM).get_display("c3") == "Code 3"
+    assert sorted(code for _, code, _ in terminology.get_value_set("urn:vs:both").codes) == ["c1", "c2"]
+    assert terminology.validate_coding("urn:vs:small", Coding(system=SYSTEM, code="c2"))
+    with pytest.raises(KeyError, match="not loaded"):
+        terminology.validate_coding("urn:vs:missing", Coding(system=SYSTEM, code="c2"))
+
+def test_versioned_codes():
+    terminology = Terminology()
+    terminology.add(make_code_system(3, version="1"))
+    terminology.add(make_code_system(5, version="2"))
+    terminology.add(make_value_set("urn:vs:v1", {"system": SYSTEM, "version": "1"}))
+
+    value_set = terminology.get_value_set("urn:vs:v1")
+    assert value_set.contains(SYSTEM, "c2", "1") and value_set.contains(SYSTEM, "c2")
+    assert not value_set.contains(SYSTEM, "c2", "2") and not value_set.contains(SYSTEM, "c4")
+    assert len(terminology.get_code_system(SYSTEM)) == 10 and len(terminology.get_code_system(SYSTEM, "1")) == 6
+
+def test_expansions_follow_replaced_code_systems_and_value_sets():
+    terminology = Terminology()
+    terminology.add(make_code_system(3))
+    terminology.add(make_value_set("urn:vs:all", {"system": SYSTEM}))
+    terminology.add(make_value_set("urn:vs:nested", {"valueSet": ["urn:vs:all"]}))
+    terminology.add(make_value_set("urn:vs:listed", {"system": SYSTEM, "concept": [{"code": "c4"}]}))
+    assert not terminology.get_value_set("urn:vs:nested").contains(SYSTEM, "c4")
+    listed = terminology.get_value_set("urn:vs:listed")
+
+    terminology.add(make_code_system(5))
+
+    assert terminology.get_value_set("urn:vs:all").contains(SYSTEM, "c4")
+    assert terminology.get_value_set("urn:vs:nested").contains(SYSTEM, "c4")
+    # listed codes do not depend on the CodeSystem
+    assert terminology.get_value_set("urn:vs:listed") is listed
+
+    terminology.add(make_value_set("urn:vs:all", {"system": SYSTEM}, exclude=[{"system": SYSTEM, "concept": [{"code": "c4"}]}]))
+
+    assert not terminology.get_value_set("urn:vs:nested").contains(SYSTEM, "c4")
+    assert terminology.get_value_set("urn:vs:nested").contains(SYSTEM, "c3")
+
+def test_unsupported_and_circular_value_sets_fail():
+    terminology = Terminology()
+    terminology.add(make_value_set("urn:vs:filter", {"system": SYSTEM, "filter": [{"property": "concept", "op": "is-a", "value": "c1"}]}))
+    terminology.add(make_value_set("urn:vs:a", {"valueSet": ["urn:vs:b"]}))
+    terminology.add(make_value_set("urn:vs:b", {"valueSet": ["urn:vs:a"]}))
+
+    with pytest.raises(ValueError, match="filters"):
+        terminology.get_value_set("urn:vs:filter")
+    with pytest.raises(ValueError, match="includes itself"):
+        terminology.get_value_set("urn:vs:a")
+    with pytest.raises(ValueError, match="Expected a CodeSystem, ValueSet or Bundle"):
+        terminology.add({"resourceType": "Patient"})
+
+def test_snapshot_round_trip(tmp_path):
+    terminology = make_terminology()
+    terminology.add(make_value_set("urn:vs:all", {"system": SYSTEM}))
+    path = str(tmp_path / "terminology.pickle")
+    terminology.save_snapshot(path)
+
+    loaded = Terminology.load_snapshot(path)
+
+    assert loaded.get_value_set("urn:vs:small") == terminology.get_value_set("urn:vs:small")
+    assert loaded.get_code_system(SYSTEM).get_display("c7") == "Code 7"
+    # the definitions are kept to expand again after a CodeSystem is replaced
+    loaded.add(make_code_system(3))
+    assert len(loaded.get_value_set("urn:vs:all")) == 6
+
+def test_binding_validates_the_field():
+    context = {"terminology": make_terminology()}
+
+    observation = Observation.model_validate({"code": {"system": SYSTEM, "code": "c1"}, "category": [{"system": SYSTEM, "code": "c2"}]}, context=context)
+    assert observation.code.code == "c1"
+    with pytest.raises(ValidationError, match=f"Coding `{SYSTEM}\\|c3` is not in ValueSet `urn:vs:small`"):
+        Observation.model_validate({"code": {"system": SYSTEM, "code": "c3"}}, context=context)
+    with pytest.raises(ValidationError, match="is not in ValueSet"):
+        Observation.model_validate({"code": {"system": SYSTEM, "code": "c1"}, "category": [{"system": SYSTEM, "code": "c4"}]}, context=context)
+    # without a terminology in the context, only the default one is searched
+    with pytest.raises(ValidationError, match="ValueSet `urn:vs:small` is not loaded"):
+        Observation.model_validate({"code": {"system": SYSTEM, "code": "c1"}})
+
+def test_item_control_is_bound_to_its_value_set():
+    assert QuestionnaireItem.model_validate(make_item("q", "dropdown")).itemControl.code == "dropdown"
+
+    with pytest.raises(ValidationError, match="no coding in ValueSet `http://tiro.health/fhir/ValueSet/tiro-questionnaire-item-control`"):
+        QuestionnaireItem.model_validate(make_item("q", "slider"))
+    # the concept keeps the binding on its own
+    with pytest.raises(ValidationError, match="no coding in ValueSet"):
+        ItemControlCodeableConcept.model_validate({"text": "x", "coding": [{"system": "other", "code": "y"}]})